@@ -0,0 +1,148 @@
+"""
+Compares chunking with the sentence splitter alone and with the splitter
+registry (``utils/splitters.py``).
+
+Source files (by default this repository's own ``.py`` and ``.md`` files) are
+parsed once with the app's parser, then chunked:
+
+- ``sentence``: one ``SentenceSplitter`` for every document, as before the registry;
+- ``registry``: the splitter registered for each file type, in this process;
+- ``registry-parallel``: the same, one task per file on the parsing pool.
+
+For each run it reports the time, the number of chunks and their token sizes,
+and two boundary checks: the share of Python definitions that fit in a chunk
+and come out of it whole, and the share of Markdown chunks that start at a
+heading.
+
+    python -m benchmarks.chunking
+    python -m benchmarks.chunking --path ~/src/llama_index --chunk-size 512 --workers 4
+
+No API calls are made.
+"""
+
+import argparse
+import ast
+import os
+import sys
+import time
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+SKIPPED_DIRS = {".git", "__pycache__", "node_modules", ".venv", "venv", "chroma_db", "data"}
+
+# Definitions that use at most this share of chunk_size should come out whole
+# (the rest of the budget goes to the metadata embedded with every chunk)
+FITS_SHARE = 0.8
+
+
+def find_files(root: str, extensions: List[str]) -> List[tuple]:
+    files = []
+    for directory, dirs, names in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIPPED_DIRS)
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in extensions:
+                path = os.path.join(directory, name)
+                files.append((os.path.relpath(path, root), path))
+    return files
+
+
+def definition_texts(source: str) -> List[str]:
+    """Top-level functions and classes of a Python file, with their decorators."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+    lines = source.splitlines(keepends=True)
+    texts = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            first = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list]) - 1
+            texts.append("".join(lines[first : node.end_lineno]).strip())
+    return texts
+
+
+def boundary_checks(documents, nodes, chunk_size: int) -> Dict[str, float]:
+    from llama_index.core.utils import get_tokenizer
+
+    from utils.splitters import splitter_name
+
+    tokenizer = get_tokenizer()
+    chunks_by_file: Dict[str, List[str]] = {}
+    for node in nodes:
+        chunks_by_file.setdefault(node.metadata["file_name"], []).append(node.get_content())
+
+    fitting = whole = 0
+    for document in documents:
+        if splitter_name(document.metadata["file_name"]) != "python":
+            continue
+        chunks = chunks_by_file.get(document.metadata["file_name"], [])
+        for text in definition_texts(document.text):
+            if len(tokenizer(text)) <= chunk_size * FITS_SHARE:
+                fitting += 1
+                whole += any(text in chunk for chunk in chunks)
+
+    markdown = [chunk for name, chunks in chunks_by_file.items() if splitter_name(name) == "markdown" for chunk in chunks]
+    at_heading = sum(chunk.lstrip().startswith("#") for chunk in markdown)
+    return {
+        "definitions_whole": round(whole / fitting, 3) if fitting else None,
+        "markdown_at_heading": round(at_heading / len(markdown), 3) if markdown else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=REPO_ROOT, help="Directory of files to chunk")
+    parser.add_argument("--extensions", nargs="+", default=[".py", ".md"])
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None, help="Parsing pool size (default: the app's)")
+    args = parser.parse_args()
+
+    from llama_index.core.node_parser import SentenceSplitter
+
+    import utils.parsing as parsing
+    from utils.parsing import DEFAULT_PARSE_WORKERS, parse_files, split_in_parallel
+    from utils.splitters import chunk_token_counts, split_documents, summarize_chunk_sizes
+
+    workers = args.workers or DEFAULT_PARSE_WORKERS
+    files = find_files(os.path.expanduser(args.path), args.extensions)
+    documents, _, errors = parse_files(files, workers=workers)
+    print(f"{len(files)} files, {len(documents)} documents, {len(errors)} parse errors, {workers} workers\n")
+
+    size, overlap = args.chunk_size, args.chunk_overlap
+    # Measure the pool even for inputs that split_in_parallel would chunk in-process
+    parsing.PARALLEL_SPLIT_CHARS = 0
+    runs = {
+        "sentence": lambda: SentenceSplitter(chunk_size=size, chunk_overlap=overlap).get_nodes_from_documents(documents),
+        "registry": lambda: split_documents(documents, size, overlap),
+        "registry-parallel": lambda: split_in_parallel(documents, size, overlap, workers),
+    }
+    # Warm up tokenizers and the pool's imports, so no run pays for them
+    split_in_parallel(documents[: workers * 2], size, overlap, workers)
+    split_documents(documents[:1], size, overlap)
+
+    print(f"{'run':<18} {'seconds':>8} {'chunks':>7} {'defs whole':>11} {'md at #':>8}  tokens per splitter (p50/p90/max)")
+    for name, run in runs.items():
+        start = time.perf_counter()
+        nodes = run()
+        seconds = time.perf_counter() - start
+        checks = boundary_checks(documents, nodes, size)
+        counts = chunk_token_counts(nodes)
+        if name == "sentence":
+            # Every chunk came from the sentence splitter, whatever the registry would pick
+            counts = {"sentence": [count for sizes in counts.values() for count in sizes]}
+        sizes = summarize_chunk_sizes(counts)
+        distribution = ", ".join(f"{splitter} {s['p50']}/{s['p90']}/{s['max']}" for splitter, s in sizes.items())
+        print(
+            f"{name:<18} {seconds:>8.2f} {len(nodes):>7} {str(checks['definitions_whole']):>11} "
+            f"{str(checks['markdown_at_heading']):>8}  {distribution}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Deterministic local stand-in for the Mistral API, for load tests and benchmarks.
+
+Run it and point the app at it:
+
+    python -m benchmarks.fake_mistral --port 8765 --latency 0.2 --error-rate 0.05
+    MISTRAL_ENDPOINT=http://127.0.0.1:8765 MISTRAL_API_KEY=fake streamlit run main.py
+
+Embeddings are hashed bags of words: the same text always gets the same
+vector, and texts sharing words get similar vectors, so retrieval quality can
+be measured against it. Chat completions (streamed or not) answer with the
+first words of the last message, one word per ``--token-latency`` seconds.
+``--error-rate`` injects 429 responses to exercise the back-off logic in
+``utils/embedding_pipeline.py``.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 1024
+ANSWER_WORDS = 40
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list:
+    """Unit-length hashed bag-of-words vector (the hashing trick with a sign bit)."""
+    vector = [0.0] * dim
+    for word in _WORD_PATTERN.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "big") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if not norm:
+        vector[0], norm = 1.0, 1.0  # Text without words still needs a valid unit vector
+    return [v / norm for v in vector]
+
+
+def fake_answer(messages: list, words: int = ANSWER_WORDS) -> list:
+    """Deterministic answer: the first words of the last message, as streamable tokens."""
+    content = messages[-1].get("content", "") if messages else ""
+    if isinstance(content, list):  # Content chunks, e.g. [{"type": "text", "text": ...}]
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return [word + " " for word in content.split()[:words]] or ["OK"]
+
+
+class FakeMistralHandler(BaseHTTPRequestHandler):
+    # Configured on the server instance, see make_server()
+    server_version = "FakeMistral/1.0"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        config = self.server.config
+        request = self._read_json()
+        with self.server.lock:
+            self.server.requests += 1
+
+        if config["error_rate"] and random.random() < config["error_rate"]:
+            self._send_json(429, {"message": "Requests rate limit exceeded"}, {"Retry-After": "0.05"})
+            return
+
+        path = self.path.rstrip("/")
+        if path.endswith("/embeddings"):
+            self.handle_embeddings(request)
+        elif path.endswith("/chat/completions"):
+            self.handle_chat(request)
+        else:
+            self._send_json(404, {"message": f"Unknown endpoint {self.path}"})
+
+    def handle_embeddings(self, request: dict):
+        config = self.server.config
+        inputs = request.get("input", request.get("inputs", []))
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        tokens = sum(len(text.split()) for text in inputs)
+        time.sleep(config["latency"] + config["latency_per_token"] * tokens)
+        self._send_json(
+            200,
+            {
+                "id": uuid.uuid4().hex,
+                "object": "list",
+                "model": request.get("model", "mistral-embed"),
+                "usage": {"prompt_tokens": tokens, "completion_tokens": 0, "total_tokens": tokens},
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(text, config["dim"])}
+                    for i, text in enumerate(inputs)
+                ],
+            },
+        )
+
+
+    def handle_chat(self, request: dict):
+        config = self.server.config
+        tokens = fake_answer(request.get("messages", []), config["answer_words"])
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+        completion_id, created, model = uuid.uuid4().hex, int(time.time()), request.get("model", "mistral-small-latest")
+        # Time to first token
+        time.sleep(config["latency"] + config["latency_per_token"] * prompt_tokens)
+
+        if not request.get("stream"):
+            time.sleep(config["token_latency"] * len(tokens))
+            self._send_json(
+                200,
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": len(tokens),
+                        "total_tokens": prompt_tokens + len(tokens),
+                    },
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(config["token_latency"])
+            last = i == len(tokens) - 1
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": token},
+                        "finish_reason": "stop" if last else None,
+                    }
+                ],
+            }
+            if last:
+                chunk["usage"] = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.0,
+    latency_per_token: float = 0.0,
+    error_rate: float = 0.0,
+    dim: int = EMBEDDING_DIM,
+    token_latency: float = 0.0,
+    answer_words: int = ANSWER_WORDS,
+) -> ThreadingHTTPServer:
+    """Builds (but does not start) a fake server; ``port=0`` picks a free port."""
+    server = ThreadingHTTPServer((host, port), FakeMistralHandler)
+    server.daemon_threads = True
+    server.config = {
+        "latency": latency,
+        "latency_per_token": latency_per_token,
+        "error_rate": error_rate,
+        "dim": dim,
+        "token_latency": token_latency,
+        "answer_words": answer_words,
+    }
+    server.lock = threading.Lock()
+    server.requests = 0
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Starts a fake server on a background thread. Returns (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.1, help="Fixed seconds added to every response")
+    parser.add_argument("--latency-per-token", type=float, default=0.0, help="Extra seconds per input (prompt) token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed answer tokens")
+    parser.add_argument("--answer-words", type=int, default=ANSWER_WORDS, help="Length of chat answers in words")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        args.latency,
+        args.latency_per_token,
+        args.error_rate,
+        args.dim,
+        args.token_latency,
+        args.answer_words,
+    )
+    print(f"Fake Mistral API listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Latency/recall trade-off of Chroma's HNSW parameters.
+
+Fills a Chroma collection with the chunks of a versioned corpus
+(``benchmarks/corpus/<version>``) plus clustered distractor vectors, then for
+every combination of ``M`` and ``ef_construction`` rebuilds it with
+``utils.hnsw.rebuild_collection`` (the same path as the Settings tab's rebuild)
+and, for every ``ef_search``, reports:
+
+- the rebuild time;
+- query latency p50/p95;
+- recall@k against an exact (brute-force) search of the same vectors.
+
+Chroma only reads ``ef_search`` when a process first loads the collection, so
+each ``ef_search`` is measured in a fresh interpreter, as after a restart.
+
+    python -m benchmarks.hnsw
+    python -m benchmarks.hnsw --m 8 16 32 --ef-construction 100 200 --ef-search 10 50 100 200
+    python -m benchmarks.hnsw --distractors 50000 --space cosine
+
+The queries are the corpus questions plus perturbed copies of stored vectors,
+embedded with the fake server's hashed bag-of-words model, so no API key is
+needed. Everything is written to a throwaway working directory.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_mistral import fake_embedding  # noqa: E402
+from benchmarks.retrieval import latency_summary, load_corpus  # noqa: E402
+
+BENCHMARK_COLLECTION = "benchmark_collection"
+
+# Distractors are drawn around this many random centres, like topics in a real collection
+DISTRACTOR_CLUSTERS = 200
+
+###################################
+#
+# Vectors
+#
+###################################
+
+
+def corpus_vectors(args):
+    """Chunk texts and embeddings of the corpus, and the embeddings of its questions."""
+    import utils.llama_index as llama_index
+
+    files, queries = load_corpus(args.corpus)
+    documents = llama_index.load_data(files, workers=1)
+    nodes = llama_index.chunk_data(documents, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    texts = [node.get_content() for node in nodes]
+    vectors = np.asarray([fake_embedding(node.get_content(metadata_mode="embed")) for node in nodes], dtype=np.float32)
+    questions = np.asarray([fake_embedding(item["query"]) for item in queries], dtype=np.float32)
+    return texts, vectors, questions
+
+
+def clustered_vectors(count: int, dim: int, rng) -> np.ndarray:
+    centres = rng.standard_normal((DISTRACTOR_CLUSTERS, dim), dtype=np.float32)
+    vectors = centres[rng.integers(0, DISTRACTOR_CLUSTERS, count)] + 0.5 * rng.standard_normal((count, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, top_k: int) -> List[set]:
+    """Brute-force neighbours; vectors are unit length, so l2, cosine and ip rank alike."""
+    scores = queries @ vectors.T
+    return [set(np.argsort(-row)[:top_k].tolist()) for row in scores]
+
+
+###################################
+#
+# Query Worker (runs in a fresh interpreter)
+#
+###################################
+
+
+def measure_queries(args) -> Dict:
+    import chromadb
+
+    queries = np.load("queries.npy")
+    with open("exact.json", "r", encoding="utf-8") as f:
+        exact = [set(neighbours) for neighbours in json.load(f)]
+    collection = chromadb.PersistentClient(path="chroma_db").get_collection(BENCHMARK_COLLECTION)
+
+    times, found = [], 0
+    for round_number in range(args.rounds):
+        for query, reference in zip(queries, exact):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query], n_results=args.top_k, include=[])
+            times.append(time.perf_counter() - start)
+            if round_number == 0:
+                found += len({int(node_id) for node_id in result["ids"][0]} & reference)
+    return {**latency_summary("query", times), f"recall@{args.top_k}": round(found / (len(queries) * args.top_k), 4)}
+
+
+def measure_in_subprocess(workdir: str, args) -> Dict:
+    command = [
+        sys.executable, "-m", "benchmarks.hnsw", "--worker",
+        "--top-k", str(args.top_k), "--rounds", str(args.rounds),
+    ]
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, timeout=3600)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"Query worker failed:\n{completed.stdout[-2000:]}\n{completed.stderr[-4000:]}")
+    return json.loads(lines[-1][len("RESULT "):])
+
+
+###################################
+#
+# Report
+#
+###################################
+
+
+def run(args) -> Dict:
+    import chromadb
+
+    import utils.hnsw as hnsw
+
+    workdir = tempfile.mkdtemp(prefix="rag-hnsw-")
+    os.chdir(workdir)
+    try:
+        rng = np.random.default_rng(0)
+        texts, vectors, questions = corpus_vectors(args)
+        dim = vectors.shape[1]
+        vectors = np.vstack([vectors, clustered_vectors(args.distractors, dim, rng)])
+        texts += [f"distractor {i}" for i in range(args.distractors)]
+        # Near-duplicates of stored vectors, so every query has close neighbours to find
+        picks = rng.integers(0, len(vectors), args.queries)
+        perturbed = vectors[picks] + 0.05 * rng.standard_normal((args.queries, dim), dtype=np.float32)
+        queries = np.vstack([questions, perturbed / np.linalg.norm(perturbed, axis=1, keepdims=True)])
+        np.save(os.path.join(workdir, "queries.npy"), queries)
+        with open(os.path.join(workdir, "exact.json"), "w", encoding="utf-8") as f:
+            json.dump([sorted(neighbours) for neighbours in exact_top_k(vectors, queries, args.top_k)], f)
+        print(f"Corpus {args.corpus}: {len(vectors)} vectors (dim {dim}), {len(queries)} queries")
+
+        client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma_db"))
+        collection = client.create_collection(
+            BENCHMARK_COLLECTION, configuration={"hnsw": {**hnsw.DEFAULT_HNSW, "space": args.space}}, embedding_function=None
+        )
+        ids = [str(i) for i in range(len(vectors))]
+        for start in range(0, len(vectors), 5000):
+            collection.add(
+                ids=ids[start : start + 5000], embeddings=vectors[start : start + 5000], documents=texts[start : start + 5000]
+            )
+
+        results = []
+        for max_neighbors in args.m:
+            for ef_construction in args.ef_construction:
+                config = {"space": args.space, "max_neighbors": max_neighbors, "ef_construction": ef_construction, "ef_search": args.ef_search[0]}
+                start = time.perf_counter()
+                collection = hnsw.rebuild_collection(client, collection, config)
+                rebuild_seconds = time.perf_counter() - start
+                for ef_search in args.ef_search:
+                    hnsw.set_ef_search(collection, ef_search)
+                    measured = measure_in_subprocess(workdir, args)
+                    results.append(
+                        {
+                            "max_neighbors": max_neighbors,
+                            "ef_construction": ef_construction,
+                            "ef_search": ef_search,
+                            "rebuild_seconds": round(rebuild_seconds, 2),
+                            **measured,
+                        }
+                    )
+                    print(json.dumps(results[-1]))
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "corpus": args.corpus,
+        "config": {"vectors": len(vectors), "queries": len(queries), "top_k": args.top_k, "space": args.space},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="v1", help="Corpus version under benchmarks/corpus")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--distractors", type=int, default=20000, help="Clustered random vectors added to the collection")
+    parser.add_argument("--queries", type=int, default=200, help="Perturbed stored vectors used as extra queries")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--space", default="l2", choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", nargs="+", type=int, default=[8, 16, 32], help="max_neighbors values")
+    parser.add_argument("--ef-construction", nargs="+", type=int, default=[100, 200])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[10, 50, 100, 200])
+    parser.add_argument("--rounds", type=int, default=3, help="Times every query is asked per setting")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print("RESULT " + json.dumps(measure_queries(args)))
+        return
+
+    output = os.path.abspath(args.output) if args.output else None
+    os.environ.setdefault("LOCAL_RAG_LOG_LEVEL", "WARNING")
+    result = run(args)
+
+    k = args.top_k
+    print(f"\n{'M':>4} {'ef_con':>7} {'ef_search':>10} {'rebuild s':>10} {'p50 ms':>8} {'p95 ms':>8} {f'recall@{k}':>10}")
+    for row in result["results"]:
+        print(
+            f"{row['max_neighbors']:>4} {row['ef_construction']:>7} {row['ef_search']:>10} {row['rebuild_seconds']:>10}"
+            f" {row['query_p50_ms']:>8} {row['query_p95_ms']:>8} {row[f'recall@{k}']:>10}"
+        )
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
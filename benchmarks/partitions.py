@@ -0,0 +1,187 @@
+"""
+Compares retrieval limited to one source in a shared collection (metadata
+pre-filter) and in a partitioned layout (the source's own collection).
+
+A small source (the chunks of a versioned corpus, ``benchmarks/corpus/<version>``,
+as ``local`` uploads) and a large one (random distractor chunks of a
+``github:example/monorepo`` source) are stored twice through the app's own
+``index_data()`` and registry:
+
+- ``shared``: both sources in the default collection;
+- ``partitioned``: the large source in a partition of its own, as with
+  ``LOCAL_RAG_PARTITION_MIN_FILES``.
+
+Every corpus question is then retrieved through ``create_query_engine`` with no
+filter, limited to the small source and limited to the large one, reporting
+p50/p95 retrieval latency and, for the small source, recall@k.
+
+    python -m benchmarks.partitions
+    python -m benchmarks.partitions --distractors 100000 --modes vector
+
+Embeddings come from the fake server's hashed bag-of-words model, so no API
+key is needed. Everything is written to a throwaway working directory.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+LAYOUTS = ["shared", "partitioned"]
+LARGE_SOURCE = "github:example/monorepo"
+
+# Distractor chunks per fake file of the large source, and words per chunk
+CHUNKS_PER_FILE = 50
+WORDS_PER_CHUNK = 60
+ADD_BATCH = 2000
+
+
+def build(layout: str, args) -> None:
+    """Fills the stores of one layout in the current directory."""
+    import numpy as np
+    from llama_index.core.schema import TextNode
+
+    import utils.llama_index as llama_index
+    from benchmarks.fake_mistral import fake_embedding
+    from benchmarks.retrieval import load_corpus
+
+    registry = llama_index.get_registry()
+    files, _ = load_corpus(args.corpus)
+    plan = llama_index.plan_sync(registry, files, "local", args.chunk_size, args.chunk_overlap)
+    documents = llama_index.load_data(files, workers=1)
+    nodes = llama_index.chunk_data(documents, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    nodes = llama_index.diff_nodes(registry, nodes, plan, "local")
+    for node in nodes:
+        node.embedding = fake_embedding(node.get_content(metadata_mode="embed"))
+    vector_store = llama_index.index_data()
+    vector_store.add(nodes)
+    llama_index.get_lexical_index(vector_store).add(nodes)
+    llama_index.apply_sync(vector_store, registry, plan, "local")
+
+    partition = None
+    if layout == "partitioned":
+        partition = llama_index.hash_text(LARGE_SOURCE)[:16]
+        registry.set_partition(LARGE_SOURCE, partition)
+    large_store = llama_index.index_data(partition)
+    lexical_index = llama_index.get_lexical_index(large_store, partition)
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    dimensions = len(nodes[0].embedding)
+    for offset in range(0, args.distractors, ADD_BATCH):
+        count = min(ADD_BATCH, args.distractors - offset)
+        vectors = rng.standard_normal((count, dimensions), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        batch = []
+        for i, vector in enumerate(vectors):
+            file_name = f"src/module_{(offset + i) // CHUNKS_PER_FILE}.py"
+            batch.append(
+                TextNode(
+                    id_=f"distractor-{offset + i}",
+                    text=" ".join(rng.choice(vocabulary, WORDS_PER_CHUNK)),
+                    metadata={
+                        "file_name": file_name,
+                        "doc_key": f"{LARGE_SOURCE}:{file_name}",
+                        "source": LARGE_SOURCE,
+                        "file_type": "py",
+                        "ingested_at": time.time(),
+                    },
+                    embedding=vector.tolist(),
+                )
+            )
+        large_store.add(batch)
+        lexical_index.add(batch)
+    lexical_index.save()
+    registry.save()
+
+
+def measure(args) -> Dict:
+    """Retrieves every corpus question with each filter, in every retrieval mode."""
+    from llama_index.core.schema import QueryBundle
+
+    import utils.llama_index as llama_index
+    from benchmarks.fake_mistral import fake_embedding
+    from benchmarks.retrieval import latency_summary, load_corpus
+
+    _, queries = load_corpus(args.corpus)
+    embeddings = [fake_embedding(item["query"]) for item in queries]
+    index = llama_index.get_index()
+    scopes = {"all": None, "small source": {"sources": ["local"]}, "large source": {"sources": [LARGE_SOURCE]}}
+    result = {}
+    for mode in args.modes:
+        for scope, filters in scopes.items():
+            query_engine = llama_index.create_query_engine(index, mode, args.top_k, args.top_k, "none", filters)
+            times, hits = [], 0
+            for round_number in range(args.rounds):
+                for item, embedding in zip(queries, embeddings):
+                    start = time.perf_counter()
+                    found = query_engine.retriever.retrieve(QueryBundle(item["query"], embedding=embedding))
+                    times.append(time.perf_counter() - start)
+                    if round_number == 0:
+                        hits += bool({result.node.metadata.get("file_name") for result in found} & set(item["expected"]))
+            summary = latency_summary("retrieve", times)
+            row = {"p50_ms": summary["retrieve_p50_ms"], "p95_ms": summary["retrieve_p95_ms"]}
+            if scope != "large source":
+                row[f"recall@{args.top_k}"] = round(hits / len(queries), 3)
+            result[(mode, scope)] = row
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="v1", help="Corpus version under benchmarks/corpus")
+    parser.add_argument("--distractors", type=int, default=20000, help="Chunks of the large source")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"])
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=3, help="Times every question is asked")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOCAL_RAG_LOG_LEVEL", "WARNING")
+    # No request is made: every query comes with its embedding
+    os.environ.setdefault("MISTRAL_API_KEY", "benchmark")
+    import streamlit as st
+    from chromadb.api.client import SharedSystemClient
+
+    from utils.helpers import silence_bare_mode_warnings
+
+    silence_bare_mode_warnings()
+    workdir = tempfile.mkdtemp(prefix="local-rag-partitions-")
+    results = {}
+    try:
+        for layout in LAYOUTS:
+            os.makedirs(os.path.join(workdir, layout))
+            os.chdir(os.path.join(workdir, layout))
+            # Stores, indexes and engines are cached per process; start each layout afresh
+            st.cache_resource.clear()
+            # Chroma shares one client per path, and "./chroma_db" is relative
+            SharedSystemClient.clear_system_cache()
+            start = time.perf_counter()
+            build(layout, args)
+            print(f"{layout}: built in {time.perf_counter() - start:.1f}s")
+            results[layout] = measure(args)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'mode':<8} {'scope':<14}" + "".join(f"{layout:>34}" for layout in LAYOUTS))
+    for mode, scope in results[LAYOUTS[0]]:
+        cells = []
+        for layout in LAYOUTS:
+            row = results[layout][(mode, scope)]
+            recall = next((f" r={value}" for key, value in row.items() if key.startswith("recall")), "")
+            cells.append(f"{row['p50_ms']:.1f} / {row['p95_ms']:.1f} ms{recall}")
+        print(f"{mode:<8} {scope:<14}" + "".join(f"{cell:>34}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
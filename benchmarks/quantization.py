@@ -0,0 +1,206 @@
+"""
+Recall-vs-memory report for the quantized vector index.
+
+Chunks a versioned corpus (``benchmarks/corpus/<version>``) with the app's
+``chunk_data``, embeds the chunks and questions, and builds a
+``utils.quantized_index.QuantizedIndex`` per compression. For every
+compression and re-score factor it reports:
+
+- the memory scanned per search (the compressed matrix) and the disk used;
+- p50/p95 search latency;
+- recall@k against exact float32 search (the same ids, in any order);
+- corpus recall@k (a chunk of an expected document among the top k).
+
+    python -m benchmarks.quantization
+    python -m benchmarks.quantization --distractors 200000 --rescore-factors 1 2 4 8
+    python -m benchmarks.quantization --mistral          # real embeddings, needs MISTRAL_API_KEY
+
+By default the embeddings come from the fake server's hashed bag-of-words
+model, so no API key is needed. ``--distractors`` adds random unit vectors, to
+measure latency and memory at a realistic collection size; they never count as
+hits. Everything is written to a throwaway working directory.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_mistral import fake_embedding  # noqa: E402
+from benchmarks.retrieval import latency_summary, load_corpus  # noqa: E402
+
+###################################
+#
+# Corpus Embeddings
+#
+###################################
+
+
+def embed_corpus(args):
+    """Returns the chunk ids, their source files, the chunk and question embeddings, and the questions."""
+    import utils.llama_index as llama_index
+
+    files, queries = load_corpus(args.corpus)
+    documents = llama_index.load_data(files, workers=1)
+    nodes = llama_index.chunk_data(documents, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    texts = [node.get_content(metadata_mode="embed") for node in nodes]
+    questions = [item["query"] for item in queries]
+
+    if args.mistral:
+        import utils.mistral as mistral
+        from llama_index.core import Settings
+
+        mistral.configure_global_settings()
+        chunk_vectors = Settings.embed_model.get_text_embedding_batch(texts)
+        query_vectors = [Settings.embed_model.get_query_embedding(q) for q in questions]
+    else:
+        chunk_vectors = [fake_embedding(text) for text in texts]
+        query_vectors = [fake_embedding(q) for q in questions]
+
+    ids = [node.node_id for node in nodes]
+    sources = [node.metadata.get("file_name", "") for node in nodes]
+    return ids, sources, np.asarray(chunk_vectors, dtype=np.float32), np.asarray(query_vectors, dtype=np.float32), queries
+
+
+def distractor_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def directory_mb(path: str) -> float:
+    return round(sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1024**2, 2)
+
+
+###################################
+#
+# Report
+#
+###################################
+
+
+def run(args) -> Dict:
+    from utils.quantized_index import COMPRESSIONS, QuantizedIndex
+
+    workdir = tempfile.mkdtemp(prefix="rag-quantization-")
+    os.chdir(workdir)
+    try:
+        ids, sources, chunk_vectors, query_vectors, queries = embed_corpus(args)
+        dim = chunk_vectors.shape[1]
+        all_ids = ids + [f"distractor-{i}" for i in range(args.distractors)]
+        source_of = dict(zip(ids, sources))
+        print(f"Corpus {args.corpus}: {len(ids)} chunks + {args.distractors} distractors, {len(queries)} questions, dim {dim}")
+
+        # Exact float32 ranking, the reference for recall
+        exact_index = QuantizedIndex(os.path.join(workdir, "exact"), compression="none")
+        exact_index.add(ids, chunk_vectors)
+        for start in range(0, args.distractors, 50000):
+            count = min(50000, args.distractors - start)
+            exact_index.add(all_ids[len(ids) + start : len(ids) + start + count], distractor_vectors(count, dim, seed=start))
+        exact = [[node_id for node_id, _ in exact_index.search(q, args.top_k)] for q in query_vectors]
+
+        results: List[Dict] = []
+        for compression in args.compressions:
+            if compression not in COMPRESSIONS:
+                raise ValueError(f"Unknown compression '{compression}'")
+            path = os.path.join(workdir, compression)
+            # Copying the float32 file and re-opening re-quantizes it, as switching compression in the app does
+            shutil.copytree(exact_index.path, path)
+            factors = [1] if compression == "none" else args.rescore_factors
+            for factor in factors:
+                index = QuantizedIndex(path, compression=compression, rescore_factor=factor)
+                times, overlap, hits = [], 0, 0
+                for round_number in range(args.rounds):
+                    for q, item, reference in zip(query_vectors, queries, exact):
+                        start = time.perf_counter()
+                        found = [node_id for node_id, _ in index.search(q, args.top_k)]
+                        times.append(time.perf_counter() - start)
+                        if round_number == 0:
+                            overlap += len(set(found) & set(reference))
+                            hits += bool({source_of.get(node_id) for node_id in found} & set(item["expected"]))
+                stats = index.stats()
+                results.append(
+                    {
+                        "compression": compression,
+                        "rescore_factor": factor if compression != "none" else None,
+                        "bytes_per_vector": round(stats["search_mb"] * 1024**2 / max(1, stats["vectors"]), 1),
+                        "search_mb": stats["search_mb"],
+                        "disk_mb": directory_mb(path),
+                        **latency_summary("search", times),
+                        f"recall@{args.top_k}_vs_exact": round(overlap / (len(queries) * args.top_k), 4),
+                        f"corpus_recall@{args.top_k}": round(hits / len(queries), 4),
+                    }
+                )
+                print(json.dumps(results[-1]))
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "corpus": args.corpus,
+        "config": {
+            "chunk_size": args.chunk_size,
+            "chunk_overlap": args.chunk_overlap,
+            "top_k": args.top_k,
+            "distractors": args.distractors,
+            "embeddings": "mistral" if args.mistral else "fake",
+        },
+        "results": results,
+    }
+
+
+def print_table(result: Dict, top_k: int) -> None:
+    columns = [
+        ("compression", "compression"),
+        ("rescore", "rescore_factor"),
+        ("B/vector", "bytes_per_vector"),
+        ("search MB", "search_mb"),
+        ("disk MB", "disk_mb"),
+        ("p50 ms", "search_p50_ms"),
+        ("p95 ms", "search_p95_ms"),
+        (f"recall@{top_k} vs f32", f"recall@{top_k}_vs_exact"),
+        (f"corpus recall@{top_k}", f"corpus_recall@{top_k}"),
+    ]
+    print("\n" + "  ".join(f"{title:>{max(len(title), 8)}}" for title, _ in columns))
+    for row in result["results"]:
+        values = ["-" if row[key] is None else row[key] for _, key in columns]
+        print("  ".join(f"{value:>{max(len(title), 8)}}" for (title, _), value in zip(columns, values)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="v1", help="Corpus version under benchmarks/corpus")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--compressions", nargs="+", default=["none", "float16", "int8"])
+    parser.add_argument("--rescore-factors", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--distractors", type=int, default=20000, help="Random vectors added to the index")
+    parser.add_argument("--rounds", type=int, default=5, help="Times every question is searched")
+    parser.add_argument("--mistral", action="store_true", help="Embed with the Mistral API instead of the fake model")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    os.environ.setdefault("LOCAL_RAG_LOG_LEVEL", "WARNING")
+    result = run(args)
+    print_table(result, args.top_k)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
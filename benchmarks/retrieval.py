@@ -0,0 +1,337 @@
+"""
+End-to-end retrieval benchmark, run without the Streamlit UI.
+
+Ingests a versioned corpus (``benchmarks/corpus/<version>``) with the app's own
+``load_data`` -> ``chunk_data`` -> ``embed_data`` -> ``create_query_engine``
+code, against the fake Mistral server, then asks every corpus question in each
+retrieval mode. Reports ingestion throughput, peak memory, p50/p95/p99
+latencies (retrieval, time to first token, full answer) and recall@k, and
+compares them with the stored baseline for the corpus:
+
+    python -m benchmarks.retrieval                        # run and compare
+    python -m benchmarks.retrieval --save-baseline        # record a new baseline
+    python -m benchmarks.retrieval --copies 20 --latency 0.05 --token-latency 0.01
+    python -m benchmarks.retrieval --reranker llm --fetch-k 10  # retrieval includes reranking
+
+Everything is written to a throwaway working directory (deleted afterwards
+unless ``--keep-workdir``), so the app's own ``chroma_db`` and caches are
+never touched. Latency baselines are only
+comparable on the same machine with the same fake-server settings.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+CORPUS_DIR = os.path.join(BENCHMARK_DIR, "corpus")
+BASELINE_DIR = os.path.join(BENCHMARK_DIR, "baselines")
+# Settings of baselines recorded before the setting existed, e.g. no reranking
+RECORDED_BEFORE = {"reranker": "none"}
+
+# Relative change in a latency/throughput/memory metric tolerated before it counts as a regression
+DEFAULT_TOLERANCE = 0.15
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_mistral import start_in_thread  # noqa: E402
+
+###################################
+#
+# Corpus
+#
+###################################
+
+
+def load_corpus(version: str, copies: int = 1):
+    """
+    Returns the corpus as Streamlit ``UploadedFile`` objects plus its questions.
+
+    With ``copies > 1`` every document is repeated under a new name
+    (``name.copy2.md``, ...) to measure ingestion at a larger scale; a copy
+    counts as a hit for questions about the original.
+    """
+    from streamlit.proto.Common_pb2 import FileURLs
+    from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+    corpus_dir = os.path.join(CORPUS_DIR, version)
+    with open(os.path.join(corpus_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    documents_dir = os.path.join(corpus_dir, manifest["documents"])
+
+    files = []
+    for name in sorted(os.listdir(documents_dir)):
+        with open(os.path.join(documents_dir, name), "rb") as f:
+            data = f.read()
+        stem, extension = os.path.splitext(name)
+        for copy in range(1, copies + 1):
+            file_name = name if copy == 1 else f"{stem}.copy{copy}{extension}"
+            files.append(UploadedFile(UploadedFileRec(file_name, file_name, "text/plain", data), FileURLs()))
+
+    with open(os.path.join(corpus_dir, manifest["queries"]), "r", encoding="utf-8") as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+    return files, queries
+
+
+def original_name(file_name: str) -> str:
+    """Maps ``name.copyN.ext`` back to ``name.ext``."""
+    stem, extension = os.path.splitext(file_name)
+    base, _, copy = stem.rpartition(".copy")
+    return base + extension if base and copy.isdigit() else file_name
+
+
+###################################
+#
+# Measurements
+#
+###################################
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, min(len(ordered), round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def latency_summary(name: str, samples: List[float]) -> Dict[str, float]:
+    return {f"{name}_p{pct}_ms": round(percentile(samples, pct) * 1000, 2) for pct in (50, 95, 99)}
+
+
+def peak_rss_mb() -> float:
+    """Memory high-water mark of this process and its (parser) children, or 0 if unavailable."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    total = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(total / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+###################################
+#
+# Benchmark Run
+#
+###################################
+
+
+def run(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    # The app keeps its stores relative to the working directory (./chroma_db,
+    # ./.cache, ./data/uploads), so move before importing it
+    os.chdir(workdir)
+    server, url = start_in_thread(
+        latency=args.latency, latency_per_token=args.latency_per_token, token_latency=args.token_latency
+    )
+    os.environ["MISTRAL_ENDPOINT"] = url
+    os.environ["MISTRAL_API_KEY"] = "benchmark"
+
+    import logging
+
+    import utils.llama_index as llama_index
+    import utils.logs as logs
+    import utils.mistral as mistral
+    from llama_index.core import Settings
+    from llama_index.core.schema import QueryBundle
+    from utils.helpers import WARM_UP_MODULES, silence_bare_mode_warnings
+    from utils.retrievers import RETRIEVAL_MODES
+
+    silence_bare_mode_warnings()
+    if not args.verbose:
+        logs.log.setLevel(logging.WARNING)
+
+    mistral.configure_global_settings()
+    # The app defers these imports to a background warm-up; import them up front so
+    # the stage timings measure ingestion work, not one-off module loading
+    for name in WARM_UP_MODULES:
+        importlib.import_module(name)
+    files, queries = load_corpus(args.corpus, args.copies)
+    print(f"Corpus {args.corpus}: {len(files)} files, {len(queries)} questions; working in {workdir}")
+
+    metrics: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    documents = llama_index.load_data(files, workers=args.parse_workers)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    nodes = llama_index.chunk_data(documents, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    chunk_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = llama_index.embed_data(llama_index.index_data(), nodes)
+    embed_seconds = time.perf_counter() - start
+    if index is None:
+        raise RuntimeError("Embedding failed, see the log for details")
+
+    ingest_seconds = load_seconds + chunk_seconds + embed_seconds
+    metrics.update(
+        {
+            "ingest.nodes": len(nodes),
+            "ingest.load_seconds": round(load_seconds, 3),
+            "ingest.chunk_seconds": round(chunk_seconds, 3),
+            "ingest.embed_seconds": round(embed_seconds, 3),
+            "ingest.nodes_per_sec": round(len(nodes) / ingest_seconds, 1) if ingest_seconds else 0.0,
+        }
+    )
+
+    for mode in RETRIEVAL_MODES:
+        query_engine = llama_index.create_query_engine(index, mode, args.top_k, args.fetch_k, args.reranker)
+        retrieve_times, first_token_times, answer_times = [], [], []
+        hits = 0
+        for round_number in range(args.rounds):
+            # Otherwise every round after the first would get its query embeddings from cache
+            Settings.embed_model.cache.clear()
+            for item in queries:
+                start = time.perf_counter()
+                # The engine's retrieve() also applies the reranker, if any
+                results = query_engine.retrieve(QueryBundle(item["query"]))
+                retrieve_times.append(time.perf_counter() - start)
+                if round_number == 0:
+                    sources = {original_name(result.node.metadata.get("file_name", "")) for result in results}
+                    hits += bool(sources & set(item["expected"]))
+
+                start = time.perf_counter()
+                response = query_engine.query(item["query"])
+                first_token = None
+                for _ in response.response_gen:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                answer_times.append(time.perf_counter() - start)
+                first_token_times.append(first_token if first_token is not None else answer_times[-1])
+
+        metrics[f"{mode}.recall@{args.top_k}"] = round(hits / len(queries), 4)
+        for name, samples in (("retrieve", retrieve_times), ("first_token", first_token_times), ("answer", answer_times)):
+            metrics.update({f"{mode}.{key}": value for key, value in latency_summary(name, samples).items()})
+
+    metrics["memory.peak_rss_mb"] = peak_rss_mb()
+    server.shutdown()
+    os.chdir(REPO_ROOT)
+    if not args.keep_workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "corpus": args.corpus,
+        "config": {
+            "copies": args.copies,
+            "chunk_size": args.chunk_size,
+            "chunk_overlap": args.chunk_overlap,
+            "top_k": args.top_k,
+            "reranker": args.reranker,
+            "fetch_k": args.fetch_k,
+            "rounds": args.rounds,
+            "latency": args.latency,
+            "latency_per_token": args.latency_per_token,
+            "token_latency": args.token_latency,
+        },
+        "metrics": metrics,
+    }
+
+
+###################################
+#
+# Baseline Comparison
+#
+###################################
+
+
+def higher_is_better(metric: str) -> bool:
+    return "recall@" in metric or metric.endswith("nodes_per_sec")
+
+
+def compare(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Prints a metric-by-metric comparison and returns the names of regressed metrics."""
+    # Settings added after the baseline was recorded are compared with the value they
+    # implicitly had then (see RECORDED_BEFORE), or not at all
+    recorded = {**RECORDED_BEFORE, **baseline["config"]}
+    config = {key: value for key, value in result["config"].items() if key in recorded}
+    if {key: recorded[key] for key in config} != config or set(baseline["config"]) - set(config):
+        print(f"Warning: baseline was recorded with different settings: {baseline['config']}")
+
+    regressions = []
+    print(f"\n{'metric':<36} {'baseline':>12} {'current':>12} {'change':>9}")
+    for metric, value in result["metrics"].items():
+        old = baseline["metrics"].get(metric)
+        if old is None:
+            print(f"{metric:<36} {'-':>12} {value:>12} {'new':>9}")
+            continue
+        change = (value - old) / old if old else 0.0
+        worse = -change if higher_is_better(metric) else change
+        # Quality may not drop at all; timings and memory get some slack for noise
+        limit = 0.0 if "recall@" in metric else tolerance
+        status = ""
+        if metric != "ingest.nodes" and worse > limit:
+            status = "  REGRESSION"
+            regressions.append(metric)
+        print(f"{metric:<36} {old:>12} {value:>12} {change:>+8.1%}{status}")
+    return regressions
+
+
+def baseline_path(corpus: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{corpus}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="v1", help="Corpus version under benchmarks/corpus")
+    parser.add_argument("--copies", type=int, default=1, help="Repeat every document this many times")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--reranker", default="none", help="Reranker of utils.rerankers (none, cross-encoder, llm)")
+    parser.add_argument("--fetch-k", type=int, default=10, help="Candidates retrieved for the reranker")
+    parser.add_argument("--rounds", type=int, default=3, help="Times every question is asked per retrieval mode")
+    parser.add_argument("--parse-workers", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake server: seconds added to every response")
+    parser.add_argument("--latency-per-token", type=float, default=0.0, help="Fake server: seconds per input token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Fake server: seconds per streamed token")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the corpus baseline")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on a regression")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the ingested data for inspection")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's INFO logs")
+    args = parser.parse_args()
+
+    # Paths are resolved before run() changes the working directory
+    output = os.path.abspath(args.output) if args.output else None
+    result = run(args)
+    report = json.dumps(result, indent=2)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.corpus), "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        print(f"Saved baseline to {baseline_path(args.corpus)}")
+
+    if not os.path.exists(baseline_path(args.corpus)):
+        print(report)
+        print("No baseline for this corpus yet; record one with --save-baseline")
+        return
+    with open(baseline_path(args.corpus), "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(result, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed beyond tolerance: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
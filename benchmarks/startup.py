@@ -0,0 +1,202 @@
+"""
+Cold-start benchmark for the Streamlit app.
+
+Renders ``main.py`` once in a fresh interpreter per run (with Streamlit's
+``AppTest``, so no server or browser is needed) and reports:
+
+- the time of the first render (header, sidebar tabs and chat input), which
+  is what a user waits for when the first session of a new container opens;
+- the modules imported during that render, as an import-time breakdown
+  (``python -X importtime``) grouped by top-level package;
+- whether any of the heavy modules (LlamaIndex, Chroma, the Mistral SDK) were
+  imported before they were needed;
+- how long importing those deferred modules takes afterwards, i.e. what the
+  background warm-up (``utils.helpers.warm_up_imports``) absorbs.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 5 --fail-over-target
+
+Runs in a throwaway working directory, so the app's data is never touched.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+# First render of header and sidebar, excluding Streamlit's own import (done
+# once by the server before any session connects)
+STARTUP_TARGET_MS = 1000
+
+# Must not be imported to render the page
+HEAVY_MODULES = ["llama_index.core", "chromadb", "mistralai", "llama_index.vector_stores.chroma"]
+
+# Written to stderr around the render, to cut its imports out of the profile
+RENDER_START_MARKER = "-- first render start --"
+RENDER_END_MARKER = "-- first render done --"
+
+# Executed in a fresh interpreter; prints one JSON line with the measurements
+RENDER_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {repo_root!r})
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_ms = (time.perf_counter() - start) * 1000
+
+app = AppTest.from_file({main!r}, default_timeout=120)
+print("{start_marker}", file=sys.stderr, flush=True)
+start = time.perf_counter()
+app.run()
+render_ms = (time.perf_counter() - start) * 1000
+print("{end_marker}", file=sys.stderr, flush=True)
+
+heavy = [name for name in {heavy!r} if name in sys.modules]
+rendered = {{
+    "header": any(h.value.startswith("Intelligent Conversations") for h in app.header),
+    "sidebar_tabs": len(app.sidebar.tabs),
+    "chat_input": len(app.chat_input),
+}}
+
+from utils.helpers import WARM_UP_MODULES
+import importlib
+start = time.perf_counter()
+for name in WARM_UP_MODULES:
+    importlib.import_module(name)
+deferred_ms = (time.perf_counter() - start) * 1000
+
+print("STARTUP " + json.dumps({{
+    "streamlit_import_ms": streamlit_ms,
+    "first_render_ms": render_ms,
+    "deferred_imports_ms": deferred_ms,
+    "heavy_modules_at_render": heavy,
+    "rendered": rendered,
+    "exceptions": [str(e.value) for e in app.exception],
+}}))
+"""
+
+###################################
+#
+# Measurements
+#
+###################################
+
+
+def render_once(workdir: str, importtime: bool = False) -> Dict:
+    """Renders the app in a new interpreter. With ``importtime`` also returns the raw import profile."""
+    script = RENDER_SCRIPT.format(
+        repo_root=REPO_ROOT, main=os.path.join(REPO_ROOT, "main.py"), heavy=HEAVY_MODULES,
+        start_marker=RENDER_START_MARKER,
+        end_marker=RENDER_END_MARKER,
+    )
+    env = {
+        **os.environ,
+        "MISTRAL_API_KEY": os.environ.get("MISTRAL_API_KEY", "benchmark"),
+        # The warm-up would race the heavy-module check; its cost is measured separately
+        "LOCAL_RAG_WARM_UP": "0",
+        "LOCAL_RAG_LOG_LEVEL": "WARNING",
+    }
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", script]
+    completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, timeout=600)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("STARTUP ")]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"Render failed:\n{completed.stdout[-2000:]}\n{completed.stderr[-4000:]}")
+    result = json.loads(lines[-1][len("STARTUP "):])
+    if importtime:
+        result["importtime"] = completed.stderr
+    return result
+
+
+def import_breakdown(importtime: str) -> List[Dict]:
+    """
+    Groups ``-X importtime`` output by top-level package, summing self time.
+
+    Only modules imported during the render are counted: not Streamlit's own
+    import before it, nor the deferred modules the script imports afterwards.
+    """
+    render = importtime.split(RENDER_START_MARKER)[-1].split(RENDER_END_MARKER)[0]
+    totals: Dict[str, int] = {}
+    for line in render.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_us)
+    return [
+        {"package": package, "ms": round(us / 1000, 1)}
+        for package, us in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+###################################
+#
+# Report
+#
+###################################
+
+
+def run(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="rag-startup-")
+    try:
+        runs = [render_once(workdir) for _ in range(args.runs)]
+        profiled = render_once(workdir, importtime=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    renders = [r["first_render_ms"] for r in runs]
+    first = runs[0]
+    importtime = profiled.pop("importtime")
+    return {
+        "runs": args.runs,
+        "first_render_ms_median": round(statistics.median(renders), 1),
+        "first_render_ms_max": round(max(renders), 1),
+        "streamlit_import_ms_median": round(statistics.median(r["streamlit_import_ms"] for r in runs), 1),
+        "deferred_imports_ms_median": round(statistics.median(r["deferred_imports_ms"] for r in runs), 1),
+        "heavy_modules_at_render": first["heavy_modules_at_render"],
+        "rendered": first["rendered"],
+        "exceptions": first["exceptions"],
+        "import_breakdown": import_breakdown(importtime)[: args.top],
+        "target_ms": args.target_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to render in")
+    parser.add_argument("--target-ms", type=float, default=STARTUP_TARGET_MS, help="First render budget")
+    parser.add_argument("--top", type=int, default=15, help="Packages listed in the import breakdown")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--fail-over-target", action="store_true", help="Exit with status 1 when over budget")
+    args = parser.parse_args()
+
+    result = run(args)
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+    problems = []
+    if result["exceptions"]:
+        problems.append(f"the page raised {result['exceptions']}")
+    if result["heavy_modules_at_render"]:
+        problems.append(f"{', '.join(result['heavy_modules_at_render'])} imported before first use")
+    if result["first_render_ms_median"] > args.target_ms:
+        problems.append(f"first render took {result['first_render_ms_median']:.0f} ms (target {args.target_ms:.0f} ms)")
+    if problems:
+        print("\nStartup target missed: " + "; ".join(problems))
+        if args.fail_over_target:
+            sys.exit(1)
+    else:
+        print(f"\nFirst render in {result['first_render_ms_median']:.0f} ms, within the {args.target_ms:.0f} ms target.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Local static website for testing and benchmarking the crawler (``utils/crawler.py``).
+
+Generates a small documentation site: sections of pages with navigation,
+headers and footers around the content, links between the pages, a
+``robots.txt`` that disallows ``/private/``, a ``noindex`` page and links to
+images. It is served by ``http.server`` with ``Last-Modified`` and ``ETag``
+validators. Both are honoured on conditional requests, so re-crawls get ``304
+Not Modified``. ``--latency`` delays every response to make fetch concurrency
+visible.
+
+    python -m benchmarks.static_site                      # crawl benchmark
+    python -m benchmarks.static_site --serve --port 8000  # just serve the site
+
+The benchmark crawls the site with one worker, with the crawler's default
+per-host limit, and with as many requests per host as workers. It then
+changes a few pages and re-crawls, reporting pages
+fetched, pages not modified and the time taken.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+SECTIONS = ["guide", "reference", "blog"]
+PAGE_TEMPLATE = """<!doctype html>
+<html><head><title>{title} | Example Docs</title></head>
+<body>
+<header><a href="/">Example Docs</a> <a href="/about.html">About</a></header>
+<nav>{nav}</nav>
+<main>
+<h1>{title}</h1>
+{body}
+</main>
+<footer>Copyright Example Inc. <a href="/legal.html">Legal</a></footer>
+<script>window.analytics = true;</script>
+</body></html>
+"""
+
+###################################
+#
+# Site Generation
+#
+###################################
+
+
+def page_body(section: str, index: int, pages: int, version: int = 0) -> str:
+    paragraphs = [
+        f"<p>This page explains topic {index} of the {section} section (revision {version}). "
+        f"Topic {index} builds on topic {max(index - 1, 0)} and is used by topic {(index + 1) % pages}.</p>",
+        f"<h2>Usage</h2><p>Call <code>{section}_{index}()</code> to enable it. "
+        "It accepts a configuration object and returns a handle.</p>",
+        f"<pre>handle = {section}_{index}(config)\nhandle.start()</pre>",
+        "<h2>Details</h2><ul>" + "".join(f"<li>Detail {k} of topic {index}</li>" for k in range(3)) + "</ul>",
+        f'<p>See also <a href="/{section}/page-{(index + 1) % pages}.html">the next topic</a> and '
+        f'<a href="/{SECTIONS[(SECTIONS.index(section) + 1) % len(SECTIONS)]}/page-{index % pages}.html">'
+        f'a related one</a>. <img src="/img/diagram-{index}.png"></p>',
+    ]
+    return "\n".join(paragraphs)
+
+
+def write_page(root: str, path: str, title: str, body: str, nav: str):
+    file_path = os.path.join(root, path.lstrip("/"))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(PAGE_TEMPLATE.format(title=title, body=body, nav=nav))
+
+
+def generate_site(root: str, pages_per_section: int = 10) -> int:
+    """Writes the site into ``root``. Returns the number of pages a crawl should ingest."""
+    nav = " ".join(f'<a href="/{section}/page-0.html">{section.title()}</a>' for section in SECTIONS)
+    index_links = "".join(f'<li><a href="/{section}/page-0.html">{section.title()}</a></li>' for section in SECTIONS)
+    write_page(root, "/index.html", "Example Docs", f"<p>Welcome to the documentation.</p><ul>{index_links}</ul>", nav)
+    write_page(root, "/about.html", "About", "<p>About this project.</p>", nav)
+    write_page(root, "/legal.html", "Legal", "<p>Legal notice.</p>", nav)
+    for section in SECTIONS:
+        for index in range(pages_per_section):
+            body = page_body(section, index, pages_per_section)
+            if index == 0:
+                # Section index, like a docs sidebar
+                body += "<ul>" + "".join(
+                    f'<li><a href="page-{k}.html">Topic {k}</a></li>' for k in range(1, pages_per_section)
+                ) + "</ul>"
+            write_page(root, f"/{section}/page-{index}.html", f"{section.title()} {index}", body, nav)
+
+    # Disallowed by robots.txt, and excluded by a robots meta tag
+    write_page(root, "/private/secret.html", "Secret", "<p>Not for crawlers.</p>", nav)
+    with open(os.path.join(root, "guide", "draft.html"), "w", encoding="utf-8") as f:
+        f.write('<html><head><meta name="robots" content="noindex"></head><body><p>Draft</p></body></html>')
+    with open(os.path.join(root, "index.html"), "a", encoding="utf-8") as f:
+        f.write('<a href="/private/secret.html">secret</a> <a href="/guide/draft.html">draft</a>')
+    with open(os.path.join(root, "robots.txt"), "w", encoding="utf-8") as f:
+        f.write("User-agent: *\nDisallow: /private/\n")
+    return 3 + len(SECTIONS) * pages_per_section
+
+
+def touch_pages(root: str, section: str, indexes, pages_per_section: int, version: int):
+    """Rewrites some pages with new content, as a site update would."""
+    nav = " ".join(f'<a href="/{s}/page-0.html">{s.title()}</a>' for s in SECTIONS)
+    for index in indexes:
+        body = page_body(section, index, pages_per_section, version)
+        write_page(root, f"/{section}/page-{index}.html", f"{section.title()} {index}", body, nav)
+
+
+###################################
+#
+# Server
+#
+###################################
+
+
+def make_handler(root: str, latency: float, counters: dict):
+    class StaticHandler(SimpleHTTPRequestHandler):
+        """Static files with ETag support on top of http.server's Last-Modified handling."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+        def _etag(self):
+            path = self.translate_path(self.path)
+            if not os.path.isfile(path):
+                return None
+            stat = os.stat(path)
+            return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+        def send_head(self):
+            with counters["lock"]:
+                counters["requests"] += 1
+            if latency:
+                time.sleep(latency)
+            etag = self._etag()
+            if etag and self.headers.get("If-None-Match") == etag:
+                with counters["lock"]:
+                    counters["not_modified"] += 1
+                self.send_response(304)
+                self.end_headers()
+                return None
+            return super().send_head()
+
+        def end_headers(self):
+            etag = self._etag()
+            if etag:
+                self.send_header("ETag", etag)
+            super().end_headers()
+
+    return StaticHandler
+
+
+def make_server(root: str, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+    counters = {"requests": 0, "not_modified": 0, "lock": threading.Lock()}
+    server = ThreadingHTTPServer((host, port), make_handler(root, latency, counters))
+    server.daemon_threads = True
+    server.counters = counters
+    return server
+
+
+def start_in_thread(root: str, **kwargs):
+    """Serves ``root`` on a background thread. Returns (server, base_url)."""
+    server = make_server(root, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+###################################
+#
+# Benchmark
+#
+###################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=10, help="Pages per section")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every response")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--serve", action="store_true", help="Only serve the site until interrupted")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    from utils.crawler import CONCURRENCY, PER_HOST_CONCURRENCY, crawl_site
+
+    workdir = tempfile.mkdtemp(prefix="local-rag-site-")
+    site = os.path.join(workdir, "site")
+    expected = generate_site(site, args.pages)
+    server, url = start_in_thread(site, host=args.host, port=args.port, latency=args.latency)
+    try:
+        if args.serve:
+            print(f"Serving {site} at {url}/ (Ctrl+C to stop)")
+            threading.Event().wait()
+
+        print(f"{expected} indexable pages at {url}/, {args.latency * 1000:.0f} ms per response\n")
+        print(f"{'run':<22} {'seconds':>8} {'pages':>6} {'fetched':>8} {'not mod.':>9} {'requests':>9}")
+
+        def run(name: str, crawl_dir: str, **options):
+            before = server.counters["requests"]
+            _, pages, stats = crawl_site(
+                f"{url}/", args.depth, expected * 2, crawl_dir=os.path.join(workdir, crawl_dir), **options
+            )
+            print(
+                f"{name:<22} {stats['seconds']:>8.2f} {stats['pages']:>6} {stats['fetched']:>8} "
+                f"{stats['not_modified']:>9} {server.counters['requests'] - before:>9}"
+            )
+            return pages
+
+        run("sequential", "sequential", concurrency=1, per_host=1, delay=0.0)
+        run(f"{PER_HOST_CONCURRENCY} per host", "polite", delay=0.0)
+        run(f"{CONCURRENCY} per host", "concurrent", per_host=CONCURRENCY, delay=0.0)
+        # Same second as the first crawl would make Last-Modified ambiguous; ETags still differ
+        touch_pages(site, "guide", range(3), args.pages, version=1)
+        run("re-crawl, 3 changed", "concurrent", per_host=CONCURRENCY, delay=0.0)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
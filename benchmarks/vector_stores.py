@@ -0,0 +1,249 @@
+"""
+Compares the vector store backends: Chroma and the built-in NumPy store.
+
+Each backend is filled with the chunks of a versioned corpus
+(``benchmarks/corpus/<version>``) plus random distractor vectors, through the
+app's own ``index_data()``. It is then reopened in a fresh interpreter, as
+after a restart, and measured:
+
+- startup: importing the app and the backend's modules, opening the persisted
+  store, and the first query after that;
+- query latency p50/p95, without and with a metadata filter
+  (``file_name == <expected document>``);
+- corpus recall@k of both kinds of query;
+- memory: resident set growth from opening and querying the store (after the
+  imports), and the size on disk;
+- ingestion throughput of ``add()``.
+
+    python -m benchmarks.vector_stores
+    python -m benchmarks.vector_stores --distractors 100000 --backends numpy
+    python -m benchmarks.vector_stores --compression int8
+
+Embeddings come from the fake server's hashed bag-of-words model, so no API
+key is needed. Everything is written to a throwaway working directory.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Dict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+BACKENDS = ["chroma", "numpy"]
+
+# Distractors are added in batches of this many nodes
+ADD_BATCH = 2000
+
+###################################
+#
+# Worker (runs in a fresh interpreter)
+#
+###################################
+
+
+def rss_mb() -> float:
+    """Current resident set size, or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2, 1)
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+
+def build(args) -> Dict:
+    """Fills the configured store with the corpus chunks and distractors."""
+    import time
+
+    import numpy as np
+
+    from benchmarks.fake_mistral import fake_embedding
+    from benchmarks.retrieval import load_corpus
+    from llama_index.core.schema import TextNode
+
+    import utils.llama_index as llama_index
+
+    files, _ = load_corpus(args.corpus)
+    documents = llama_index.load_data(files, workers=1)
+    nodes = llama_index.chunk_data(documents, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    for node in nodes:
+        node.embedding = fake_embedding(node.get_content(metadata_mode="embed"))
+
+    vector_store = llama_index.index_data()
+    start = time.perf_counter()
+    vector_store.add(nodes)
+    rng = np.random.default_rng(0)
+    for offset in range(0, args.distractors, ADD_BATCH):
+        count = min(ADD_BATCH, args.distractors - offset)
+        vectors = rng.standard_normal((count, len(nodes[0].embedding)), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vector_store.add(
+            [
+                TextNode(
+                    id_=f"distractor-{offset + i}",
+                    text=f"distractor {offset + i}",
+                    metadata={"file_name": f"distractor-{(offset + i) % 100}.md"},
+                    embedding=vector.tolist(),
+                )
+                for i, vector in enumerate(vectors)
+            ]
+        )
+    seconds = time.perf_counter() - start
+    return {"nodes": len(nodes) + args.distractors, "add_nodes_per_sec": round((len(nodes) + args.distractors) / seconds, 1)}
+
+
+def measure(args) -> Dict:
+    """Reopens the persisted store and times startup and queries."""
+    import time
+
+    start = time.perf_counter()
+    import utils.llama_index as llama_index
+    from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters, VectorStoreQuery
+
+    # The backend's own modules; LlamaIndex itself is imported above by both
+    if llama_index.VECTOR_STORE == "numpy":
+        import utils.vector_stores  # noqa: F401
+    else:
+        import chromadb  # noqa: F401
+        from llama_index.vector_stores.chroma import ChromaVectorStore  # noqa: F401
+    import_seconds = time.perf_counter() - start
+
+    baseline_rss = rss_mb()
+    start = time.perf_counter()
+    vector_store = llama_index.index_data()
+    open_seconds = time.perf_counter() - start
+
+    from benchmarks.fake_mistral import fake_embedding
+    from benchmarks.retrieval import latency_summary, load_corpus
+
+    _, queries = load_corpus(args.corpus)
+    embeddings = [fake_embedding(item["query"]) for item in queries]
+
+    start = time.perf_counter()
+    vector_store.query(VectorStoreQuery(query_embedding=embeddings[0], similarity_top_k=args.top_k))
+    first_query_seconds = time.perf_counter() - start
+
+    result = {
+        "import_ms": round(import_seconds * 1000, 1),
+        "open_ms": round(open_seconds * 1000, 1),
+        "first_query_ms": round(first_query_seconds * 1000, 1),
+        "stored": vector_store.client.count(),
+    }
+    for kind in ("plain", "filtered"):
+        times, hits = [], 0
+        for round_number in range(args.rounds):
+            for item, embedding in zip(queries, embeddings):
+                filters = None
+                if kind == "filtered":
+                    filters = MetadataFilters(filters=[MetadataFilter(key="file_name", value=item["expected"][0])])
+                query = VectorStoreQuery(query_embedding=embedding, similarity_top_k=args.top_k, filters=filters)
+                start = time.perf_counter()
+                found = vector_store.query(query)
+                times.append(time.perf_counter() - start)
+                if round_number == 0:
+                    hits += bool({node.metadata.get("file_name") for node in found.nodes} & set(item["expected"]))
+        result.update({f"{kind}_{key}": value for key, value in latency_summary("query", times).items()})
+        result[f"{kind}_recall@{args.top_k}"] = round(hits / len(queries), 4)
+    result["rss_growth_mb"] = round(rss_mb() - baseline_rss, 1)
+    return result
+
+
+def worker(args) -> None:
+    os.environ.setdefault("LOCAL_RAG_LOG_LEVEL", "WARNING")
+    from utils.helpers import silence_bare_mode_warnings
+
+    silence_bare_mode_warnings()
+    result = build(args) if args.worker == "build" else measure(args)
+    print("RESULT " + json.dumps(result))
+
+
+###################################
+#
+# Report
+#
+###################################
+
+
+def run_worker(phase: str, backend: str, workdir: str, args) -> Dict:
+    env = {
+        **os.environ,
+        "LOCAL_RAG_VECTOR_STORE": backend,
+        "LOCAL_RAG_VECTOR_COMPRESSION": args.compression,
+        "LOCAL_RAG_LOG_LEVEL": "WARNING",
+        "PYTHONPATH": REPO_ROOT,
+    }
+    command = [
+        sys.executable, "-m", "benchmarks.vector_stores", "--worker", phase,
+        "--corpus", args.corpus, "--distractors", str(args.distractors), "--top-k", str(args.top_k),
+        "--rounds", str(args.rounds), "--chunk-size", str(args.chunk_size), "--chunk-overlap", str(args.chunk_overlap),
+    ]
+    completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, timeout=3600)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"{backend} {phase} failed:\n{completed.stdout[-2000:]}\n{completed.stderr[-4000:]}")
+    return json.loads(lines[-1][len("RESULT "):])
+
+
+def directory_mb(path: str) -> float:
+    total = 0
+    for root, _, names in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    return round(total / 1024**2, 2)
+
+
+def run(args) -> Dict:
+    results = {}
+    for backend in args.backends:
+        workdir = tempfile.mkdtemp(prefix=f"rag-{backend}-store-")
+        try:
+            built = run_worker("build", backend, workdir, args)
+            measured = run_worker("measure", backend, workdir, args)
+            results[backend] = {**built, **measured, "disk_mb": directory_mb(workdir)}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"{backend}: {json.dumps(results[backend])}")
+    return {
+        "corpus": args.corpus,
+        "config": {"distractors": args.distractors, "top_k": args.top_k, "compression": args.compression},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="v1", help="Corpus version under benchmarks/corpus")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--compression", default="none", help="LOCAL_RAG_VECTOR_COMPRESSION for both backends")
+    parser.add_argument("--distractors", type=int, default=20000, help="Random vectors added to the store")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=5, help="Times every question is asked")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--worker", choices=["build", "measure"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    result = run(args)
+    metrics = sorted({metric for values in result["results"].values() for metric in values})
+    print(f"\n{'metric':<28}" + "".join(f"{backend:>14}" for backend in result["results"]))
+    for metric in metrics:
+        print(f"{metric:<28}" + "".join(f"{values.get(metric, '-'):>14}" for values in result["results"].values()))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
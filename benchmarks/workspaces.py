@@ -0,0 +1,214 @@
+"""
+Measures hosting many workspaces in one process under a memory budget.
+
+A number of workspaces are filled with random vectors and text chunks through
+the app's own ``index_data()``, lexical index and registry. A fresh
+interpreter then answers retrievals for them in a skewed (Zipf-like) order,
+as many tenants with a few busy ones would, once per memory budget
+(``LOCAL_RAG_WORKSPACE_MEMORY_MB``; 0 means no limit). For each budget it
+reports:
+
+- the workspaces still attached at the end, their estimated memory and the
+  detaches (evictions) on the way;
+- the resident set of the process at the end and at its peak;
+- retrieval latency p50/p95 when the workspace was attached ("warm") and
+  when it had to be loaded from disk first ("cold").
+
+    python -m benchmarks.workspaces
+    python -m benchmarks.workspaces --workspaces 100 --vectors 2000 --budgets 0 256
+
+Embeddings come from the fake server's hashed bag-of-words model, so no API
+key is needed. Everything is written to a throwaway working directory.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+WORDS_PER_CHUNK = 60
+ADD_BATCH = 2000
+
+###################################
+#
+# Workers (run in a fresh interpreter)
+#
+###################################
+
+
+def workspace_names(count: int) -> list:
+    return [f"tenant-{i:03d}" for i in range(count)]
+
+
+def build(args) -> Dict:
+    """Fills every workspace with random chunks, detaching each one when it is done."""
+    import numpy as np
+    from llama_index.core.schema import TextNode
+
+    import utils.llama_index as llama_index
+    from benchmarks.fake_mistral import EMBEDDING_DIM
+    from utils.workspaces import create_workspace, get_workspace_pool
+
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    start = time.perf_counter()
+    for name in workspace_names(args.workspaces):
+        create_workspace(name)
+        registry = llama_index.get_registry(name)
+        vector_store = llama_index.index_data(None, name)
+        lexical_index = llama_index.get_lexical_index(vector_store, None, name)
+        chunks = {}
+        for offset in range(0, args.vectors, ADD_BATCH):
+            count = min(ADD_BATCH, args.vectors - offset)
+            vectors = rng.standard_normal((count, EMBEDDING_DIM), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            batch = [
+                TextNode(
+                    id_=f"{name}-{offset + i}",
+                    text=" ".join(rng.choice(vocabulary, WORDS_PER_CHUNK)),
+                    metadata={"file_name": "notes.txt", "doc_key": "local:notes.txt", "source": "local"},
+                    embedding=vector.tolist(),
+                )
+                for i, vector in enumerate(vectors)
+            ]
+            vector_store.add(batch)
+            lexical_index.add(batch)
+            chunks.update({node.node_id: node.node_id for node in batch})
+        registry.record("local:notes.txt", "local", "notes.txt", name, "benchmark", chunks)
+        registry.bump_version()
+        lexical_index.save()
+        registry.save()
+        get_workspace_pool().detach(name)
+    return {"build_seconds": round(time.perf_counter() - start, 1)}
+
+
+def measure(args) -> Dict:
+    """Retrieves from the workspaces in a skewed order and records memory and latency."""
+    import numpy as np
+    from llama_index.core.schema import QueryBundle
+
+    import utils.llama_index as llama_index
+    from benchmarks.fake_mistral import EMBEDDING_DIM
+    from benchmarks.retrieval import latency_summary, peak_rss_mb
+    from benchmarks.vector_stores import rss_mb
+    from utils.workspaces import get_workspace_pool
+
+    names = workspace_names(args.workspaces)
+    rng = np.random.default_rng(1)
+    # Zipf-like popularity: the i-th workspace is asked 1/(i+1) as often as the first
+    weights = 1 / np.arange(1, len(names) + 1)
+    order = rng.choice(len(names), size=args.queries, p=weights / weights.sum())
+    pool = get_workspace_pool()
+    baseline_rss = rss_mb()
+    times = {"warm": [], "cold": []}
+    for i in order:
+        name = names[i]
+        vector = rng.standard_normal(EMBEDDING_DIM).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        kind = "warm" if name in pool.stats()["attached"] else "cold"
+        start = time.perf_counter()
+        with pool.use(name):
+            query_engine = llama_index.create_query_engine(
+                llama_index.get_index(workspace=name), args.mode, args.top_k, args.top_k, "none", None, name
+            )
+            query_engine.retriever.retrieve(QueryBundle("term1 term2 term3", embedding=vector.tolist()))
+        times[kind].append(time.perf_counter() - start)
+    stats = pool.stats()
+    result = {
+        "attached": len(stats["attached"]),
+        "estimated_mb": stats["memory_mb"],
+        "evictions": stats["evictions"],
+        "rss_growth_mb": round(rss_mb() - baseline_rss, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    for kind, samples in times.items():
+        result[f"{kind}_queries"] = len(samples)
+        if samples:
+            summary = latency_summary("retrieve", samples)
+            result[f"{kind}_p50_ms"] = summary["retrieve_p50_ms"]
+            result[f"{kind}_p95_ms"] = summary["retrieve_p95_ms"]
+    return result
+
+
+def worker(args) -> None:
+    os.environ.setdefault("LOCAL_RAG_LOG_LEVEL", "WARNING")
+    # No request is made: every query comes with its embedding
+    os.environ.setdefault("MISTRAL_API_KEY", "benchmark")
+    from utils.helpers import silence_bare_mode_warnings
+
+    silence_bare_mode_warnings()
+    result = build(args) if args.worker == "build" else measure(args)
+    print("RESULT " + json.dumps(result))
+
+
+###################################
+#
+# Report
+#
+###################################
+
+
+def run_worker(phase: str, workdir: str, args, budget_mb: int = 0) -> Dict:
+    env = {
+        **os.environ,
+        "LOCAL_RAG_WORKSPACE_MEMORY_MB": str(budget_mb),
+        "LOCAL_RAG_LOG_LEVEL": "WARNING",
+        "PYTHONPATH": REPO_ROOT,
+    }
+    command = [
+        sys.executable, "-m", "benchmarks.workspaces", "--worker", phase,
+        "--workspaces", str(args.workspaces), "--vectors", str(args.vectors), "--queries", str(args.queries),
+        "--mode", args.mode, "--top-k", str(args.top_k),
+    ]
+    completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, timeout=3600)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"{phase} failed:\n{completed.stdout[-2000:]}\n{completed.stderr[-4000:]}")
+    return json.loads(lines[-1][len("RESULT "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workspaces", type=int, default=20)
+    parser.add_argument("--vectors", type=int, default=2000, help="Chunks per workspace")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 64], help="Memory budgets in MB; 0 is no limit")
+    parser.add_argument("--mode", default="hybrid", choices=["hybrid", "vector", "lexical"])
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--worker", choices=["build", "measure"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="local-rag-workspaces-")
+    results = {}
+    try:
+        built = run_worker("build", workdir, args)
+        print(f"{args.workspaces} workspaces of {args.vectors} chunks built in {built['build_seconds']}s")
+        for budget_mb in args.budgets:
+            results[budget_mb] = run_worker("measure", workdir, args, budget_mb)
+            print(f"budget {budget_mb} MB: {json.dumps(results[budget_mb])}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    metrics = sorted({metric for values in results.values() for metric in values})
+    print(f"\n{'budget (MB)':<16}" + "".join(f"{budget or 'none':>12}" for budget in results))
+    for metric in metrics:
+        print(f"{metric:<16}" + "".join(f"{values.get(metric, '-'):>12}" for values in results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Thin Streamlit front end for the headless RAG service (service/app.py).
+
+All ingestion and querying happens in the service, so any number of browser
+sessions share one warm index:
+
+    python -m service.app --port 8000
+    RAG_SERVICE_URL=http://127.0.0.1:8000 streamlit run client.py
+
+``RAG_WORKSPACE`` sets the workspace the client starts in (see utils/workspaces.py).
+"""
+
+import os
+
+import httpx
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from components.header import set_page_header
+from components.page_config import set_page_config
+
+SERVICE_URL = os.environ.get("RAG_SERVICE_URL", "http://127.0.0.1:8000").rstrip("/")
+WORKSPACE = os.environ.get("RAG_WORKSPACE", "default")
+
+# Ingestion waits for the vectors to be stored, which can take a while for large uploads
+INGEST_TIMEOUT = httpx.Timeout(10.0, read=None)
+QUERY_TIMEOUT = httpx.Timeout(10.0, read=120.0)
+
+
+def get_status(workspace: str):
+    try:
+        response = httpx.get(f"{SERVICE_URL}/status", params={"workspace": workspace}, timeout=5.0)
+        if response.status_code == 404:
+            st.caption(f"Workspace '{workspace}' is created with its first upload.")
+            return None
+        if response.status_code == 422:
+            st.error(response.json().get("detail", response.text))
+            return None
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        st.error(f"RAG service at {SERVICE_URL} is not reachable: {e}")
+        return None
+
+
+def ingest(uploaded_files, prune: bool, workspace: str):
+    files = [("files", (f.name, f.getvalue(), f.type or "application/octet-stream")) for f in uploaded_files]
+    response = httpx.post(
+        f"{SERVICE_URL}/ingest",
+        files=files,
+        data={"prune": str(prune).lower(), "workspace": workspace},
+        timeout=INGEST_TIMEOUT,
+    )
+    if response.status_code != 200:
+        raise RuntimeError(response.json().get("detail", response.text))
+    return response.json()
+
+
+def stream_answer(prompt: str, retrieval_mode: str, workspace: str):
+    # Lets the service tag its logs and query traces with this browser session
+    ctx = get_script_run_ctx()
+    with httpx.stream(
+        "POST",
+        f"{SERVICE_URL}/query",
+        json={"prompt": prompt, "retrieval_mode": retrieval_mode, "workspace": workspace},
+        headers={"X-Session-Id": ctx.session_id} if ctx else None,
+        timeout=QUERY_TIMEOUT,
+    ) as response:
+        if response.status_code != 200:
+            response.read()
+            raise RuntimeError(response.json().get("detail", response.text))
+        yield from response.iter_text()
+
+
+### Page Setup
+set_page_config()
+set_page_header()
+
+if "messages" not in st.session_state:
+    st.session_state["messages"] = [{"role": "assistant", "content": "How can I help you?"}]
+
+### Sidebar
+with st.sidebar:
+    workspace = st.text_input("Workspace", value=WORKSPACE).strip() or "default"
+    status = get_status(workspace)
+    if status:
+        st.caption(
+            f"Service: {status['documents']} documents, {status['nodes']} chunks, index version {status['index_version']}"
+            + (" — ingesting…" if status["ingesting"] else "")
+        )
+
+    uploaded_files = st.file_uploader("Upload a document", type=["pdf", "md", "txt"], accept_multiple_files=True)
+    prune = st.toggle("Replace documents not in this upload", value=False)
+    if uploaded_files and st.button("Process Documents"):
+        with st.spinner("Ingesting on the service..."):
+            try:
+                stats = ingest(uploaded_files, prune, workspace)
+                for error in stats["errors"]:
+                    st.warning(f"Skipped {error}")
+                st.toast(
+                    f"{stats['changed'] - len(stats['errors'])} documents processed, {stats['unchanged']} unchanged, "
+                    f"{stats.get('nodes', 0)} new chunks embedded.",
+                    icon="✅",
+                )
+            except Exception as e:
+                st.error(f"Failed to process documents: {e}")
+
+    retrieval_mode = st.selectbox("Retrieval Mode", options=["hybrid", "vector", "lexical"])
+
+### Chat Box
+for msg in st.session_state["messages"]:
+    st.chat_message(msg["role"]).write(msg["content"])
+
+if prompt := st.chat_input("How can I help?", disabled=not status or not status["nodes"]):
+    st.session_state["messages"].append({"role": "user", "content": prompt})
+    st.chat_message("user").markdown(prompt)
+    with st.chat_message("assistant"):
+        try:
+            response = st.write_stream(stream_answer(prompt, retrieval_mode, workspace))
+        except Exception as e:
+            st.error(f"An error occurred: {e}")
+            response = "Sorry, I encountered an error processing your request."
+    st.session_state["messages"].append({"role": "assistant", "content": response})
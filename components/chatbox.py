@@ -1,17 +1,34 @@
+from datetime import datetime
+
 import streamlit as st
-from llama_index.core import Settings
 import utils.logs as logs
+from components.tabs.settings import rebuild_query_engine
+from utils.answer_cache import replay
+from utils.llama_index import (answer_scope, create_query_engine, file_type, get_answer_cache, get_index,
+                               get_registry, has_stored_documents, index_data)
+from utils.tracing import QueryTrace
+from utils.workspaces import current_workspace, get_workspace_pool
 
 
 def chatbox():
     # Check if a query engine exists (meaning data is loaded)
     query_engine = st.session_state.get("query_engine")
-    is_disabled = query_engine is None
+    # Documents stored by an earlier run or another session are attached on the first question
+    is_disabled = query_engine is None and not has_stored_documents()
     placeholder_text = "Please upload and process documents first..." if is_disabled else "How can I help?"
 
+    if not is_disabled:
+        search_scope()
+
     # Disable chat input if no query engine exists
     if prompt := st.chat_input(placeholder_text, disabled=is_disabled):
-        
+        if query_engine is None:
+            with st.spinner("Loading documents..."):
+                query_engine = get_query_engine()
+        else:
+            # Cached; picks up partitions that were added since, e.g. by another session
+            query_engine = get_query_engine()
+
         # Double-check query engine just in case (though input should be disabled)
         if not query_engine:
             st.warning("Please process documents before chatting.")
@@ -27,10 +44,12 @@ def chatbox():
             with st.spinner("Processing..."):
                 # Always use query engine here since input is disabled otherwise
                 try:
-                    stream = query_engine.query(prompt) # Query engine uses global Settings
-                    response = st.write_stream(stream.response_gen)
+                    # Keeps the workspace attached until the answer has streamed; the engine is
+                    # resolved again inside, in case the workspace was detached in the meantime
+                    with get_workspace_pool().use(current_workspace()):
+                        response = answer(get_query_engine(), prompt)
                 except Exception as e:
-                    logs.log.error(f"Error during context chat: {e}")
+                    logs.log.error("Error during context chat: %s", e)
                     st.error(f"An error occurred: {e}")
                     response = "Sorry, I encountered an error processing your request with context."
                     st.write(response)
@@ -38,3 +57,122 @@ def chatbox():
 
         # Add the final response to messages state
         st.session_state["messages"].append({"role": "assistant", "content": response})
+
+
+def get_query_engine():
+    """Attaches this session to the workspace's index over the stored documents, and returns its query engine."""
+    st.session_state["vector_store"] = index_data()
+    st.session_state["index"] = get_index()
+    return create_query_engine(
+        st.session_state["index"],
+        st.session_state["retrieval_mode"],
+        st.session_state["top_k"],
+        st.session_state["fetch_k"],
+        st.session_state["reranker"],
+        st.session_state["query_filters"],
+    )
+
+
+def source_label(source: str) -> str:
+    kind, _, name = source.partition(":")
+    return {"local": "Uploaded files", "github": f"{name} (GitHub)", "web": f"{name} (website)"}.get(kind, source)
+
+
+def search_scope():
+    """Lets the user limit questions to some sources, documents, file types or recent uploads."""
+    registry = get_registry()
+    sources = registry.sources()
+    if not sources:
+        return
+    # A copy, since an ingestion job may be changing the registry meanwhile
+    registered = registry.snapshot()
+    # Selections of documents that were removed since are dropped before the widgets are drawn
+    st.session_state["scope_sources"] = [s for s in st.session_state.get("scope_sources", []) if s in sources]
+    selected = set(st.session_state["scope_sources"]) or set(sources)
+    documents = sorted(key for key, entry in registered.items() if entry["source"] in selected)
+    st.session_state["scope_documents"] = [d for d in st.session_state.get("scope_documents", []) if d in documents]
+    file_types = sorted({file_type(registered[key]["file_name"]) for key in documents} - {""})
+    st.session_state["scope_file_types"] = [t for t in st.session_state.get("scope_file_types", []) if t in file_types]
+
+    filters = st.session_state["query_filters"]
+    label = ", ".join(
+        f"{len(filters[name])} {noun}{'s' if len(filters[name]) > 1 else ''}"
+        for name, noun in (("sources", "source"), ("documents", "document"), ("file_types", "file type"))
+        if filters.get(name)
+    )
+    if filters.get("ingested_after"):
+        label += f"{', ' if label else ''}uploaded since {datetime.fromtimestamp(filters['ingested_after']):%Y-%m-%d}"
+    with st.expander(f"Search in: {label or 'all documents'}"):
+        st.multiselect(
+            "Sources", options=sources, format_func=source_label, key="scope_sources", on_change=apply_search_scope
+        )
+        st.multiselect(
+            "Documents",
+            options=documents,
+            format_func=lambda key: f"{registered[key]['file_name']} — {source_label(registered[key]['source'])}",
+            key="scope_documents",
+            on_change=apply_search_scope,
+            placeholder="All documents of these sources",
+        )
+        st.multiselect("File Types", options=file_types, key="scope_file_types", on_change=apply_search_scope)
+        st.date_input("Uploaded Since", value=None, key="scope_uploaded_since", on_change=apply_search_scope)
+
+
+def apply_search_scope():
+    """Turns the search scope widgets into query filters, and rebuilds the query engine with them."""
+    uploaded_since = st.session_state.get("scope_uploaded_since")
+    st.session_state["query_filters"] = {
+        "sources": st.session_state.get("scope_sources") or None,
+        "documents": st.session_state.get("scope_documents") or None,
+        "file_types": st.session_state.get("scope_file_types") or None,
+        "ingested_after": datetime.combine(uploaded_since, datetime.min.time()).timestamp() if uploaded_since else None,
+    }
+    rebuild_query_engine()
+
+
+def answer(query_engine, prompt: str) -> str:
+    """Streams an answer to the prompt, replaying it from the answer cache when possible."""
+    from llama_index.core import Settings
+
+    answer_cache = get_answer_cache()
+    index_version = get_registry().version
+    # Answers are only reused for the same search scope and answer-affecting settings
+    scope = answer_scope(
+        st.session_state.get("query_filters"),
+        st.session_state.get("retrieval_mode"),
+        st.session_state.get("top_k"),
+        st.session_state.get("fetch_k"),
+        st.session_state.get("reranker"),
+        st.session_state.get("system_prompt"),
+    )
+
+    # Per-stage timings are recorded to utils/logs and shown under Advanced Settings
+    with QueryTrace(
+        "chat",
+        retrieval_mode=st.session_state.get("retrieval_mode"),
+        top_k=st.session_state.get("top_k"),
+        reranker=st.session_state.get("reranker"),
+    ) as trace:
+        # The semantic tier needs the prompt's embedding; it is cached, so retrieval reuses it
+        embedding = None
+        if st.session_state.get("answer_cache_semantic"):
+            try:
+                with trace.span("embed"):
+                    embedding = Settings.embed_model.get_query_embedding(prompt)
+            except Exception as e:
+                logs.log.warning("Could not embed prompt for the semantic answer cache: %s", e)
+
+        cached = answer_cache.get(
+            index_version, prompt, embedding, threshold=st.session_state.get("answer_cache_threshold", 0.95), scope=scope
+        )
+        if cached is not None:
+            logs.log.info("Answer served from cache")
+            trace.labels["cache"] = "hit"
+            return st.write_stream(trace.stream(replay(cached)))
+
+        trace.labels["cache"] = "miss"
+        stream = query_engine.query(prompt) # Query engine uses global Settings
+
+    response = st.write_stream(trace.stream(stream.response_gen))
+    answer_cache.put(index_version, prompt, response, embedding, scope=scope)
+    return response
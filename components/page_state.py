@@ -1,10 +1,28 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 import utils.logs as logs
+from utils.llama_index import DEFAULT_FETCH_K, DEFAULT_TOP_K
+from utils.parsing import DEFAULT_PARSE_WORKERS
+from utils.workspaces import DEFAULT_WORKSPACE, validate_workspace, workspace_exists
 
 
 def set_initial_state():
     """Sets the initial state variables for the application."""
+    # Tag everything logged during this script run with the browser session
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        logs.session_id.set(ctx.session_id)
+
+    # Workspace this session works in; a link can pick one with ?workspace=<name>
+    if "workspace" not in st.session_state:
+        workspace = st.query_params.get("workspace", DEFAULT_WORKSPACE)
+        try:
+            validate_workspace(workspace)
+        except ValueError:
+            workspace = DEFAULT_WORKSPACE
+        st.session_state["workspace"] = workspace if workspace_exists(workspace) else DEFAULT_WORKSPACE
+
     # Initialize chat history
     if "messages" not in st.session_state:
         st.session_state["messages"] = []
@@ -52,6 +70,42 @@ def set_initial_state():
     if "chunk_overlap" not in st.session_state:
         st.session_state["chunk_overlap"] = 20
 
+    # Initialize number of document parser processes
+    if "parse_workers" not in st.session_state:
+        st.session_state["parse_workers"] = DEFAULT_PARSE_WORKERS
+
+    # Initialize embedding concurrency (requests in flight) and per-request token budget
+    if "embedding_concurrency" not in st.session_state:
+        st.session_state["embedding_concurrency"] = 4
+
+    if "embedding_batch_tokens" not in st.session_state:
+        st.session_state["embedding_batch_tokens"] = 8000
+
+    # Initialize retrieval mode (hybrid, vector or lexical)
+    if "retrieval_mode" not in st.session_state:
+        st.session_state["retrieval_mode"] = "hybrid"
+
+    # Initialize reranking: fetch_k candidates are reranked down to the top_k sent to the LLM
+    if "top_k" not in st.session_state:
+        st.session_state["top_k"] = DEFAULT_TOP_K
+
+    if "fetch_k" not in st.session_state:
+        st.session_state["fetch_k"] = DEFAULT_FETCH_K
+
+    if "reranker" not in st.session_state:
+        st.session_state["reranker"] = "none"
+
+    # Metadata filters limiting questions to some sources or documents (see utils.llama_index.QUERY_FILTERS)
+    if "query_filters" not in st.session_state:
+        st.session_state["query_filters"] = {}
+
+    # Initialize answer cache settings (exact hits are always on)
+    if "answer_cache_semantic" not in st.session_state:
+        st.session_state["answer_cache_semantic"] = False
+
+    if "answer_cache_threshold" not in st.session_state:
+        st.session_state["answer_cache_threshold"] = 0.95
+
     # Initialize embedding model (removed specific selection, using global Mistral)
     if "embedding_model" not in st.session_state:
         st.session_state["embedding_model"] = "mistral-embed" # Indicate global default
@@ -60,6 +114,10 @@ def set_initial_state():
     # if "other_embedding_model" not in st.session_state:
     #     st.session_state["other_embedding_model"] = "BAAI/bge-large-en-v1.5"
 
+    # Background ingestion job submitted by this session, polled until it finishes
+    if "ingest_job_id" not in st.session_state:
+        st.session_state["ingest_job_id"] = None
+
     # Initialize vector store
     if "vector_store" not in st.session_state:
         st.session_state["vector_store"] = None
@@ -3,10 +3,13 @@ import streamlit as st
 from components.tabs.about import about
 from components.tabs.file_upload import file_upload
 from components.tabs.settings import settings
+from components.workspace_picker import workspace_picker
 
 
 def sidebar():
     with st.sidebar:
+        workspace_picker()
+
         tab1, tab2, tab3 = st.sidebar.tabs(["My Files", "Settings", "About"])
 
         with tab1:
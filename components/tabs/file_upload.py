@@ -1,6 +1,6 @@
 import streamlit as st
 
-from components.tabs.local_files import tab_local_files
+from components.tabs.local_files import ingestion_status, tab_local_files
 from components.tabs.github_repo import tab_github_repo
 from components.tabs.website import website
 
@@ -13,8 +13,11 @@ def file_upload():
     with st.expander("💻 &nbsp; **Local Files**", expanded=True):
         tab_local_files()
 
-  #  with st.expander("🗂️ &nbsp;**GitHub Repo**", expanded=False):
-  #      tab_github_repo()
+    with st.expander("🗂️ &nbsp;**GitHub Repo**", expanded=False):
+        tab_github_repo()
 
-  #  with st.expander("🌐 &nbsp; **Website**", expanded=False):
-  #      website()
+    with st.expander("🌐 &nbsp; **Website**", expanded=False):
+        website()
+
+    # Jobs of both tabs, and what is stored
+    ingestion_status()
@@ -1,64 +1,73 @@
-import os
-import shutil
-
 import streamlit as st
 
-import utils.helpers as func
-import utils.llama_index as llama_index
+import utils.github as github
 import utils.logs as logs
+from components.tabs.local_files import ingest_options
+from utils.jobs import get_job_queue
+from utils.llama_index import get_registry
+from utils.workspaces import current_workspace, data_dir
+
+
+def split_globs(text: str) -> list:
+    return [pattern.strip() for pattern in text.replace("\n", ",").split(",") if pattern.strip()]
 
 
 def tab_github_repo():
     github_url = st.text_input(
         "Enter GitHub Repository URL",
         placeholder="https://github.com/jerryjliu/llama_index",
+        help="A GitHub URL, `owner/repo`, or the path of a local git repository.",
     )
 
     branch = st.text_input(
-        "Enter Branch Name (optional, defaults to main/master)", placeholder="main"
+        "Enter Branch Name (optional, defaults to the repository's default branch)", placeholder="main"
+    )
+    include = st.text_input(
+        "Include",
+        value=", ".join(github.DEFAULT_INCLUDE),
+        help="Comma-separated globs of tracked files to ingest, e.g. `*.py, docs/*.md`.",
+    )
+    exclude = st.text_input(
+        "Exclude",
+        value=", ".join(github.DEFAULT_EXCLUDE),
+        help="Comma-separated globs to skip. Vendored directories and binary files are always skipped.",
     )
 
-    if st.button("Load Repository"):
-        if github_url:
-            try:
-                if github_url.startswith("https://github.com/"):
-                    parts = github_url.strip('/').split('/')
-                    owner = parts[-2]
-                    repo = parts[-1]
-                else:
-                     raise ValueError("Invalid GitHub URL format")
-            except Exception as e:
-                st.error(f"Invalid GitHub URL format: {e}")
-                owner, repo = None, None
-            
-            if owner and repo:
-                with st.spinner("Loading repository content..."):
-                    try:
-                        st.warning("GitHub loading logic needs implementation (fetch_github_repo_content)")
-                        documents = []
-
-                        if documents:
-                            st.session_state["documents"] = documents
-                            st.toast(f"Repository '{repo}' loaded successfully!", icon="✅")
-
-                            st.warning("GitHub indexing logic needs implementation (create_index_from_github)")
-                            index = None
-
-                            if index:
-                                st.session_state["index"] = index
-                                st.session_state["query_engine"] = llama_index.create_query_engine(index)
-                                st.success("Repository indexed and ready for querying!")
-                            else:
-                                st.error("Failed to create index from GitHub repository.")
-                        else:
-                            st.warning("No documents found in the repository or failed to load.")
-                    except Exception as e:
-                        st.error(f"Failed to load or index repository: {e}")
-                        logs.log.error(f"GitHub processing error: {e}")
-        else:
+    if st.button("Sync Repository"):
+        if not github_url:
             st.warning("Please enter a GitHub Repository URL.")
+            return
+        options = ingest_options()
+        try:
+            with st.spinner("Fetching repository..."):
+                source, files, stats = github.collect_repo_files(
+                    github_url,
+                    branch.strip() or None,
+                    split_globs(include),
+                    split_globs(exclude),
+                    registry=get_registry(),
+                    chunk_settings=(options["chunk_size"], options["chunk_overlap"]),
+                    mirror_dir=data_dir(current_workspace(), "github"),
+                )
+        except (ValueError, github.GitError) as e:
+            logs.log.error(f"GitHub processing error: {e}")
+            st.error(f"Failed to load repository: {e}")
+            return
+
+        st.session_state["github_stats"] = stats
+        if not files:
+            # Submitting an empty set would prune every stored file of the repository
+            st.warning("No files in the repository match the include and exclude patterns.")
+            return
+        # Every selected file goes into the job, so files deleted from the repository are pruned;
+        # unchanged ones are skipped by their blob SHA without being read
+        st.session_state["ingest_job_id"] = get_job_queue().submit(files, options, source=source, prune=True)
+        st.toast(f"Repository '{stats['repo']}' queued: {stats['changed']} new or changed files.", icon="⏳")
 
-    if "documents" in st.session_state and st.session_state["documents"]:
-        st.write(f"Loaded {len(st.session_state['documents'])} documents from the repository.")
-    if "query_engine" in st.session_state:
-        st.write("Query engine is ready.")
+    stats = st.session_state.get("github_stats")
+    if stats:
+        st.caption(
+            f"{stats['repo']} @ {stats['commit'][:12]}: {stats['files']} of {stats['tracked']} tracked files selected, "
+            f"{stats['changed']} new or changed. Skipped {stats['vendored']} vendored, {stats['binary']} binary, "
+            f"{stats['too_large']} too large and {stats['excluded']} excluded."
+        )
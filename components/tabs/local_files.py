@@ -4,9 +4,25 @@ import streamlit as st
 
 import utils.logs as logs
 # import utils.ollama as ollama # Remove ollama import
-from utils.llama_index import (chunk_data, embed_data, index_data, load_data,
+from utils.jobs import ACTIVE_STATES, get_job_queue
+from utils.llama_index import (create_query_engine, get_chunk_settings, get_index, index_data,
                            # read_data, save_data_to_session, update_data, # These seem less relevant now
-                           upsert_data, view_data)
+                           view_data)
+from utils.workspaces import current_workspace
+
+STAGE_LABELS = {"read": "Reading", "parse": "Parsing", "split": "Chunking", "embed": "Embedding"}
+JOB_STATE_LABELS = {
+    "queued": "queued",
+    "parsing": "parsing",
+    "embedding": "embedding",
+    "done": "✅ done",
+    "failed": "❌ failed",
+    "cancelled": "cancelled",
+}
+
+# Jobs listed under the uploader, and how often they are refreshed while one is active
+JOBS_SHOWN = 3
+POLL_SECONDS = 1.0
 
 
 def tab_local_files():
@@ -19,54 +35,117 @@ def tab_local_files():
 
     if uploaded_file:
         if st.button("Process Documents"):
-            with st.spinner("Processing documents..."):
-                # Initialize or load vector store
-                if "vector_store" not in st.session_state or st.session_state["vector_store"] is None:
-                    vector_store = index_data() # Initializes Chroma DB
-                    st.session_state["vector_store"] = vector_store
-                else:
-                    vector_store = st.session_state["vector_store"]
-                
-                # Load data from uploaded files
-                documents = load_data(uploaded_file)
-                if not documents:
-                    st.warning("No documents could be loaded. Please check file types and content.")
-                    st.stop()
-                
-                # Chunk documents into nodes
-                nodes = chunk_data(documents) # Uses chunk settings from session state/Settings
-                if not nodes:
-                    st.error("Failed to chunk documents.")
-                    st.stop()
-
-                # Embed and index or upsert data
-                if "index" not in st.session_state or st.session_state["index"] is None:
-                    # Create new index if it doesn't exist
-                    index = embed_data(vector_store, nodes)
-                    if index is None:
-                        st.error("Failed to create index.")
-                        st.stop()
-                    st.session_state["index"] = index
-                else:
-                    # Upsert data into existing index
-                    index = upsert_data(nodes)
-                    if index is None:
-                        st.error("Failed to update index.")
-                        # Decide if we should stop or continue with the old index
-                        index = st.session_state["index"] # Fallback to existing index
-                    else:
-                         st.session_state["index"] = index # Update session state with new index object
-
-                # Create query engine from the index
-                # This function now correctly takes the index object
-                from utils.llama_index import create_query_engine 
-                query_engine = create_query_engine(index)
-                if query_engine:
-                     st.session_state["query_engine"] = query_engine # This might be redundant if create_query_engine sets it
-                     logs.log.info("Document Processing Completed")
-                     st.toast(f"{len(uploaded_file)} documents processed successfully!", icon="✅")
-                else:
-                    st.error("Failed to create query engine after processing documents.")
+            # The job runs on a background worker; this session only polls it
+            job_id = get_job_queue().submit(uploaded_file, ingest_options())
+            st.session_state["ingest_job_id"] = job_id
+            st.toast("Documents queued for processing.", icon="⏳")
+
+
+def ingest_options() -> dict:
+    """Ingestion settings of this session, captured when a job is submitted."""
+    chunk_size, chunk_overlap = get_chunk_settings()
+    return {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "concurrency": st.session_state["embedding_concurrency"],
+        "max_batch_tokens": st.session_state["embedding_batch_tokens"],
+        "parse_workers": st.session_state["parse_workers"],
+    }
+
+
+def ingestion_status():
+    """Recent ingestion jobs of every source in this workspace, and the stored documents."""
+    jobs = get_job_queue().recent(limit=JOBS_SHOWN, workspace=current_workspace())
+    if any(job["state"] in ACTIVE_STATES for job in jobs):
+        # Re-renders only this fragment every second while a job is active
+        st.fragment(run_every=POLL_SECONDS)(ingestion_jobs)(polling=True)
+    else:
+        ingestion_jobs()
 
     # Saved Documents View
     view_data() # Display status
+
+
+def ingestion_jobs(polling: bool = False):
+    """Shows recent ingestion jobs, and attaches the index once this session's job is done."""
+    jobs = get_job_queue().recent(limit=JOBS_SHOWN, workspace=current_workspace())
+    for job in jobs:
+        show_job(job)
+
+    own_job = next((job for job in jobs if job["id"] == st.session_state.get("ingest_job_id")), None)
+    if own_job is not None and own_job["state"] not in ACTIVE_STATES:
+        st.session_state["ingest_job_id"] = None
+        if own_job["state"] == "done":
+            finish_ingestion(own_job)
+        # Rerun the whole page, so polling stops and the chat input reflects the new state
+        st.rerun()
+    elif polling and not any(job["state"] in ACTIVE_STATES for job in jobs):
+        # A job started elsewhere (another tab, or resumed after a restart) has finished
+        if st.session_state.get("query_engine") is None and jobs and jobs[0]["state"] == "done":
+            finish_ingestion(jobs[0])
+        st.rerun()
+
+
+def show_job(job: dict):
+    if job["source"] == "local":
+        names = ", ".join(entry["name"] for entry in job["files"])
+    else:
+        # e.g. a repository: its name says more than hundreds of file names
+        names = f"{job['source'].split(':', 1)[-1]} ({len(job['files'])} files)"
+    label = f"{names[:60]}{'…' if len(names) > 60 else ''} — {JOB_STATE_LABELS[job['state']]}"
+    with st.container(border=True):
+        st.caption(label)
+        if job["state"] in ACTIVE_STATES:
+            for stage, (done, total) in (job["progress"] or {}).items():
+                fraction = min(done / total, 1.0) if total else 0.0
+                st.progress(fraction, text=f"{STAGE_LABELS[stage]}: {done}/{total}")
+            if job["cancel_requested"]:
+                st.caption("Cancelling…")
+            elif st.button("Cancel", key=f"cancel_{job['id']}"):
+                get_job_queue().cancel(job["id"])
+                st.rerun()
+        elif job["state"] == "done" and job["stats"]:
+            stats = job["stats"]
+            st.caption(
+                f"{stats['changed'] - len(stats['errors'])} processed, {stats['unchanged']} unchanged, "
+                f"{stats.get('nodes', 0)} chunks embedded in {job['finished_at'] - job['started_at']:.1f}s"
+            )
+            for splitter, sizes in (stats.get("chunk_sizes") or {}).items():
+                st.caption(
+                    f"{splitter}: {sizes['chunks']} chunks, median {sizes['p50']} tokens "
+                    f"(p90 {sizes['p90']}, max {sizes['max']})"
+                )
+            for error in stats["errors"]:
+                st.caption(f"⚠️ Skipped {error}")
+        elif job["state"] == "failed":
+            st.caption(f"❌ {job['error']}")
+
+
+def finish_ingestion(job: dict):
+    """Attaches this session to the updated vector store once its job is done."""
+    stats = job["stats"]
+    st.session_state["embedding_stats"] = stats
+    st.session_state["vector_store"] = index_data()
+
+    # Vectors are already in Chroma; every session of the workspace shares one index over them
+    index = st.session_state["index"] = get_index()
+
+    # Create query engine from the index
+    query_engine = create_query_engine(
+        index,
+        st.session_state["retrieval_mode"],
+        st.session_state["top_k"],
+        st.session_state["fetch_k"],
+        st.session_state["reranker"],
+        st.session_state["query_filters"],
+    )
+    if query_engine:
+        st.session_state["query_engine"] = query_engine
+        logs.log.info("Document Processing Completed")
+        st.toast(
+            f"{stats['changed'] - len(stats['errors'])} documents processed, {stats['unchanged']} unchanged, "
+            f"{stats.get('nodes', 0)} new chunks embedded.",
+            icon="✅",
+        )
+    else:
+        st.error("Failed to create query engine after processing documents.")
@@ -1,9 +1,33 @@
 import json
+import os
 
 import streamlit as st
 
 from datetime import datetime
 
+import utils.hnsw as hnsw
+import utils.llama_index as llama_index
+import utils.mistral as mistral
+from utils.llama_index import RERANKERS, RETRIEVAL_MODES
+from utils.locks import workspace_lock
+from utils.tracing import recorder
+from utils.workspaces import current_workspace, get_workspace_pool
+
+
+def rebuild_query_engine():
+    """Applies retrieval settings to the current index, if documents were already processed."""
+    if st.session_state.get("index") is not None:
+        # Re-resolved: the workspace may have been detached and re-attached since
+        st.session_state["index"] = llama_index.get_index()
+        st.session_state["query_engine"] = llama_index.create_query_engine(
+            st.session_state["index"],
+            st.session_state["retrieval_mode"],
+            st.session_state["top_k"],
+            st.session_state["fetch_k"],
+            st.session_state["reranker"],
+            st.session_state["query_filters"],
+        )
+
 
 def settings():
     st.header("Settings")
@@ -33,6 +57,94 @@ def settings():
         step=16,
         key="chunk_overlap",
     )
+    st.number_input(
+        "Parser Workers",
+        min_value=1,
+        max_value=max(1, os.cpu_count() or 1),
+        step=1,
+        key="parse_workers",
+        help="Number of processes used to parse documents (PDF extraction) in parallel.",
+    )
+    st.number_input(
+        "Embedding Concurrency",
+        min_value=1,
+        max_value=32,
+        step=1,
+        key="embedding_concurrency",
+        help="Number of embedding requests kept in flight. Lowered automatically when rate-limited.",
+    )
+    st.number_input(
+        "Embedding Batch Tokens",
+        min_value=512,
+        max_value=16000,
+        step=512,
+        key="embedding_batch_tokens",
+        help="Approximate token budget for each embedding request.",
+    )
+
+    st.divider()
+
+    st.subheader("Retrieval")
+    st.selectbox(
+        "Retrieval Mode",
+        options=RETRIEVAL_MODES,
+        format_func=lambda mode: {
+            "hybrid": "Hybrid (keywords + embeddings)",
+            "vector": "Embeddings only",
+            "lexical": "Keywords only (fast, no embedding call)",
+        }[mode],
+        key="retrieval_mode",
+        on_change=rebuild_query_engine,
+    )
+    st.number_input(
+        "Top K",
+        min_value=1,
+        max_value=20,
+        step=1,
+        key="top_k",
+        on_change=rebuild_query_engine,
+        help="Number of chunks sent to the LLM as context.",
+    )
+    st.selectbox(
+        "Reranker",
+        options=RERANKERS,
+        format_func=lambda reranker: {
+            "none": "None",
+            "cross-encoder": "Cross-encoder (local, CPU)",
+            "llm": "LLM scoring (small Mistral model)",
+        }[reranker],
+        key="reranker",
+        on_change=rebuild_query_engine,
+        help="Reorders a larger candidate set so that only the most relevant chunks reach the LLM.",
+    )
+    st.number_input(
+        "Fetch K",
+        min_value=1,
+        max_value=100,
+        step=1,
+        key="fetch_k",
+        on_change=rebuild_query_engine,
+        disabled=st.session_state["reranker"] == "none",
+        help="Candidates retrieved for the reranker to choose the top k from.",
+    )
+
+    st.divider()
+
+    st.subheader("Answer Cache")
+    st.caption("Repeated questions are answered from cache until the documents change.")
+    st.toggle(
+        "Semantic Matching",
+        key="answer_cache_semantic",
+        help="Also reuse answers for differently worded questions with a similar embedding.",
+    )
+    st.slider(
+        "Similarity Threshold",
+        min_value=0.80,
+        max_value=1.0,
+        step=0.01,
+        key="answer_cache_threshold",
+        disabled=not st.session_state["answer_cache_semantic"],
+    )
 
     st.divider()
 
@@ -61,3 +173,117 @@ def settings():
         with st.expander("Current Application State"):
             state = dict(sorted(st.session_state.items()))
             st.write(state)
+
+        if st.session_state.get("embedding_stats"):
+            with st.expander("Last Ingestion Run"):
+                st.write(st.session_state["embedding_stats"])
+
+        with st.expander("Workspaces"):
+            st.caption("Workspaces attached to this server, most recently used first.")
+            st.write(get_workspace_pool().stats())
+
+        with st.expander("Answer Cache"):
+            st.write(llama_index.get_answer_cache().stats())
+
+        with st.expander("Embedding Cache"):
+            embedding_cache = mistral.get_embedding_cache()
+            st.write(embedding_cache.stats())
+            if st.button("Clear Embedding Cache"):
+                embedding_cache.clear()
+                st.toast("Embedding cache cleared.", icon="🧹")
+
+        with st.expander("Vector Store"):
+            st.caption(f"Backend: {llama_index.VECTOR_STORE}, compression: {llama_index.VECTOR_COMPRESSION}")
+            if llama_index.VECTOR_STORE == "chroma" and llama_index.VECTOR_COMPRESSION == "none":
+                st.caption("Set LOCAL_RAG_VECTOR_STORE=numpy or LOCAL_RAG_VECTOR_COMPRESSION to float16 or int8 for memory-mapped search.")
+            else:
+                vector_store = llama_index.index_data()
+                st.write(vector_store.quantized_index.stats())
+                if st.button("Compact Vector Store"):
+                    # Compaction renumbers rows; queries of other sessions wait for it
+                    with workspace_lock(current_workspace()).write():
+                        dropped = sum(llama_index.index_data(partition).compact() for partition in partitions())
+                    st.toast(f"Dropped {dropped} deleted vectors.", icon="🧹")
+
+        if llama_index.VECTOR_STORE == "chroma":
+            with st.expander("Vector Index (HNSW)"):
+                hnsw_settings()
+
+        with st.expander("Query Latency"):
+            summary = recorder.summary()
+            if not summary:
+                st.caption("No queries yet.")
+            else:
+                st.caption("Milliseconds per stage over recent queries; tokens/sec for the answer stream.")
+                st.dataframe(summary)
+                st.write("Last query", recorder.recent(limit=1)[0])
+                timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+                st.download_button(
+                    label="Download JSONL",
+                    data=recorder.to_jsonl(),
+                    file_name=f"local-rag-query-traces-{timestamp}.jsonl",
+                    mime="application/jsonl",
+                )
+                st.download_button(
+                    label="Download Prometheus Metrics",
+                    data=recorder.to_prometheus(),
+                    file_name=f"local-rag-query-metrics-{timestamp}.prom",
+                    mime="text/plain",
+                )
+
+
+def partitions() -> list:
+    """The shared collection (``None``) and every per-source partition."""
+    return [None] + sorted(set(llama_index.get_registry().partition_map().values()))
+
+
+def hnsw_settings():
+    """HNSW parameters of the workspace's Chroma collection; changing most of them needs a rebuild."""
+    vector_store = llama_index.index_data()
+    collection = vector_store.client
+    current = hnsw.collection_hnsw(collection)
+    st.write({"vectors": collection.count(), **current})
+
+    space = st.selectbox("Distance Metric", options=hnsw.HNSW_SPACES, index=hnsw.HNSW_SPACES.index(current["space"]))
+    max_neighbors = st.number_input(
+        "M (max neighbors)", min_value=4, max_value=128, value=current["max_neighbors"],
+        help="Graph links per vector. Higher improves recall and costs memory and build time.",
+    )
+    ef_construction = st.number_input(
+        "ef_construction", min_value=8, max_value=2000, value=current["ef_construction"],
+        help="Candidate list size while building the graph. Higher builds a better graph, more slowly.",
+    )
+    ef_search = st.number_input(
+        "ef_search", min_value=1, max_value=2000, value=current["ef_search"],
+        help="Candidate list size per query. Higher improves recall and costs latency.",
+    )
+
+    if st.button(
+        "Save ef_search",
+        disabled=ef_search == current["ef_search"],
+        help="Takes effect when the app restarts, without a rebuild. Rebuild to apply it now.",
+    ):
+        with workspace_lock(current_workspace()).write():
+            hnsw.set_ef_search(collection, ef_search)
+        st.rerun()
+
+    config = {"space": space, "max_neighbors": max_neighbors, "ef_construction": ef_construction, "ef_search": ef_search}
+    if st.button(
+        "Rebuild Collection",
+        help="Re-indexes the stored vectors with these parameters, without re-embedding. Also drops deleted entries from the graph.",
+    ):
+        progress = st.progress(0.0, text="Rebuilding collection...")
+        vectors = 0
+        try:
+            # Per-source partitions get the same parameters as the shared collection
+            for partition in partitions():
+                stats = llama_index.rebuild_vector_index(
+                    llama_index.index_data(partition),
+                    config,
+                    on_batch=lambda done, total: progress.progress(done / total, text=f"Copied {done}/{total} vectors"),
+                )
+                vectors += stats["vectors"]
+        finally:
+            progress.empty()
+        st.toast(f"Rebuilt {len(partitions())} collection(s) with {vectors} vectors.", icon="✅")
+        st.rerun()
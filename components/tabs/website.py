@@ -1,35 +1,69 @@
 import streamlit as st
 
+import utils.crawler as crawler
+import utils.logs as logs
+from components.tabs.local_files import ingest_options
+from utils.jobs import get_job_queue
+from utils.llama_index import get_registry
+from utils.workspaces import current_workspace, data_dir
 
-def website():
-    # if st.session_state["selected_model"] is not None:
-    #     st.text_input(
-    #         "Clone a website",
-    #         placeholder="https://ollama.com/blog",
-    #     )
-    #     st.button(
-    #         "Copy",
-    #     )
-    # else:
-    #     st.text_input(
-    #         "Clone a website",
-    #         placeholder="https://ollama.com/blog",
-    #         disabled=True,
-    #     )
-    #     st.button(
-    #         "Copy",
-    #         disabled=True,
-    #     )
 
-    # css_example = '''
-    # I'm importing the font-awesome icons as a stylesheet!
-    # <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.0/css/all.min.css">
+def website():
+    seed_url = st.text_input(
+        "Enter Website URL",
+        placeholder="https://docs.mistral.ai/",
+        help="Links on the same host and under this path are followed.",
+    )
+    col_depth, col_pages = st.columns(2)
+    max_depth = col_depth.number_input(
+        "Link Depth",
+        min_value=0,
+        max_value=10,
+        value=crawler.DEFAULT_MAX_DEPTH,
+        help="How many links away from the start page to follow. 0 ingests only the start page.",
+    )
+    max_pages = col_pages.number_input(
+        "Max Pages",
+        min_value=1,
+        max_value=5000,
+        value=crawler.DEFAULT_MAX_PAGES,
+        help="Upper bound on the pages fetched in one crawl.",
+    )
 
-    # <i class="fa-brands fa-github"></i>
-    # <i class="fa-solid fa-dragon"></i>
-    # <i class="fa-solid fa-paw"></i>
-    # '''
+    if st.button("Crawl Website"):
+        if not seed_url:
+            st.warning("Please enter a website URL.")
+            return
+        options = ingest_options()
+        try:
+            with st.spinner("Crawling website..."):
+                source, pages, stats = crawler.crawl_site(
+                    seed_url,
+                    int(max_depth),
+                    int(max_pages),
+                    registry=get_registry(),
+                    chunk_settings=(options["chunk_size"], options["chunk_overlap"]),
+                    crawl_dir=data_dir(current_workspace(), "crawl"),
+                )
+        except ValueError as e:
+            logs.log.error(f"Website crawling error: {e}")
+            st.error(f"Failed to crawl website: {e}")
+            return
 
-    # st.write(css_example, unsafe_allow_html=True)
+        st.session_state["crawl_stats"] = stats
+        if not pages:
+            # Submitting an empty set would prune every stored page of the site
+            st.warning("No pages with text could be fetched from this URL.")
+            return
+        # Every reached page goes into the job, so pages gone from the site are pruned;
+        # pages that were not modified are skipped by their fingerprint without being read
+        st.session_state["ingest_job_id"] = get_job_queue().submit(pages, options, source=source, prune=True)
+        st.toast(f"Website '{stats['site']}' queued: {stats['changed']} new or changed pages.", icon="⏳")
 
-    st.write(":grey[Coming Soon&trade;]")
+    stats = st.session_state.get("crawl_stats")
+    if stats:
+        st.caption(
+            f"{stats['site']}: {stats['pages']} pages in {stats['seconds']}s, {stats['changed']} new or changed. "
+            f"{stats['not_modified']} not modified, {stats['robots']} disallowed by robots.txt, "
+            f"{stats['skipped']} skipped and {stats['errors']} failed."
+        )
@@ -0,0 +1,52 @@
+import streamlit as st
+
+import utils.logs as logs
+from utils.workspaces import DEFAULT_WORKSPACE, create_workspace, list_workspaces
+
+# Session state that belongs to one workspace, reset when switching to another
+WORKSPACE_SESSION_KEYS = ["query_engine", "index", "vector_store", "ingest_job_id", "embedding_stats",
+                          "github_stats", "crawl_stats"]
+SCOPE_WIDGET_KEYS = ["scope_sources", "scope_documents", "scope_file_types", "scope_uploaded_since"]
+
+
+def workspace_picker():
+    """Selects the workspace this session works in, or creates a new one."""
+    workspaces = list_workspaces()
+    if st.session_state["workspace"] not in workspaces:
+        # Removed from disk since it was selected
+        st.session_state["workspace"] = DEFAULT_WORKSPACE
+    st.selectbox(
+        "Workspace",
+        options=workspaces,
+        key="workspace",
+        on_change=switch_workspace,
+        help="Each workspace has its own documents, index and answer cache.",
+    )
+    with st.popover("New Workspace", use_container_width=True):
+        st.text_input("Name", key="new_workspace", placeholder="team-docs", help="Lower-case letters, digits, - and _.")
+        st.button("Create", on_click=add_workspace)
+    if st.session_state.get("workspace_error"):
+        st.error(st.session_state.pop("workspace_error"))
+
+
+def add_workspace():
+    name = (st.session_state.get("new_workspace") or "").strip()
+    try:
+        create_workspace(name)
+    except ValueError as e:
+        st.session_state["workspace_error"] = str(e)
+        return
+    st.session_state["new_workspace"] = ""
+    st.session_state["workspace"] = name
+    switch_workspace()
+
+
+def switch_workspace():
+    """Drops this session's index, query engine and search scope, which belong to the previous workspace."""
+    for key in WORKSPACE_SESSION_KEYS:
+        st.session_state[key] = None
+    for key in SCOPE_WIDGET_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state["query_filters"] = {}
+    st.session_state["messages"] = [{"role": "assistant", "content": "How can I help you?"}]
+    logs.log.info("Switched to workspace %s", st.session_state["workspace"])
@@ -1,13 +1,16 @@
+import os
 import sys
 
 # Patch sqlite3 for ChromaDB compatibility on Streamlit Cloud
 # Based on https://docs.trychroma.com/troubleshooting#sqlite
-try:
-    __import__("pysqlite3")
-    sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
-    print("Successfully patched sqlite3 with pysqlite3.") # Optional: Add print for confirmation
-except ImportError:
-    print("pysqlite3 not found, skipping patch.") # Optional: Print if not found (e.g., local dev)
+# Not needed with the NumPy vector store (LOCAL_RAG_VECTOR_STORE=numpy), which doesn't use SQLite
+if os.environ.get("LOCAL_RAG_VECTOR_STORE", "chroma") != "numpy":
+    try:
+        __import__("pysqlite3")
+        sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
+        print("Successfully patched sqlite3 with pysqlite3.") # Optional: Add print for confirmation
+    except ImportError:
+        print("pysqlite3 not found, skipping patch.") # Optional: Print if not found (e.g., local dev)
 
 import time
 
@@ -22,9 +25,10 @@ import components.sidebar
 from components.page_config import set_page_config
 from components.page_state import set_initial_state
 import utils.mistral as mistral
+from utils.helpers import warm_up_imports
 
-### Configure LlamaIndex Global Settings with Mistral
-mistral.configure_global_settings()
+### Check the Mistral configuration; the clients themselves are built on first use
+mistral.get_mistral_api_key()
 
 def generate_welcome_message(msg):
     for char in msg:
@@ -52,3 +56,6 @@ components.sidebar.sidebar()
 
 ### Chat Box
 chatbox()
+
+### Import what the first query or ingestion needs, now that the page is up
+warm_up_imports()
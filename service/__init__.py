@@ -0,0 +1 @@
+# This file makes Python treat the 'service' directory as a package.
@@ -0,0 +1,310 @@
+"""
+Headless ingestion and query service.
+
+One process holds the vector stores, indexes and query engines and serves every
+client, instead of each Streamlit session building its own:
+
+    uvicorn service.app:app --host 0.0.0.0 --port 8000
+    python -m service.app --port 8000
+
+Endpoints:
+
+- ``POST /ingest``: multipart upload of one or more ``files``. Unchanged files
+  are skipped; with ``prune=true`` the upload replaces every document of the
+  ``source``. The ``workspace`` form field (default ``default``) selects the
+  workspace, which is created if needed. Returns the ingestion stats once the
+  vectors are stored.
+- ``POST /query``: ``{"prompt": ..., "workspace": ..., "retrieval_mode": ..., "top_k": ...,
+  "reranker": ..., "fetch_k": ..., "filters": ...}``; the answer is streamed back as plain text, with the query's trace id in the
+  ``X-Query-Id`` header. ``filters`` limits retrieval by chunk metadata, e.g.
+  ``{"sources": ["github:owner/repo"], "file_types": ["py"]}`` (see
+  ``utils.llama_index.QUERY_FILTERS``).
+- ``GET /status?workspace=...``: document/chunk counts, index version and cache
+  stats of a workspace.
+- ``GET /workspaces``: every workspace, and those attached to this process
+  with their estimated memory (see ``utils.workspaces``).
+- ``GET /metrics``: per-stage query latencies in the Prometheus text format.
+
+Configuration (``MISTRAL_API_KEY``, ``MISTRAL_ENDPOINT``) is read the same way
+as in the Streamlit app. ``client.py`` is a thin Streamlit front end for it.
+"""
+
+import argparse
+import asyncio
+import io
+import time
+import uuid
+from contextlib import ExitStack, asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+import utils.logs as logs
+import utils.mistral as mistral
+from utils.answer_cache import replay
+from utils.embedding_pipeline import DEFAULT_CONCURRENCY, DEFAULT_MAX_BATCH_TOKENS
+from utils.helpers import silence_bare_mode_warnings
+from utils.ingest import ingest_files
+from utils.llama_index import (DEFAULT_FETCH_K, DEFAULT_TOP_K, QUERY_FILTERS, RERANKERS, answer_scope,
+                               assign_partition, create_query_engine, get_answer_cache, get_chunk_settings, get_index,
+                               get_lexical_index, get_registry, index_data)
+from utils.parsing import DEFAULT_PARSE_WORKERS
+from utils.retrievers import RETRIEVAL_MODES
+from utils.tracing import QueryTrace, recorder
+from utils.workspaces import (DEFAULT_WORKSPACE, create_workspace, get_workspace_pool, list_workspaces,
+                              validate_workspace, workspace_exists)
+
+# The app's helpers run here without a Streamlit script
+silence_bare_mode_warnings()
+
+
+class UploadedBytes(io.BytesIO):
+    """In-memory upload with the ``name``/``getbuffer()`` interface of Streamlit's UploadedFile."""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+
+
+class QueryRequest(BaseModel):
+    prompt: str
+    workspace: str = DEFAULT_WORKSPACE
+    retrieval_mode: str = "hybrid"
+    top_k: int = DEFAULT_TOP_K
+    reranker: str = "none"
+    fetch_k: int = DEFAULT_FETCH_K
+    filters: Optional[Dict[str, Any]] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mistral.configure_global_settings()
+    # Indexes are resolved per request from the workspace pool, which detaches idle workspaces
+    # Ingestion runs are serialized; queries keep being served meanwhile (see utils/locks.py)
+    app.state.ingest_lock = asyncio.Lock()
+    app.state.last_ingest = None
+    app.state.started = time.time()
+    logs.log.info("RAG service ready")
+    yield
+
+
+app = FastAPI(title="Mistral RAG service", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    # Log records and query traces carry these ids; clients may pass their own
+    request_token = logs.request_id.set(request.headers.get("X-Request-Id") or uuid.uuid4().hex)
+    session_token = logs.session_id.set(request.headers.get("X-Session-Id"))
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-Id"] = logs.request_id.get()
+        return response
+    finally:
+        logs.session_id.reset(session_token)
+        logs.request_id.reset(request_token)
+
+
+def checked_workspace(name: str, create: bool = False) -> str:
+    """The workspace name, or an HTTP error if it is invalid or (unless created) missing."""
+    try:
+        validate_workspace(name)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if create:
+        return create_workspace(name)
+    if not workspace_exists(name):
+        raise HTTPException(status_code=404, detail=f"Workspace '{name}' does not exist")
+    return name
+
+
+###################################
+#
+# Ingestion
+#
+###################################
+
+
+def ingest_into_workspace(uploads: List[UploadedBytes], workspace: str, source: str, **options) -> Dict:
+    """Ingests uploads into the partition of the workspace that ``source`` is assigned to."""
+    with get_workspace_pool().use(workspace):
+        registry = get_registry(workspace)
+        partition = assign_partition(registry, source, len(uploads))
+        vector_store = index_data(partition, workspace)
+        return ingest_files(
+            uploads,
+            vector_store,
+            registry,
+            source=source,
+            lexical_index=get_lexical_index(vector_store, partition, workspace),
+            **options,
+        )
+
+
+@app.post("/ingest")
+async def ingest(
+    files: List[UploadFile] = File(...),
+    source: str = Form("local"),
+    workspace: str = Form(DEFAULT_WORKSPACE),
+    prune: bool = Form(False),
+    chunk_size: Optional[int] = Form(None),
+    chunk_overlap: Optional[int] = Form(None),
+    concurrency: int = Form(DEFAULT_CONCURRENCY),
+    max_batch_tokens: int = Form(DEFAULT_MAX_BATCH_TOKENS),
+    parse_workers: int = Form(DEFAULT_PARSE_WORKERS),
+):
+    workspace = checked_workspace(workspace, create=True)
+    uploads = [UploadedBytes(upload.filename, await upload.read()) for upload in files]
+    chunk_size, chunk_overlap = get_chunk_settings(chunk_size, chunk_overlap)
+
+    async with app.state.ingest_lock:
+        try:
+            # Loading the workspace and the pipeline block; keep the event loop free for queries
+            stats = await asyncio.to_thread(
+                ingest_into_workspace,
+                uploads,
+                workspace,
+                source,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                prune=prune,
+                concurrency=concurrency,
+                max_batch_tokens=max_batch_tokens,
+                parse_workers=parse_workers,
+            )
+        except Exception as e:
+            logs.log.error("Service ingestion failed: %s", e)
+            raise HTTPException(status_code=500, detail=f"Ingestion failed: {e}")
+
+    stats["finished_at"] = time.time()
+    stats["workspace"] = workspace
+    app.state.last_ingest = stats
+    return stats
+
+
+###################################
+#
+# Query
+#
+###################################
+
+
+@app.post("/query")
+def query(request: QueryRequest):
+    # A plain `def` endpoint runs in FastAPI's thread pool, so blocking retrieval is fine here
+    if request.retrieval_mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=422, detail=f"retrieval_mode must be one of {RETRIEVAL_MODES}")
+    if request.reranker not in RERANKERS:
+        raise HTTPException(status_code=422, detail=f"reranker must be one of {RERANKERS}")
+    unknown = set(request.filters or {}) - set(QUERY_FILTERS)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"filters must be among {list(QUERY_FILTERS)}")
+    workspace = checked_workspace(request.workspace)
+
+    # The workspace stays attached until the answer has streamed (released in stream() below)
+    pinned = ExitStack()
+    pinned.enter_context(get_workspace_pool().use(workspace))
+    try:
+        return answer(request, workspace, pinned)
+    except BaseException:
+        pinned.close()
+        raise
+
+
+def answer(request: QueryRequest, workspace: str, pinned: ExitStack) -> StreamingResponse:
+    answer_cache = get_answer_cache(workspace)
+    index_version = get_registry(workspace).version
+    scope = answer_scope(request.filters, request.retrieval_mode, request.top_k, request.fetch_k, request.reranker)
+    trace = QueryTrace("service", retrieval_mode=request.retrieval_mode, top_k=request.top_k, reranker=request.reranker)
+    headers = {"X-Query-Id": trace.id}
+    cached = answer_cache.get(index_version, request.prompt, scope=scope)
+    if cached is not None:
+        trace.labels["cache"] = "hit"
+        pinned.close()
+        return StreamingResponse(
+            trace.stream(replay(cached)), media_type="text/plain; charset=utf-8", headers={**headers, "X-Answer-Cache": "hit"}
+        )
+
+    trace.labels["cache"] = "miss"
+    query_engine = create_query_engine(
+        get_index(workspace=workspace),
+        request.retrieval_mode,
+        request.top_k,
+        request.fetch_k,
+        request.reranker,
+        request.filters,
+        workspace,
+    )
+    if query_engine is None:
+        raise HTTPException(status_code=500, detail="Query engine could not be created")
+    try:
+        with trace:
+            response = query_engine.query(request.prompt)
+    except Exception as e:
+        logs.log.error("Service query failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+    def stream():
+        with pinned:
+            tokens = []
+            for token in trace.stream(response.response_gen):
+                tokens.append(token)
+                yield token
+            answer_cache.put(index_version, request.prompt, "".join(tokens), scope=scope)
+
+    return StreamingResponse(
+        stream(), media_type="text/plain; charset=utf-8", headers={**headers, "X-Answer-Cache": "miss"}
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Query stage latencies in the Prometheus text format."""
+    return PlainTextResponse(recorder.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+###################################
+#
+# Status
+#
+###################################
+
+
+@app.get("/status")
+def status(workspace: str = DEFAULT_WORKSPACE):
+    workspace = checked_workspace(workspace)
+    registry = get_registry(workspace)
+    return {
+        "workspace": workspace,
+        "documents": len(registry.snapshot()),
+        "nodes": registry.node_count(),
+        "sources": registry.sources(),
+        "partitions": registry.partition_map(),
+        "index_version": registry.version,
+        "ingesting": app.state.ingest_lock.locked(),
+        "last_ingest": app.state.last_ingest,
+        "answer_cache": get_answer_cache(workspace).stats(),
+        "uptime_seconds": round(time.time() - app.state.started, 1),
+    }
+
+
+@app.get("/workspaces")
+def workspaces():
+    return {"workspaces": list_workspaces(), **get_workspace_pool().stats()}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the headless RAG service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    # A single worker: the indexes, caches and Chroma clients live in this process
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import json
+import unicodedata
+
+from utils.bm25 import BM25Index, tokenize
+
+
+def build_index(path: str, texts: dict) -> BM25Index:
+    index = BM25Index(path)
+    for node_id, text in texts.items():
+        index.add_text(node_id, text)
+    return index
+
+
+def test_identifiers_are_kept_whole_and_split():
+    tokens = tokenize("Call load_index_from_storage on ERR-404")
+    assert "load_index_from_storage" in tokens
+    assert "storage" in tokens
+    assert "err-404" in tokens and "404" in tokens
+
+
+def test_non_ascii_words_are_single_tokens():
+    assert tokenize("Café Müller") == ["café", "müller"]
+    # A decomposed accent is the same word
+    assert tokenize(unicodedata.normalize("NFD", "café")) == ["café"]
+    assert tokenize("Поиск по документам") == ["поиск", "по", "документам"]
+    assert "東京" in tokenize("東京タワーに行く")
+
+
+def test_non_ascii_query_finds_its_document(tmp_path):
+    index = build_index(
+        str(tmp_path / "bm25.json"),
+        {
+            "de": "Die Rechnung von Müller liegt im Café",
+            "ru": "Полнотекстовый поиск по документам",
+            "el": "Η αναζήτηση κειμένου",
+            "ja": "東京タワーの営業時間",
+            "en": "The quarterly report is attached",
+        },
+    )
+    assert index.search("müller", top_k=1)[0][0] == "de"
+    assert index.search("поиск", top_k=1)[0][0] == "ru"
+    assert index.search("Αναζήτηση", top_k=1)[0][0] == "el"
+    assert index.search("東京の営業時間は", top_k=1)[0][0] == "ja"
+
+
+def test_index_of_another_tokenizer_starts_empty(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"postings": {"caf": {"n1": 1}}, "doc_lengths": {"n1": 2}}, f)
+    assert len(BM25Index(path)) == 0
+
+    build_index(path, {"n1": "café"}).save()
+    assert BM25Index(path).search("café")[0][0] == "n1"
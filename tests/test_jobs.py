@@ -0,0 +1,62 @@
+import json
+import sqlite3
+import threading
+import time
+
+from utils.jobs import MAX_ATTEMPTS, JobQueue
+
+
+def insert_job(path: str, job_id: str, state: str = "queued", attempts: int = 0) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "INSERT INTO jobs (id, state, source, prune, files, options, attempts, created_at)"
+        " VALUES (?, ?, 'local', 0, ?, ?, ?, ?)",
+        (job_id, state, json.dumps([]), json.dumps({}), attempts, time.time()),
+    )
+    conn.commit()
+    conn.close()
+
+
+def wait_for(queue: JobQueue, job_id: str, condition, timeout: float = 10.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if condition(job):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} never reached the expected state: {queue.get(job_id)}")
+
+
+def test_job_interrupted_max_attempts_times_fails_on_restart(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    never = threading.Event()
+    # Each "process" dies while running the job: its runner never returns
+    hang = lambda job, on_progress: never.wait()
+
+    queue = JobQueue(path, runner=hang)
+    insert_job(path, "crashy")
+    queue._wake.set()
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        wait_for(queue, "crashy", lambda job: job["state"] == "parsing" and job["attempts"] == attempt)
+        if attempt < MAX_ATTEMPTS:
+            # Restart: the new queue requeues the interrupted job and runs it again
+            queue = JobQueue(path, runner=hang)
+
+    ran = []
+    queue = JobQueue(path, runner=lambda job, on_progress: ran.append(job["id"]) or {})
+    job = queue.get("crashy")
+    assert job["state"] == "failed"
+    assert job["error"] and job["finished_at"]
+    time.sleep(0.2)
+    assert ran == []
+
+
+def test_interrupted_job_below_max_attempts_is_resumed(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    JobQueue(path, runner=lambda job, on_progress: {})
+    insert_job(path, "interrupted", state="embedding", attempts=MAX_ATTEMPTS - 1)
+
+    queue = JobQueue(path, runner=lambda job, on_progress: {"nodes": 0})
+    job = wait_for(queue, "interrupted", lambda job: job["state"] == "done")
+    assert job["attempts"] == MAX_ATTEMPTS
+    assert job["stats"] == {"nodes": 0}
@@ -0,0 +1,148 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+import utils.logs as logs
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+###################################
+#
+# Prompt Normalization
+#
+###################################
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt, ignoring trailing punctuation."""
+    return re.sub(r"\s+", " ", prompt).strip().lower().rstrip("?!. ")
+
+
+def replay(answer: str, delay: float = 0.0) -> Iterator[str]:
+    """Yields a cached answer word by word, so it can go through ``st.write_stream``."""
+    for token in re.findall(r"\S+\s*|\s+", answer):
+        yield token
+        if delay:
+            time.sleep(delay)
+
+
+###################################
+#
+# Answer Cache
+#
+###################################
+
+
+class AnswerCache:
+    """
+    LRU cache of chat answers for one index version.
+
+    Exact hits are keyed by the normalized prompt. The optional semantic tier
+    compares the prompt's embedding against cached prompts and reuses an answer
+    when the cosine similarity reaches ``threshold``.
+
+    All entries belong to a single index version: looking up or storing with a
+    different version drops everything, since answers may cite removed documents
+    or miss new ones. Answers are also kept per ``scope`` (e.g. the query's
+    metadata filters), and only prompts of the same scope match.
+
+    Args:
+        max_entries (int): Maximum number of cached answers.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.index_version = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._answers: "OrderedDict[str, str]" = OrderedDict()
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def _check_version(self, index_version) -> None:
+        """Invalidates everything if the index changed. Caller holds the lock."""
+        if index_version != self.index_version:
+            if self._answers:
+                logs.log.info("Index changed to version %s, dropping %d cached answers", index_version, len(self._answers))
+            self._answers.clear()
+            self._embeddings.clear()
+            self.index_version = index_version
+
+    def get(
+        self,
+        index_version,
+        prompt: str,
+        embedding: Optional[List[float]] = None,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        scope: str = "",
+    ) -> Optional[str]:
+        """Returns a cached answer for the prompt, or ``None`` on a miss."""
+        key = _cache_key(prompt, scope)
+        with self._lock:
+            self._check_version(index_version)
+            if key in self._answers:
+                self._answers.move_to_end(key)
+                self.hits += 1
+                return self._answers[key]
+
+            keys = [k for k in self._embeddings if k.startswith(scope + "\x00")] if embedding is not None else []
+            if keys:
+                matrix = np.stack([self._embeddings[k] for k in keys])
+                scores = matrix @ _unit(embedding)
+                best = int(np.argmax(scores))
+                if scores[best] >= threshold:
+                    match = keys[best]
+                    self._answers.move_to_end(match)
+                    self.semantic_hits += 1
+                    logs.log.info("Semantic answer cache hit (%.3f) for '%s'", scores[best], prompt[:60])
+                    return self._answers[match]
+
+            self.misses += 1
+            return None
+
+    def put(
+        self, index_version, prompt: str, answer: str, embedding: Optional[List[float]] = None, scope: str = ""
+    ) -> None:
+        """Caches an answer, evicting the least recently used one if full."""
+        key = _cache_key(prompt, scope)
+        with self._lock:
+            self._check_version(index_version)
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            if embedding is not None:
+                self._embeddings[key] = _unit(embedding)
+            while len(self._answers) > self.max_entries:
+                evicted, _ = self._answers.popitem(last=False)
+                self._embeddings.pop(evicted, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._answers.clear()
+            self._embeddings.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._answers),
+            "index_version": self.index_version,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+
+def _cache_key(prompt: str, scope: str) -> str:
+    return f"{scope}\x00{normalize_prompt(prompt)}"
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
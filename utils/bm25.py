@@ -0,0 +1,167 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+import utils.logs as logs
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Identifiers such as `load_index_from_storage`, `utils.logs` or `ERR-404` are kept
+# whole, and their parts are indexed as well so partial matches still score.
+# Words of any script count, e.g. `café`, `Müller` or `поиск`
+_TOKEN_PATTERN = re.compile(r"\w+(?:[.\-]\w+)*")
+_PART_PATTERN = re.compile(r"[._\-]")
+# Scripts written without spaces (CJK); their runs are also indexed as character bigrams
+_UNSPACED_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]{2,}")
+
+# Stored with the index; an index written by another tokenizer is rebuilt from the vector store
+TOKENIZER_VERSION = 2
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    # NFKC joins combining accents and folds full-width forms, so both spellings match
+    for token in _TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold()):
+        tokens.append(token)
+        parts = [part for part in _PART_PATTERN.split(token) if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+        for run in _UNSPACED_PATTERN.findall(token):
+            if len(run) < len(token) or len(run) > 2:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+###################################
+#
+# BM25 Inverted Index
+#
+###################################
+
+
+class BM25Index:
+    """
+    Local inverted index over the same nodes that are stored in the vector store.
+
+    Only postings (term -> node id -> term frequency) and document lengths are
+    kept; node text and metadata are fetched from the vector store by id. The
+    index is a JSON file next to the Chroma data and is updated incrementally
+    as nodes are upserted or deleted.
+
+    Args:
+        path (str): Location of the index JSON file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        # Forward index (node id -> its terms) so deletes only touch the affected postings
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._total_length = 0
+        # Bumped on every change, so callers can cache what they derived from the index
+        self.generation = 0
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("tokenizer", 1) != TOKENIZER_VERSION:
+                    logs.log.info(f"BM25 index at {path} was built by another tokenizer, starting empty")
+                else:
+                    self.postings = data["postings"]
+                    self.doc_lengths = data["doc_lengths"]
+                    self._total_length = sum(self.doc_lengths.values())
+                    for term, docs in self.postings.items():
+                        for node_id in docs:
+                            self._doc_terms.setdefault(node_id, []).append(term)
+            except (OSError, ValueError, KeyError) as e:
+                logs.log.error(f"Could not read BM25 index at {path}, starting empty: {e}")
+        logs.log.info(f"BM25 index loaded with {len(self.doc_lengths)} nodes and {len(self.postings)} terms")
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, nodes: Iterable) -> None:
+        """Indexes nodes (anything with ``node_id`` and ``get_content()``); re-adding replaces."""
+        with self._lock:
+            for node in nodes:
+                self.add_text(node.node_id, node.get_content())
+
+    def add_text(self, node_id: str, text: str) -> None:
+        with self._lock:
+            self.generation += 1
+            if node_id in self.doc_lengths:
+                self._remove_one(node_id)
+            tokens = tokenize(text)
+            counts = Counter(tokens)
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[node_id] = count
+            self._doc_terms[node_id] = list(counts)
+            self.doc_lengths[node_id] = len(tokens)
+            self._total_length += len(tokens)
+
+    def remove(self, node_ids: Iterable[str]) -> None:
+        with self._lock:
+            self.generation += 1
+            for node_id in node_ids:
+                if node_id in self.doc_lengths:
+                    self._remove_one(node_id)
+
+    def _remove_one(self, node_id: str) -> None:
+        for term in self._doc_terms.pop(node_id, []):
+            del self.postings[term][node_id]
+            if not self.postings[term]:
+                del self.postings[term]
+        self._total_length -= self.doc_lengths.pop(node_id)
+
+    def search(self, query: str, top_k: int = 10, only_ids: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to ``top_k`` (node id, BM25 score) pairs, best first.
+
+        With ``only_ids`` (e.g. the nodes matching a metadata filter) only those
+        nodes are scored; term statistics still cover the whole index.
+        """
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for node_id, tf in docs.items():
+                    if only_ids is not None and node_id not in only_ids:
+                        continue
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[node_id] / avg_length)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self._doc_terms.clear()
+            self._total_length = 0
+
+    def save(self) -> None:
+        """Atomically writes the index back to disk."""
+        with self._lock:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"tokenizer": TOKENIZER_VERSION, "postings": self.postings, "doc_lengths": self.doc_lengths}, f)
+            os.replace(tmp_path, self.path)
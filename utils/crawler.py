@@ -0,0 +1,617 @@
+"""
+Website ingestion: a same-site crawler with a bounded concurrent fetcher.
+
+Starting from a seed URL, links on the same host (and under the seed's path)
+are followed breadth-first up to ``max_depth`` links away and ``max_pages``
+pages in total. Pages are fetched by a few workers sharing one pooled
+``httpx.AsyncClient``. Each host gets at most ``PER_HOST_CONCURRENCY`` requests
+at a time, spaced by its ``robots.txt`` crawl delay (or ``CRAWL_DELAY``), and
+``robots.txt`` disallow rules are honoured.
+
+Each page's main text is extracted as Markdown (headings, lists and code blocks
+kept; navigation, headers, footers and scripts dropped). The page is ingested as
+``<path>.md``, so the Markdown splitter chunks it by its headings. Its
+``ETag``/``Last-Modified`` validators, content hash and outgoing links are kept
+in a crawl state file under ``data/crawl``. A re-crawl sends conditional
+requests for pages the registry already holds. A ``304 Not Modified`` page is
+neither downloaded nor parsed, and its stored links are followed instead.
+
+Any HTTP server works, so a local static site makes the whole path testable
+offline (``benchmarks/static_site.py`` serves one):
+
+    python -m utils.crawler http://127.0.0.1:8000/ --depth 2 --max-pages 50
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import urllib.robotparser
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit, urlunsplit
+
+import utils.logs as logs
+from utils.registry import DocumentRegistry, hash_bytes
+from utils.splitters import chunking_signature
+
+CRAWL_DIR = os.path.join(os.getcwd(), "data", "crawl")
+
+DEFAULT_MAX_DEPTH = 2
+DEFAULT_MAX_PAGES = 100
+
+# Workers (and pooled connections) for the whole crawl, and requests in flight per host
+CONCURRENCY = 8
+PER_HOST_CONCURRENCY = 2
+# Seconds between the starts of two requests to the same host, unless robots.txt asks for more
+CRAWL_DELAY = 0.1
+
+REQUEST_TIMEOUT = 20.0
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+USER_AGENT = "local-rag-crawler/1.0"
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+TEXT_TYPES = ("text/plain", "text/markdown")
+
+# Links to these are never fetched: they can't be turned into text
+SKIPPED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".bmp",
+    ".css", ".js", ".json", ".xml", ".rss", ".atom",
+    ".zip", ".gz", ".tgz", ".tar", ".7z", ".rar", ".exe", ".dmg", ".whl",
+    ".mp3", ".mp4", ".wav", ".avi", ".mov", ".webm", ".woff", ".woff2", ".ttf",
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
+}
+
+###################################
+#
+# Main Text Extraction
+#
+###################################
+
+
+class PageParser(HTMLParser):
+    """
+    Extracts a page's title, links, robots directives and main text (as Markdown).
+
+    Text inside ``<main>``, or failing that ``<article>``, is the main text if
+    there is enough of it; otherwise the whole ``<body>`` is used. Elements
+    that are rarely content (navigation, headers, footers, forms, scripts) are
+    skipped everywhere.
+    """
+
+    SKIPPED = {
+        "head", "title", "script", "style", "noscript", "template", "svg", "canvas", "iframe",
+        "nav", "header", "footer", "aside", "form", "button", "select",
+    }
+    VOID = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+    BLOCKS = {
+        "p", "div", "section", "article", "main", "ul", "ol", "table", "tr", "blockquote",
+        "dl", "dd", "dt", "figure", "figcaption", "details", "summary",
+    }
+    HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+    # <main>/<article> content shorter than this is not trusted to be the whole page
+    MIN_MAIN_CHARS = 200
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.title = ""
+        self.links: List[str] = []
+        self.noindex = False
+        self.nofollow = False
+        self._body: List[str] = []
+        self._regions: Dict[str, List[str]] = {"main": [], "article": []}
+        self._open_regions: List[str] = []
+        self._skipping: List[str] = []
+        self._in_title = False
+        self._in_pre = False
+        self._list_items = 0
+
+    def handle_starttag(self, tag: str, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href"):
+            self.base_url = urljoin(self.base_url, attrs["href"])
+        elif tag == "meta" and (attrs.get("name") or "").lower() == "robots":
+            directives = (attrs.get("content") or "").lower()
+            self.noindex = self.noindex or "noindex" in directives or "none" in directives
+            self.nofollow = self.nofollow or "nofollow" in directives or "none" in directives
+        elif tag == "a" and attrs.get("href") and "nofollow" not in (attrs.get("rel") or "").lower():
+            self.links.append(urljoin(self.base_url, attrs["href"]))
+        elif tag == "title":
+            self._in_title = True
+
+        if tag in self.VOID:
+            if tag == "br":
+                self._emit("\n")
+            return
+        if self._skipping or tag in self.SKIPPED:
+            self._skipping.append(tag)
+            return
+        if tag in self._regions:
+            self._open_regions.append(tag)
+        if tag in self.HEADINGS:
+            self._emit("\n\n" + "#" * self.HEADINGS[tag] + " ")
+        elif tag == "li":
+            self._list_items += 1
+            self._emit("\n- ")
+        elif tag == "pre":
+            self._in_pre = True
+            self._emit("\n\n```\n")
+        elif tag in self.BLOCKS:
+            # Paragraphs inside a list item stay on its line
+            self._emit(" " if self._list_items else "\n\n")
+        elif tag in ("td", "th"):
+            self._emit(" ")
+
+    def handle_endtag(self, tag: str):
+        if tag == "title":
+            self._in_title = False
+        if self._skipping:
+            # Tags are not always balanced; close up to the matching one
+            if tag in self._skipping:
+                while self._skipping.pop() != tag:
+                    pass
+            return
+        if tag == "li":
+            self._list_items = max(self._list_items - 1, 0)
+        elif tag in self.HEADINGS or tag in self.BLOCKS:
+            self._emit(" " if self._list_items and tag not in ("ul", "ol") else "\n\n")
+        elif tag == "pre":
+            self._in_pre = False
+            self._emit("\n```\n\n")
+        if tag in self._open_regions:
+            while self._open_regions.pop() != tag:
+                pass
+
+    def handle_data(self, data: str):
+        if self._in_title:
+            self.title += data
+        if self._skipping:
+            return
+        self._emit(data if self._in_pre else re.sub(r"\s+", " ", data))
+
+    def _emit(self, text: str):
+        self._body.append(text)
+        for region in set(self._open_regions):
+            self._regions[region].append(text)
+
+    def main_text(self) -> str:
+        for region in ("main", "article"):
+            text = _tidy("".join(self._regions[region]))
+            if len(text) >= self.MIN_MAIN_CHARS:
+                return text
+        return _tidy("".join(self._body))
+
+
+def _tidy(text: str) -> str:
+    """Collapses the spaces and blank lines left by markup, except inside code blocks."""
+    lines, in_code = [], False
+    for line in text.split("\n"):
+        if line.strip() == "```":
+            in_code = not in_code
+            lines.append("```")
+        else:
+            lines.append(line.rstrip() if in_code else re.sub(r" {2,}", " ", line).strip())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def extract_page(html: str, url: str) -> PageParser:
+    parser = PageParser(url)
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+def page_markdown(parser: PageParser, url: str) -> str:
+    """The text that is ingested: the main text, titled if it has no heading, and the page URL."""
+    text = parser.main_text()
+    title = " ".join(parser.title.split())
+    if title and not text.startswith("# "):
+        text = f"# {title}\n\n{text}"
+    return f"{text}\n\nSource: {url}\n"
+
+
+###################################
+#
+# URLs
+#
+###################################
+
+
+def normalize_url(url: str) -> str:
+    """Drops the fragment and default port and lower-cases scheme and host, so one page has one URL."""
+    url, _ = urldefrag(url.strip())
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((parts.scheme == "http" and port == 80) or (parts.scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    return urlunsplit((parts.scheme.lower(), host, parts.path or "/", parts.query, ""))
+
+
+def site_source(seed: str) -> str:
+    """
+    Registry source of a crawl: ``web:`` plus the seed's host and path. Crawls of
+    different sections of one site are separate sources, so they don't prune each other.
+    """
+    parts = urlsplit(seed)
+    return f"web:{parts.netloc}{parts.path.rstrip('/')}"
+
+
+def page_name(url: str) -> str:
+    """Document name of a page: its path and query, with ``.md`` so it is chunked as Markdown."""
+    parts = urlsplit(url)
+    path = parts.path.strip("/") or "index"
+    if parts.query:
+        path += "?" + parts.query
+    return f"{path}.md"
+
+
+def in_scope(url: str, seed: str) -> bool:
+    """Same scheme family, host and port as the seed, and under the seed's directory."""
+    parts, seed_parts = urlsplit(url), urlsplit(seed)
+    if parts.scheme not in ("http", "https") or parts.netloc != seed_parts.netloc:
+        return False
+    if os.path.splitext(parts.path)[1].lower() in SKIPPED_EXTENSIONS:
+        return False
+    # A seed like /docs/ or /docs is a section; /docs/intro.html is a page in the /docs/ section
+    seed_path = seed_parts.path
+    if seed_path.endswith("/") or "." not in seed_path.rsplit("/", 1)[1]:
+        prefix = seed_path.rstrip("/") + "/"
+    else:
+        prefix = seed_path.rsplit("/", 1)[0] + "/"
+    return parts.path.startswith(prefix) or parts.path == seed_path
+
+
+###################################
+#
+# Crawl State
+#
+###################################
+
+
+class CrawlState:
+    """
+    What the last crawl of a site saw, per URL: validators (``etag``,
+    ``last_modified``), the ``hash`` of the ingested text, and the ``links`` to
+    follow when the page turns out unchanged.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pages: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.pages = json.load(f).get("pages", {})
+            except (OSError, ValueError) as e:
+                logs.log.warning("Ignoring unreadable crawl state %s: %s", path, e)
+
+    @classmethod
+    def for_seed(cls, seed: str, crawl_dir: str = CRAWL_DIR) -> "CrawlState":
+        host = re.sub(r"[^\w.-]+", "_", urlsplit(seed).netloc)
+        return cls(os.path.join(crawl_dir, f"{host}-{hashlib.sha256(seed.encode()).hexdigest()[:12]}.json"))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": self.pages}, f)
+        os.replace(tmp_path, self.path)
+
+
+###################################
+#
+# Pages
+#
+###################################
+
+
+class WebPage:
+    """
+    A crawled page with the ``name``/``getbuffer()`` interface of an upload.
+    ``content_hash`` is the hash of the extracted text. Pages that were not
+    modified since the last crawl have no ``data``: the registry already holds
+    them, so they are skipped by fingerprint without being read.
+    """
+
+    def __init__(self, name: str, url: str, content_hash: str, data: Optional[bytes] = None):
+        self.name = name
+        self.url = url
+        self.content_hash = content_hash
+        self.data = data
+
+    def getbuffer(self) -> memoryview:
+        if self.data is None:
+            raise RuntimeError(f"{self.url} was not modified, so it was not downloaded again")
+        return memoryview(self.data)
+
+
+class _HostGate:
+    """Per-host politeness: a cap on concurrent requests and a minimum spacing between their starts."""
+
+    def __init__(self, concurrency: int, delay: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delay = delay
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def wait_turn(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next_start - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_start = loop.time() + self.delay
+
+
+###################################
+#
+# Crawler
+#
+###################################
+
+
+class Crawler:
+    """
+    Breadth-first crawl of one site section. ``run()`` returns the pages to
+    ingest: the complete set reached within the depth and page budget, so pages
+    that disappeared from the site are pruned from the index.
+    """
+
+    def __init__(
+        self,
+        seed: str,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        max_pages: int = DEFAULT_MAX_PAGES,
+        state: CrawlState = None,
+        registry: DocumentRegistry = None,
+        chunk_settings: Tuple[int, int] = None,
+        concurrency: int = CONCURRENCY,
+        per_host: int = PER_HOST_CONCURRENCY,
+        delay: float = CRAWL_DELAY,
+    ):
+        self.seed = normalize_url(seed)
+        self.source = site_source(self.seed)
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.state = state or CrawlState.for_seed(self.seed)
+        self.registry = registry
+        self.chunk_settings = chunk_settings
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.delay = delay
+        self.pages: Dict[str, WebPage] = {}
+        self.stats = {
+            "site": self.source.split(":", 1)[1], "fetched": 0, "not_modified": 0, "skipped": 0,
+            "robots": 0, "errors": 0, "depth": 0,
+        }
+        self._gates: Dict[str, _HostGate] = {}
+        self._robots: Optional[urllib.robotparser.RobotFileParser] = None
+        self._seen: Set[str] = set()
+
+    def run(self) -> Tuple[str, List[WebPage], Dict]:
+        started = time.perf_counter()
+        asyncio.run(self._crawl())
+        self.state.save()
+        pages = sorted(self.pages.values(), key=lambda page: page.name)
+        changed = [page for page in pages if page.data is not None]
+        if self.registry is not None:
+            # A page can be downloaded again (no validators) and still have the same text
+            changed = [page for page in changed if not self._is_ingested(page.name, page.content_hash)]
+        self.stats.update(
+            {"pages": len(pages), "changed": len(changed), "seconds": round(time.perf_counter() - started, 2)}
+        )
+        logs.log.info(
+            "Crawled %s: %d pages (%d fetched, %d not modified, %d errors) in %.2fs",
+            self.seed, len(pages), self.stats["fetched"], self.stats["not_modified"], self.stats["errors"],
+            self.stats["seconds"],
+        )
+        return self.source, pages, self.stats
+
+    async def _crawl(self):
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(
+            limits=limits, timeout=REQUEST_TIMEOUT, follow_redirects=True, headers={"User-Agent": USER_AGENT}
+        ) as client:
+            await self._load_robots(client)
+            frontier: asyncio.Queue = asyncio.Queue()
+            self._enqueue(frontier, self.seed, 0)
+            workers = [asyncio.create_task(self._worker(client, frontier)) for _ in range(self.concurrency)]
+            await frontier.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _load_robots(self, client):
+        parts = urlsplit(self.seed)
+        robots = urllib.robotparser.RobotFileParser()
+        try:
+            response = await client.get(f"{parts.scheme}://{parts.netloc}/robots.txt")
+        except Exception as e:
+            logs.log.info("No robots.txt for %s: %s", parts.netloc, e)
+            return
+        if response.status_code in (401, 403):
+            # Same convention as urllib's own RobotFileParser.read()
+            robots.disallow_all = True
+        elif response.status_code == 200:
+            robots.parse(response.text.splitlines())
+        else:
+            return
+        self._robots = robots
+        crawl_delay = robots.crawl_delay(USER_AGENT)
+        if crawl_delay:
+            self.delay = max(self.delay, float(crawl_delay))
+
+    def _enqueue(self, frontier: asyncio.Queue, url: str, depth: int):
+        if url in self._seen or len(self._seen) >= self.max_pages:
+            return
+        self._seen.add(url)
+        frontier.put_nowait((url, depth))
+
+    async def _worker(self, client, frontier: asyncio.Queue):
+        while True:
+            url, depth = await frontier.get()
+            try:
+                links = await self._visit(client, url, depth)
+                self.stats["depth"] = max(self.stats["depth"], depth)
+                if depth < self.max_depth:
+                    for link in links:
+                        link = normalize_url(link)
+                        if in_scope(link, self.seed):
+                            self._enqueue(frontier, link, depth + 1)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logs.log.warning("Crawling %s failed: %s", url, e)
+            finally:
+                frontier.task_done()
+
+    async def _visit(self, client, url: str, depth: int) -> List[str]:
+        """Fetches one page (conditionally if the registry holds it) and returns its links."""
+        import httpx
+
+        if self._robots is not None and not self._robots.can_fetch(USER_AGENT, url):
+            self.stats["robots"] += 1
+            return []
+
+        name = page_name(url)
+        previous = self.state.pages.get(url)
+        headers = {}
+        if previous and self._is_ingested(name, previous["hash"]):
+            if previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+            if previous.get("last_modified"):
+                headers["If-Modified-Since"] = previous["last_modified"]
+
+        host = urlsplit(url).netloc
+        gate = self._gates.setdefault(host, _HostGate(self.per_host, self.delay))
+        async with gate.semaphore:
+            await gate.wait_turn()
+            try:
+                response = await client.get(url, headers=headers)
+            except httpx.HTTPError as e:
+                self.stats["errors"] += 1
+                logs.log.warning("Fetching %s failed: %s", url, e)
+                self._keep_previous(url, name, previous)
+                return previous.get("links", []) if previous else []
+
+        if response.status_code == 304 and previous:
+            self.stats["not_modified"] += 1
+            self.pages[url] = WebPage(name, url, previous["hash"])
+            return previous.get("links", [])
+        if response.status_code >= 400:
+            self.stats["errors"] += 1
+            logs.log.warning("Fetching %s returned HTTP %d", url, response.status_code)
+            if response.status_code >= 500 or response.status_code == 429:
+                # Transient: keep what is indexed instead of pruning it
+                self._keep_previous(url, name, previous)
+            else:
+                self.state.pages.pop(url, None)
+            return []
+
+        final_url = normalize_url(str(response.url))
+        if final_url != url:
+            # Redirected, e.g. /docs to /docs/: fetch each target once, and never leave the section
+            if final_url in self._seen or not in_scope(final_url, self.seed):
+                self.stats["skipped"] += 1
+                return []
+            self._seen.add(final_url)
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if len(response.content) > MAX_PAGE_BYTES or content_type not in HTML_TYPES + TEXT_TYPES:
+            self.stats["skipped"] += 1
+            return []
+
+        self.stats["fetched"] += 1
+        if content_type in HTML_TYPES:
+            parser = extract_page(response.text, final_url)
+            links = [] if parser.nofollow else parser.links
+            text = None if parser.noindex else page_markdown(parser, url)
+        else:
+            links, text = [], f"{response.text.strip()}\n\nSource: {url}\n"
+        if not text or not text.strip():
+            self.stats["skipped"] += 1
+            self.state.pages.pop(url, None)
+            return links
+
+        data = text.encode("utf-8")
+        content_hash = hash_bytes(data)
+        self.pages[url] = WebPage(name, url, content_hash, data)
+        self.state.pages[url] = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "hash": content_hash,
+            "links": links,
+        }
+        return links
+
+    def _is_ingested(self, name: str, content_hash: str) -> bool:
+        if self.registry is None:
+            return True
+        chunking = chunking_signature(name, *self.chunk_settings)
+        return self.registry.is_unchanged(f"{self.source}:{name}", content_hash, chunking)
+
+    def _keep_previous(self, url: str, name: str, previous: Optional[Dict]):
+        if previous and self._is_ingested(name, previous["hash"]):
+            self.pages[url] = WebPage(name, url, previous["hash"])
+
+
+def crawl_site(
+    seed: str,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    max_pages: int = DEFAULT_MAX_PAGES,
+    registry: DocumentRegistry = None,
+    chunk_settings: Tuple[int, int] = None,
+    crawl_dir: str = CRAWL_DIR,
+    **options,
+) -> Tuple[str, List[WebPage], Dict]:
+    """
+    Crawls a site section and returns the pages to ingest.
+
+    Pages that ``registry`` holds with the same text and chunking
+    (``chunk_settings``: chunk size and overlap) are requested conditionally. A
+    page that is not modified comes back without content and is skipped by its
+    fingerprint. ``options`` are passed on to ``Crawler`` (concurrency,
+    per-host limit, delay).
+
+    Returns:
+        Tuple[str, List[WebPage], Dict]: the registry source, the pages (the
+        complete set reached, so pages gone from the site get pruned), and
+        crawl counts.
+    """
+    seed = normalize_url(seed)
+    parts = urlsplit(seed)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        raise ValueError(f"Not an http(s) URL: {seed}")
+    crawler = Crawler(
+        seed, max_depth, max_pages, CrawlState.for_seed(seed, crawl_dir), registry, chunk_settings, **options
+    )
+    return crawler.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", help="Seed URL")
+    parser.add_argument("--depth", type=int, default=DEFAULT_MAX_DEPTH)
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--per-host", type=int, default=PER_HOST_CONCURRENCY)
+    parser.add_argument("--delay", type=float, default=CRAWL_DELAY)
+    parser.add_argument("--crawl-dir", default=CRAWL_DIR)
+    args = parser.parse_args()
+
+    source, pages, stats = crawl_site(
+        args.url, args.depth, args.max_pages, crawl_dir=args.crawl_dir,
+        concurrency=args.concurrency, per_host=args.per_host, delay=args.delay,
+    )
+    print(source, stats)
+    for page in pages:
+        print(f"{page.content_hash[:12]} {'changed' if page.data is not None else 'unchanged':>9} {page.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+import utils.logs as logs
+
+# Persisted so embeddings survive restarts; one cache for every workspace, since
+# entries are keyed by model and chunk text alone and hold no workspace data
+EMBEDDING_CACHE_PATH = "./.cache/embeddings.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+
+###################################
+#
+# Cache Keys
+#
+###################################
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so cosmetic re-flows of a chunk map to the same key."""
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """Content address of a chunk: sha256 over (model name, normalized text)."""
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+###################################
+#
+# Persistent LRU Embedding Cache
+#
+###################################
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed cache of embedding vectors.
+
+    Vectors are stored in SQLite as packed doubles. Every hit refreshes the
+    entry's ``last_used`` timestamp, and once the cache grows past
+    ``max_entries`` the least recently used rows are evicted.
+
+    Args:
+        path (str): Location of the SQLite database file.
+        max_entries (int): Maximum number of vectors kept on disk.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Streamlit runs each session on its own thread, so share one guarded connection
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logs.log.info(f"Embedding cache opened at {path} with {self._entries} entries")
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each text, or ``None`` where it is missing."""
+        keys = [cache_key(model_name, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters, so look keys up in slices
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("d", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model_name: str, texts: Sequence[str], embeddings: Sequence[List[float]]) -> None:
+        """Stores freshly computed vectors and evicts the oldest entries if over capacity."""
+        if not texts:
+            return
+        now = time.time()
+        rows = {
+            cache_key(model_name, text): array("d", embedding).tobytes()
+            for text, embedding in zip(texts, embeddings)
+        }
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, blob, now) for key, blob in rows.items()],
+            )
+            self._entries += self._conn.total_changes - before
+            if self._entries > self.max_entries:
+                self._evict(self._entries - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, count: int) -> None:
+        """Removes the ``count`` least recently used vectors. Caller holds the lock."""
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (count,),
+        )
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logs.log.info("Evicted %d embeddings from cache", count)
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus the current on-disk size."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self) -> None:
+        """Drops every cached vector and resets the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._entries = 0
+            self.hits = 0
+            self.misses = 0
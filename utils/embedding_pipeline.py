@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+import utils.logs as logs
+from utils.locks import ReadWriteLock, index_lock
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import BaseNode
+
+# mistral-embed accepts up to 16k tokens per request; stay well below that
+DEFAULT_MAX_BATCH_TOKENS = 8000
+DEFAULT_MAX_BATCH_SIZE = 128
+DEFAULT_CONCURRENCY = 4
+MAX_RETRIES = 6
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+###################################
+#
+# Token-Budgeted Batching
+#
+###################################
+
+
+def pack_batches(
+    nodes: List[BaseNode],
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+) -> List[dict]:
+    """
+    Greedily packs nodes into batches that stay under a token budget.
+
+    The tokenizer only approximates Mistral's, which is fine for staying under the
+    request limit. A node larger than the budget gets a batch of its own.
+
+    Returns:
+        List[dict]: batches with ``nodes``, ``texts`` and estimated ``tokens``.
+    """
+    from llama_index.core.schema import MetadataMode
+    from llama_index.core.utils import get_tokenizer
+
+    tokenizer = get_tokenizer()
+    batches = []
+    current = {"nodes": [], "texts": [], "tokens": 0}
+    for node in nodes:
+        text = node.get_content(metadata_mode=MetadataMode.EMBED)
+        tokens = len(tokenizer(text))
+        if current["nodes"] and (
+            current["tokens"] + tokens > max_batch_tokens or len(current["nodes"]) >= max_batch_size
+        ):
+            batches.append(current)
+            current = {"nodes": [], "texts": [], "tokens": 0}
+        current["nodes"].append(node)
+        current["texts"].append(text)
+        current["tokens"] += tokens
+    if current["nodes"]:
+        batches.append(current)
+    return batches
+
+
+###################################
+#
+# Adaptive Rate Limiting
+#
+###################################
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Extracts an HTTP status code from Mistral SDK / httpx errors, if there is one."""
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status if isinstance(status, int) and status > 0 else None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Honours a Retry-After header (in seconds) when the server sent one."""
+    response = getattr(error, "raw_response", None) or getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # No status code means the request never got an answer (timeouts, dropped connections)
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__module__.startswith("httpx")
+
+
+class AdaptiveLimiter:
+    """
+    Caps the number of in-flight embedding requests and adapts it to the API.
+
+    Uses additive-increase/multiplicative-decrease: every retryable failure halves the
+    allowed concurrency, and every ``recover_after`` consecutive successes raises it by
+    one again, up to ``max_concurrency``.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_CONCURRENCY, recover_after: int = 4):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.recover_after = recover_after
+        self.in_flight = 0
+        self.retries = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, ok: bool):
+        async with self._condition:
+            self.in_flight -= 1
+            if ok:
+                self._successes += 1
+                if self._successes >= self.recover_after and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            else:
+                self.retries += 1
+                self._successes = 0
+                self.limit = max(1, self.limit // 2)
+            self._condition.notify_all()
+
+
+def _add_locked(vector_store, nodes: List[BaseNode], lock: ReadWriteLock = index_lock):
+    # Shared with running queries, see utils/locks.py
+    with lock.write():
+        vector_store.add(nodes)
+
+
+###################################
+#
+# Concurrent Embedding Pipeline
+#
+###################################
+
+
+async def _embed_batch(batch: dict, embed_model, vector_store, limiter: AdaptiveLimiter, lock: ReadWriteLock) -> dict:
+    """Embeds one batch with retries, then writes its vectors to the vector store."""
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            embeddings = await embed_model._aget_text_embeddings(batch["texts"])
+        except Exception as e:
+            await limiter.release(ok=False)
+            if attempt == MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = _retry_after(e) or min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+            logs.log.warning("Embedding batch of %d failed (%s); retry %d in %.1fs", len(batch["nodes"]), e, attempt + 1, delay)
+            await asyncio.sleep(delay)
+            continue
+        await limiter.release(ok=True)
+        break
+
+    for node, embedding in zip(batch["nodes"], embeddings):
+        node.embedding = embedding
+    if vector_store is not None:
+        # Chroma's client is synchronous; keep the event loop free for other batches
+        write = asyncio.ensure_future(asyncio.to_thread(_add_locked, vector_store, batch["nodes"], lock))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # The thread cannot be interrupted; finish the write before unwinding
+            await write
+            raise
+    return batch
+
+
+async def aembed_nodes(
+    nodes: List[BaseNode],
+    embed_model,
+    vector_store=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+    lock: ReadWriteLock = index_lock,
+) -> dict:
+    """
+    Embeds nodes in token-budgeted batches with several requests in flight.
+
+    Each finished batch is written to ``vector_store`` immediately, so a failure
+    part-way through keeps the vectors that were already computed.
+
+    Args:
+        nodes (List[BaseNode]): Nodes to embed; ``node.embedding`` is filled in place.
+        embed_model: A LlamaIndex embedding model (normally ``Settings.embed_model``).
+        vector_store: Optional vector store to ``add`` each finished batch to.
+        concurrency (int): Maximum number of embedding requests in flight.
+        max_batch_tokens (int): Token budget per embedding request.
+        on_batch (Callable[[int, int], None]): Called with (nodes done, total nodes).
+        lock (ReadWriteLock): Lock of the vector store's workspace, held while a batch is written.
+
+    Returns:
+        dict: Throughput statistics for the run.
+    """
+    start = time.perf_counter()
+    batches = pack_batches(nodes, max_batch_tokens=max_batch_tokens)
+    limiter = AdaptiveLimiter(max_concurrency=concurrency)
+    total_tokens = sum(batch["tokens"] for batch in batches)
+    done = 0
+
+    tasks = [asyncio.create_task(_embed_batch(batch, embed_model, vector_store, limiter, lock)) for batch in batches]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            batch = await finished
+            done += len(batch["nodes"])
+            if on_batch:
+                on_batch(done, len(nodes))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Wait for the cancelled batches to unwind, so none still writes to the store afterwards
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "nodes": len(nodes),
+        "batches": len(batches),
+        "tokens": total_tokens,
+        "retries": limiter.retries,
+        "seconds": elapsed,
+        "nodes_per_sec": len(nodes) / elapsed if elapsed else 0.0,
+        "tokens_per_sec": total_tokens / elapsed if elapsed else 0.0,
+    }
+    logs.log.info(
+        "Embedded %d nodes in %d batches in %.2fs (%.1f nodes/s, %.0f tokens/s, %d retries)",
+        stats["nodes"],
+        stats["batches"],
+        elapsed,
+        stats["nodes_per_sec"],
+        stats["tokens_per_sec"],
+        stats["retries"],
+    )
+    return stats
+
+
+def embed_nodes(nodes: List[BaseNode], embed_model, vector_store=None, **kwargs) -> dict:
+    """Synchronous wrapper around ``aembed_nodes`` for Streamlit's script thread."""
+    return asyncio.run(aembed_nodes(nodes, embed_model, vector_store, **kwargs))
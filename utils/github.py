@@ -0,0 +1,369 @@
+"""
+GitHub repository ingestion through a local mirror cache.
+
+Each repository is kept as a shallow, blob-filtered bare clone under
+``data/github``: the first sync downloads the commit and its trees only, and
+later syncs ``git fetch`` the new tip. File contents (blobs) are fetched on
+demand, in one batch, and only for files that are new or changed since the
+last ingestion. The git blob SHA is used as each file's fingerprint in the
+document registry, so an unchanged file is skipped without being downloaded
+or hashed.
+
+Any git remote works, including a local bare repository, which makes the
+whole path testable offline:
+
+    python -m utils.github /path/to/repo.git --include "*.py" "*.md"
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import utils.logs as logs
+from utils.registry import DocumentRegistry
+from utils.splitters import chunking_signature
+
+MIRROR_DIR = os.path.join(os.getcwd(), "data", "github")
+
+# Everything tracked is a candidate unless excluded; binaries are skipped separately
+DEFAULT_INCLUDE = ["*"]
+DEFAULT_EXCLUDE = ["*.min.js", "*.min.css", "*.map", "*.lock", "package-lock.json"]
+
+# Directories of third-party or generated code, skipped at any depth
+VENDORED_DIRS = {
+    "node_modules", "bower_components", "vendor", "third_party", "third-party", "external",
+    "site-packages", ".venv", "venv", "__pycache__", ".tox", ".mypy_cache", "dist", "build", "target",
+}
+
+# Known binary formats, skipped without downloading them. PDFs are binary but parseable.
+BINARY_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".tif", ".tiff", ".psd",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".tar", ".jar", ".war", ".whl", ".egg",
+    ".exe", ".dll", ".so", ".dylib", ".o", ".a", ".lib", ".bin", ".class", ".pyc", ".pyo", ".wasm",
+    ".mp3", ".mp4", ".wav", ".ogg", ".flac", ".avi", ".mov", ".mkv", ".webm",
+    ".ttf", ".otf", ".woff", ".woff2", ".eot",
+    ".sqlite", ".sqlite3", ".db", ".pkl", ".npy", ".npz", ".parquet", ".onnx", ".pt", ".h5",
+    ".doc", ".xls", ".ppt", ".key", ".numbers", ".pages",
+}
+BINARY_ALLOWED = {".pdf"}
+
+# Larger files are usually generated data rather than documentation or source
+MAX_FILE_BYTES = 1024 * 1024
+# A NUL byte in the first bytes marks a file as binary, like git's own heuristic
+SNIFF_BYTES = 8000
+
+# Blobs requested per fetch / cat-file call
+BLOB_BATCH = 500
+GIT_TIMEOUT = 600
+
+_GITHUB_URL = re.compile(r"^(?:https?://github\.com/|git@github\.com:)?([\w.-]+)/([\w.-]+?)(?:\.git)?/?$")
+
+
+class GitError(RuntimeError):
+    pass
+
+
+# One sync at a time per mirror, e.g. when two sessions sync the same repository
+_mirror_locks: Dict[str, threading.Lock] = {}
+_mirror_locks_guard = threading.Lock()
+
+
+def _git(*args: str, cwd: str = None, input: bytes = None) -> bytes:
+    """Runs git without a shell or a terminal prompt, raising ``GitError`` with its stderr."""
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    try:
+        completed = subprocess.run(
+            ["git", *args], cwd=cwd, input=input, capture_output=True, env=env, timeout=GIT_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise GitError(f"git {args[0]} failed: {e}") from e
+    if completed.returncode != 0:
+        raise GitError(f"git {args[0]} failed: {completed.stderr.decode('utf-8', 'replace').strip()}")
+    return completed.stdout
+
+
+###################################
+#
+# Repository Names
+#
+###################################
+
+
+def parse_repo(url: str) -> Tuple[str, str]:
+    """
+    Returns ``(name, remote)`` for a GitHub URL, an ``owner/repo`` shorthand,
+    or a local repository path / ``file://`` URL.
+    """
+    url = url.strip()
+    local_path = url[len("file://"):] if url.startswith("file://") else url
+    if os.path.isdir(local_path):
+        local_path = os.path.abspath(local_path)
+        name = os.path.basename(local_path.rstrip("/"))
+        # file:// rather than a plain path, or git ignores --depth and --filter
+        return (name[:-4] if name.endswith(".git") else name), "file://" + local_path
+    match = _GITHUB_URL.match(url)
+    if not match:
+        raise ValueError(f"Not a GitHub repository URL or local repository: {url}")
+    owner, repo = match.groups()
+    return f"{owner}/{repo}", f"https://github.com/{owner}/{repo}.git"
+
+
+def repo_source(name: str) -> str:
+    """Registry source of a repository's documents."""
+    return f"github:{name}"
+
+
+###################################
+#
+# Tracked Files
+#
+###################################
+
+
+class RepoFile:
+    """
+    A tracked file of a mirrored repository, with the ``name``/``getbuffer()``
+    interface of Streamlit's UploadedFile. ``content_hash`` is the git blob SHA.
+    The content is read from the mirror on first use, unless it was prefetched.
+    """
+
+    def __init__(self, mirror: "GitMirror", name: str, blob: str, data: bytes = None):
+        self.mirror = mirror
+        self.name = name
+        self.content_hash = blob
+        self.data = data
+
+    def getbuffer(self) -> memoryview:
+        if self.data is None:
+            self.data = self.mirror.read_blobs([self.content_hash])[self.content_hash]
+        return memoryview(self.data)
+
+
+def _matches(path: str, patterns: Iterable[str]) -> bool:
+    """Glob match on the repository path; patterns without a slash also match the file name."""
+    file_name = path.rsplit("/", 1)[-1]
+    return any(
+        fnmatch.fnmatch(path, pattern) or ("/" not in pattern and fnmatch.fnmatch(file_name, pattern)) for pattern in patterns
+    )
+
+
+def is_binary(data: bytes) -> bool:
+    return b"\x00" in data[:SNIFF_BYTES]
+
+
+###################################
+#
+# Mirror Cache
+#
+###################################
+
+
+class GitMirror:
+    """
+    Shallow, blob-filtered bare clone of one remote, reused across syncs.
+
+    Args:
+        remote (str): Git URL of the repository.
+        path (str): Directory of the bare mirror.
+    """
+
+    def __init__(self, remote: str, path: str):
+        self.remote = remote
+        self.path = path
+
+    @classmethod
+    def for_remote(cls, name: str, remote: str, mirror_dir: str = MIRROR_DIR) -> "GitMirror":
+        # Named by the remote too, so two local repositories called "docs" don't share a mirror
+        digest = hashlib.sha256(remote.encode("utf-8")).hexdigest()[:12]
+        safe_name = re.sub(r"[^\w.-]+", "_", name)
+        return cls(remote, os.path.join(mirror_dir, f"{safe_name}-{digest}.git"))
+
+    def sync(self, branch: str = None) -> str:
+        """Clones or fetches the tip of ``branch`` (default: the remote's default branch); returns its commit."""
+        with _mirror_locks_guard:
+            lock = _mirror_locks.setdefault(self.path, threading.Lock())
+        with lock:
+            return self._sync(branch)
+
+    def _sync(self, branch: str = None) -> str:
+        if not os.path.isdir(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            args = ["clone", "--bare", "--quiet", "--depth", "1", "--filter=blob:none", "--single-branch"]
+            if branch:
+                args += ["--branch", branch]
+            # Cloned under a temporary name, so an interrupted clone never looks like a mirror
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            _git(*args, self.remote, tmp_path)
+            os.replace(tmp_path, self.path)
+            logs.log.info("Cloned %s into mirror %s", self.remote, self.path)
+        else:
+            branch = branch or self.default_branch()
+            _git(
+                "fetch", "--quiet", "--depth", "1", "--filter=blob:none", "--no-tags", "--force",
+                "origin", f"refs/heads/{branch}:refs/heads/{branch}", cwd=self.path,
+            )
+            logs.log.info("Fetched %s (%s) into mirror %s", self.remote, branch, self.path)
+        return self.commit(branch)
+
+    def default_branch(self) -> str:
+        return _git("symbolic-ref", "--short", "HEAD", cwd=self.path).decode().strip()
+
+    def commit(self, branch: str = None) -> str:
+        ref = f"refs/heads/{branch}" if branch else "HEAD"
+        return _git("rev-parse", ref, cwd=self.path).decode().strip()
+
+    def tracked_files(self, commit: str) -> List[Tuple[str, str]]:
+        """
+        ``(path, blob SHA)`` of every regular file at ``commit``. Reads trees
+        only: asking for sizes (``ls-tree -l``) would download every blob.
+        """
+        output = _git("ls-tree", "-r", "-z", "--full-tree", commit, cwd=self.path)
+        files = []
+        for entry in output.split(b"\x00"):
+            if not entry:
+                continue
+            info, path = entry.split(b"\t", 1)
+            mode, kind, blob = info.split()
+            # Skips submodules (commits) and symlinks
+            if kind == b"blob" and mode in (b"100644", b"100755"):
+                files.append((path.decode("utf-8", "replace"), blob.decode()))
+        return files
+
+    def fetch_blobs(self, blobs: List[str]) -> None:
+        """
+        Downloads missing blobs in batched requests. Without this, each read of a
+        missing blob would be its own round trip to the remote.
+        """
+        for start in range(0, len(blobs), BLOB_BATCH):
+            try:
+                _git(
+                    "-c", "fetch.negotiationAlgorithm=noop", "fetch", "--quiet", "--no-tags", "--no-write-fetch-head",
+                    "--filter=blob:none", "origin", *blobs[start : start + BLOB_BATCH], cwd=self.path,
+                )
+            except GitError as e:
+                # Servers that refuse object wants still serve them one by one on read
+                logs.log.warning("Batched blob fetch failed, reading blobs one by one: %s", e)
+                return
+
+    def read_blobs(self, blobs: List[str]) -> Dict[str, bytes]:
+        """Contents of the given blobs, read through one ``git cat-file --batch`` per batch."""
+        contents: Dict[str, bytes] = {}
+        for start in range(0, len(blobs), BLOB_BATCH):
+            batch = blobs[start : start + BLOB_BATCH]
+            output = _git("cat-file", "--batch", cwd=self.path, input="".join(f"{blob}\n" for blob in batch).encode())
+            offset = 0
+            for _ in batch:
+                header_end = output.index(b"\n", offset)
+                blob, kind, *rest = output[offset:header_end].split()
+                if kind == b"missing":
+                    raise GitError(f"Blob {blob.decode()} is missing from the mirror")
+                size = int(rest[0])
+                contents[blob.decode()] = output[header_end + 1 : header_end + 1 + size]
+                offset = header_end + 1 + size + 1
+        return contents
+
+
+###################################
+#
+# Sync Planning
+#
+###################################
+
+
+def collect_repo_files(
+    url: str,
+    branch: str = None,
+    include: List[str] = None,
+    exclude: List[str] = None,
+    registry: DocumentRegistry = None,
+    chunk_settings: Tuple[int, int] = None,
+    mirror_dir: str = MIRROR_DIR,
+) -> Tuple[str, List[RepoFile], Dict]:
+    """
+    Syncs the mirror and selects the files to ingest.
+
+    Files are filtered by path (``include``/``exclude`` globs, vendored
+    directories, binary extensions) from the tree listing alone. Then the blobs
+    of files that ``registry`` doesn't hold with the same blob SHA and chunking
+    (``chunk_settings``: chunk size and overlap) are fetched in one batch and
+    checked for size and binary content. Unchanged files are returned without
+    their content, so the ingestion run skips them by fingerprint.
+
+    Returns:
+        Tuple[str, List[RepoFile], Dict]: the registry source, the files to
+        ingest (the complete set, so removed files get pruned), and counts of
+        what was skipped and why.
+    """
+    name, remote = parse_repo(url)
+    include = include or DEFAULT_INCLUDE
+    exclude = DEFAULT_EXCLUDE if exclude is None else exclude
+    mirror = GitMirror.for_remote(name, remote, mirror_dir)
+    commit = mirror.sync(branch or None)
+
+    stats = {"repo": name, "commit": commit, "tracked": 0, "vendored": 0, "excluded": 0, "binary": 0, "too_large": 0}
+    candidates = []
+    for path, blob in mirror.tracked_files(commit):
+        stats["tracked"] += 1
+        extension = os.path.splitext(path)[1].lower()
+        if any(part in VENDORED_DIRS for part in path.split("/")[:-1]):
+            stats["vendored"] += 1
+        elif not _matches(path, include) or _matches(path, exclude):
+            stats["excluded"] += 1
+        elif extension in BINARY_EXTENSIONS:
+            stats["binary"] += 1
+        else:
+            candidates.append(RepoFile(mirror, path, blob))
+
+    source = repo_source(name)
+    changed = [
+        f for f in candidates
+        if registry is None
+        or not registry.is_unchanged(f"{source}:{f.name}", f.content_hash, chunking_signature(f.name, *chunk_settings))
+    ]
+    blobs = sorted({f.content_hash for f in changed})
+    mirror.fetch_blobs(blobs)
+    contents = mirror.read_blobs(blobs)
+    files = []
+    for repo_file in candidates:
+        data = contents.get(repo_file.content_hash)
+        if data is not None and len(data) > MAX_FILE_BYTES:
+            stats["too_large"] += 1
+            continue
+        if data is not None and is_binary(data) and os.path.splitext(repo_file.name)[1].lower() not in BINARY_ALLOWED:
+            stats["binary"] += 1
+            continue
+        repo_file.data = data
+        files.append(repo_file)
+
+    stats.update({"files": len(files), "changed": sum(f.data is not None for f in files)})
+    logs.log.info(
+        "Repository %s at %s: %d tracked, %d selected, %d new or changed",
+        name, commit[:12], stats["tracked"], len(files), stats["changed"],
+    )
+    return source, files, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", help="GitHub URL, owner/repo, or a local repository path")
+    parser.add_argument("--branch")
+    parser.add_argument("--include", nargs="+", default=DEFAULT_INCLUDE)
+    parser.add_argument("--exclude", nargs="+", default=DEFAULT_EXCLUDE)
+    parser.add_argument("--mirror-dir", default=MIRROR_DIR)
+    args = parser.parse_args()
+
+    source, files, stats = collect_repo_files(args.url, args.branch, args.include, args.exclude, mirror_dir=args.mirror_dir)
+    print(source, stats)
+    for repo_file in files:
+        print(f"{repo_file.content_hash[:12]} {'changed' if repo_file.data is not None else 'unchanged':>9} {repo_file.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,168 @@
+import hashlib
+import importlib
 import os
-import requests
+import shutil
 import subprocess
+import threading
+import time
+from typing import Optional
 
 import streamlit as st
+import streamlit.logger
+from streamlit import config as st_config
 
 import utils.logs as logs
 
+
+def silence_bare_mode_warnings():
+    """
+    Streamlit warns about a missing script context on every ``st.*`` call made
+    outside ``streamlit run``. Used by the headless service and the benchmarks,
+    which call the app's helpers directly.
+    """
+    # Streamlit applies its configured log level when the config is first parsed,
+    # so parse it now rather than have it undo the change later
+    st_config.get_option("logger.level")
+    streamlit.logger.set_log_level("error")
+
+###################################
+#
+# Background Import Warm-Up
+#
+###################################
+
+# Needed by the first ingestion or query, but not to render the page
+WARM_UP_MODULES = [
+    "llama_index.core",
+    "chromadb",
+    "llama_index.vector_stores.chroma",
+    "llama_index.llms.mistralai",
+    "utils.mistral_embedding",
+    "utils.retrievers",
+]
+# The NumPy backend (see utils.llama_index.VECTOR_STORE) never needs Chroma
+if os.environ.get("LOCAL_RAG_VECTOR_STORE", "chroma") == "numpy":
+    WARM_UP_MODULES = [name for name in WARM_UP_MODULES if "chroma" not in name] + ["utils.vector_stores"]
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up_imports() -> Optional[threading.Thread]:
+    """
+    Imports the heavy modules on a background thread, once per process.
+
+    Called after the first page render, so the first query or ingestion doesn't
+    wait on a cold import. Anything that needs a module before the warm-up has
+    reached it simply imports it itself; Python's import lock keeps that safe.
+    Set ``LOCAL_RAG_WARM_UP=0`` to skip it, e.g. to measure a cold first query.
+    """
+    if os.environ.get("LOCAL_RAG_WARM_UP", "1") == "0":
+        return None
+
+    def run():
+        start = time.perf_counter()
+        for name in WARM_UP_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                logs.log.warning("Could not preload %s: %s", name, e)
+        logs.log.info("Preloaded query and ingestion modules in %.2fs", time.perf_counter() - start)
+
+    thread = threading.Thread(target=run, name="warm-up-imports", daemon=True)
+    thread.start()
+    return thread
+
+
+###################################
+#
+# Content-Addressed Upload Store
+#
+###################################
+
+# Uploads are stored once per distinct content, named by their sha256
+UPLOAD_STORE_DIR = os.path.join(os.getcwd(), "data", "uploads")
+
+# Uploads are hashed and written in slices of this size, straight from the upload buffer
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_upload(uploaded_file) -> str:
+    """
+    sha256 of an upload, computed over its buffer without copying it.
+
+    Files that already carry a fingerprint (``content_hash``, e.g. the git blob
+    SHA of a repository file) use it instead, so they are never read just to be
+    hashed.
+    """
+    content_hash = getattr(uploaded_file, "content_hash", None)
+    if content_hash:
+        return content_hash
+    buffer = uploaded_file.getbuffer()
+    digest = hashlib.sha256()
+    for start in range(0, len(buffer), COPY_CHUNK_SIZE):
+        digest.update(buffer[start:start + COPY_CHUNK_SIZE])
+    return digest.hexdigest()
+
+
+def store_uploaded_file(uploaded_file, file_hash: str = None, store_dir: str = UPLOAD_STORE_DIR) -> str:
+    """
+    Writes an upload to the content-addressed store and returns its path.
+
+    The file is streamed from a memoryview of the upload buffer in chunks, so
+    the content is never duplicated in memory. If the same content was stored
+    before (e.g. on an earlier rerun) the existing file is reused, with its
+    modification time refreshed.
+
+    Args:
+        uploaded_file (UploadedFile): The uploaded file.
+        file_hash (str): The content hash, if already known.
+        store_dir (str): Root directory of the store.
+    """
+    file_hash = file_hash or hash_upload(uploaded_file)
+    # Keep the extension: SimpleDirectoryReader picks the parser by it
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    file_path = os.path.join(store_dir, file_hash[:2], file_hash + extension)
+    try:
+        # Counts as new again, so pruning (see prune_upload_store) spares it while it is ingested
+        os.utime(file_path)
+        return file_path
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    buffer = uploaded_file.getbuffer()
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for start in range(0, len(buffer), COPY_CHUNK_SIZE):
+            f.write(buffer[start:start + COPY_CHUNK_SIZE])
+    # Atomic, so concurrent reruns never see a half-written file
+    os.replace(tmp_path, file_path)
+    logs.log.info(f"Stored upload {uploaded_file.name} as {file_path}")
+    return file_path
+
+
+def prune_upload_store(live_hashes, store_dir: str = UPLOAD_STORE_DIR, min_age: float = 3600):
+    """
+    Deletes stored uploads whose content hash is no longer referenced. Files
+    younger than ``min_age`` seconds are kept, as another session may be
+    ingesting them right now.
+    """
+    if not os.path.isdir(store_dir):
+        return
+    live_hashes = set(live_hashes)
+    cutoff = time.time() - min_age
+    removed = 0
+    for root, _, files in os.walk(store_dir):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if name.endswith(".tmp") or os.path.getmtime(file_path) > cutoff:
+                continue
+            if os.path.splitext(name)[0] not in live_hashes:
+                os.remove(file_path)
+                removed += 1
+    if removed:
+        logs.log.info(f"Pruned {removed} unreferenced uploads from {store_dir}")
+
+
 ###################################
 #
 # Save File Upload to Disk
@@ -17,6 +174,9 @@ def save_uploaded_file(uploaded_file: bytes, save_dir: str):
     """
     Saves the uploaded file to the specified directory.
 
+    The content goes through the upload store and is hard-linked into place,
+    so saving the same upload again costs no extra copy.
+
     Args:
         uploaded_file (BytesIO): The uploaded file content.
         save_dir (str): The directory where the file will be saved.
@@ -24,8 +184,16 @@ def save_uploaded_file(uploaded_file: bytes, save_dir: str):
     try:
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
-        with open(os.path.join(save_dir, uploaded_file.name), "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        stored_path = store_uploaded_file(uploaded_file)
+        target_path = os.path.join(save_dir, uploaded_file.name)
+        if os.path.exists(target_path):
+            if os.path.samefile(stored_path, target_path):
+                return
+            os.remove(target_path)
+        try:
+            os.link(stored_path, target_path)
+        except OSError:
+            shutil.copyfile(stored_path, target_path)  # e.g. store and target on different filesystems
     except Exception as e:
         logs.log.info(f"Error saving upload to disk: {e}")
 
@@ -37,13 +205,16 @@ def save_uploaded_file(uploaded_file: bytes, save_dir: str):
 ###################################
 
 
-def validate_github_repo(repo: str):
+def validate_github_repo(repo: str) -> bool:
+    import requests
+
     repo_endpoint = "https://github.com/" + repo + ".git"
-    resp = requests.head(repo_endpoint)
-    if resp.status_code() == 200:
-        return True
-    else:
+    try:
+        resp = requests.head(repo_endpoint, allow_redirects=True, timeout=10)
+    except requests.RequestException as e:
+        logs.log.warning(f"Could not reach GitHub repo {repo}: {e}")
         return False
+    return resp.status_code == 200
 
 
 ###################################
@@ -53,25 +224,29 @@ def validate_github_repo(repo: str):
 ###################################
 
 
-def clone_github_repo(repo: str):
+def clone_github_repo(repo: str) -> bool:
     """
-    Clones a GitHub repository.
+    Shallow-clones a GitHub repository into ``data/<repo>``.
+
+    The GitHub tab syncs through the mirror cache in ``utils/github.py``
+    instead; this is a plain working-tree checkout.
 
     Parameters:
-        repo (str): The name of the GitHub repository.
+        repo (str): The repository as ``owner/name``.
     """
     repo_endpoint = "https://github.com/" + repo + ".git"
-    if repo_endpoint is not None:
-        save_dir = os.getcwd() + "/data"
-        clone_command = f"git clone -q {repo_endpoint} {save_dir}/{repo}"
-        try:
-            subprocess.run(clone_command, shell=True)
-            logs.log.info(f"Cloned {repo} repo")
-            return True
-        except Exception as e:
-            Exception(f"Error cloning {repo} GitHub repo: {e}")
-            return False
-
-    else:
-        Exception(f"Failed to process GitHub repo {st.session_state['github_repo']}")
+    save_dir = os.path.join(os.getcwd(), "data", repo)
+    try:
+        # No shell: the repository name is user input
+        subprocess.run(
+            ["git", "clone", "-q", "--depth", "1", repo_endpoint, save_dir],
+            check=True,
+            capture_output=True,
+            env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", b"") or b""
+        logs.log.error(f"Error cloning {repo} GitHub repo: {e} {stderr.decode('utf-8', 'replace').strip()}")
         return False
+    logs.log.info(f"Cloned {repo} repo")
+    return True
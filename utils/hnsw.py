@@ -0,0 +1,256 @@
+"""
+HNSW parameters of the Chroma collection, and an offline rebuild that applies new ones.
+
+Chroma fixes the distance metric, ``M`` (``max_neighbors``) and
+``ef_construction`` when a collection is created. ``ef_search`` can be
+changed afterwards, but a process that has already queried the collection
+keeps using the old value until it restarts. The rebuild copies the stored
+vectors, documents and metadata into a new collection created with the new
+parameters, so nothing is re-embedded, and the fresh graph no longer carries
+the deleted entries that accumulate after many upserts. Run it from the Settings tab (Advanced
+Settings), or with the app stopped:
+
+    python -m utils.hnsw show
+    python -m utils.hnsw rebuild --m 32 --ef-construction 200 --ef-search 64 --space cosine
+    python -m utils.hnsw show --workspace team-docs
+"""
+
+import argparse
+import json
+import os
+import struct
+import time
+from typing import Callable, Dict, Optional
+
+import utils.logs as logs
+
+# Chroma's defaults
+HNSW_SPACES = ["l2", "cosine", "ip"]
+DEFAULT_HNSW = {"space": "l2", "max_neighbors": 16, "ef_construction": 100, "ef_search": 100}
+
+# Can be changed on an existing collection; the others need a rebuild
+MUTABLE_HNSW_KEYS = ["ef_search"]
+
+# Collections used while a rebuild swaps the new one in
+REBUILD_SUFFIX = "-rebuild"
+PREVIOUS_SUFFIX = "-previous"
+
+REBUILD_BATCH = 1000
+
+# Start of a persisted HNSW segment's header.bin: format version, then hnswlib's offsetLevel0,
+# max_elements, cur_element_count and size_data_per_element
+_SEGMENT_HEADER = struct.Struct("<iQQQQ")
+
+###################################
+#
+# Parameters
+#
+###################################
+
+
+# Environment variables overriding each parameter
+HNSW_ENV = {
+    "space": "LOCAL_RAG_HNSW_SPACE",
+    "max_neighbors": "LOCAL_RAG_HNSW_M",
+    "ef_construction": "LOCAL_RAG_HNSW_EF_CONSTRUCTION",
+    "ef_search": "LOCAL_RAG_HNSW_EF_SEARCH",
+}
+
+
+def hnsw_overrides() -> Dict:
+    """
+    HNSW parameters set in the environment: ``LOCAL_RAG_HNSW_SPACE`` (``l2``,
+    ``cosine`` or ``ip``), ``LOCAL_RAG_HNSW_M``, ``LOCAL_RAG_HNSW_EF_CONSTRUCTION``
+    and ``LOCAL_RAG_HNSW_EF_SEARCH``. Parameters that aren't set are left out,
+    so values chosen in the Settings tab survive a restart.
+    """
+    overrides = {}
+    for key, variable in HNSW_ENV.items():
+        if os.environ.get(variable):
+            overrides[key] = os.environ[variable] if key == "space" else int(os.environ[variable])
+    validate_hnsw({**DEFAULT_HNSW, **overrides})
+    return overrides
+
+
+def get_hnsw_config() -> Dict:
+    """HNSW parameters for a new collection: Chroma's defaults with the environment's overrides."""
+    return {**DEFAULT_HNSW, **hnsw_overrides()}
+
+
+def validate_hnsw(config: Dict) -> None:
+    if config["space"] not in HNSW_SPACES:
+        raise ValueError(f"Unknown HNSW space '{config['space']}', expected one of {HNSW_SPACES}")
+    for key in ("max_neighbors", "ef_construction", "ef_search"):
+        if config[key] < 1:
+            raise ValueError(f"HNSW {key} must be positive, got {config[key]}")
+
+
+def collection_hnsw(collection) -> Dict:
+    """The HNSW parameters a collection was created (or last modified) with."""
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    return {key: hnsw.get(key, default) for key, default in DEFAULT_HNSW.items()}
+
+
+def needs_rebuild(collection, config: Dict) -> bool:
+    """True if parameters in ``config`` that are fixed at creation differ from the collection's."""
+    current = collection_hnsw(collection)
+    return any(current[key] != value for key, value in config.items() if key not in MUTABLE_HNSW_KEYS)
+
+
+def set_ef_search(collection, ef_search: int) -> None:
+    """
+    Stores a new query-time beam width for an existing collection, without a rebuild.
+
+    Chroma caches the loaded HNSW segment, so the value takes effect in new
+    processes (or after a rebuild), not in one that has already queried it.
+    """
+    if collection_hnsw(collection)["ef_search"] != ef_search:
+        collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+        logs.log.info("Set ef_search of collection %s to %d", collection.name, ef_search)
+
+
+def segment_memory_bytes(segment_dir: str) -> int:
+    """
+    Approximate memory of a persisted HNSW segment once Chroma has loaded it.
+
+    A segment is read whole, including the room ``data_level0.bin`` keeps for
+    ``max_elements`` vectors (about 42 MB at 1024 dimensions, however few are
+    stored). One that holds no vectors yet, because Chroma still keeps them in
+    its brute-force buffer, is not loaded at all.
+    """
+    sizes = {}
+    for name in os.listdir(segment_dir):
+        try:
+            sizes[name] = os.path.getsize(os.path.join(segment_dir, name))
+        except OSError:
+            pass  # Replaced while listing
+    try:
+        with open(os.path.join(segment_dir, "header.bin"), "rb") as f:
+            _, _, _, count, _ = _SEGMENT_HEADER.unpack(f.read(_SEGMENT_HEADER.size))
+    except (OSError, struct.error):
+        count = None
+    if count == 0:
+        return 0
+    return sum(sizes.values())
+
+
+###################################
+#
+# Rebuild
+#
+###################################
+
+
+def recover_rebuild(client, name: str) -> None:
+    """Finishes or undoes a rebuild that was interrupted while swapping collections."""
+    names = {collection.name for collection in client.list_collections()}
+    if name + REBUILD_SUFFIX in names:
+        # Not swapped in yet; the original collection is still complete
+        client.delete_collection(name + REBUILD_SUFFIX)
+        names.discard(name + REBUILD_SUFFIX)
+    if name + PREVIOUS_SUFFIX in names:
+        if name in names:
+            client.delete_collection(name + PREVIOUS_SUFFIX)
+        else:
+            client.get_collection(name + PREVIOUS_SUFFIX).modify(name=name)
+        logs.log.warning("Recovered collection %s from an interrupted rebuild", name)
+
+
+def rebuild_collection(
+    client,
+    collection,
+    config: Dict,
+    batch_size: int = REBUILD_BATCH,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+):
+    """
+    Re-indexes a collection's stored vectors with new HNSW parameters.
+
+    The copy is built under a temporary name and then swapped in by renaming,
+    so readers of the old collection object keep working until the caller
+    switches them over. Writes must be paused for the duration (the app holds
+    the index write lock).
+
+    Returns:
+        The new collection, under the original name.
+    """
+    validate_hnsw(config)
+    name = collection.name
+    total = collection.count()
+    logs.log.info("Rebuilding collection %s (%d vectors) with %s", name, total, config)
+    started = time.perf_counter()
+
+    recover_rebuild(client, name)
+    # Legacy "hnsw:*" metadata would conflict with the new configuration
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+    rebuilt = client.create_collection(
+        name + REBUILD_SUFFIX, configuration={"hnsw": dict(config)}, metadata=metadata or None, embedding_function=None
+    )
+    copied = 0
+    while copied < total:
+        batch = collection.get(limit=batch_size, offset=copied, include=["embeddings", "documents", "metadatas"])
+        if not len(batch["ids"]):
+            break
+        rebuilt.add(
+            ids=batch["ids"], embeddings=batch["embeddings"], documents=batch["documents"], metadatas=batch["metadatas"]
+        )
+        copied += len(batch["ids"])
+        if on_batch:
+            on_batch(copied, total)
+    if rebuilt.count() != total:
+        client.delete_collection(rebuilt.name)
+        raise RuntimeError(f"Rebuild copied {rebuilt.count()} of {total} vectors; the collection was left unchanged")
+
+    collection.modify(name=name + PREVIOUS_SUFFIX)
+    rebuilt.modify(name=name)
+    client.delete_collection(name + PREVIOUS_SUFFIX)
+    logs.log.info("Rebuilt collection %s in %.1fs", name, time.perf_counter() - started)
+    return rebuilt
+
+
+###################################
+#
+# Command Line
+#
+###################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["show", "rebuild"])
+    parser.add_argument("--persist-dir", default=None, help="Chroma directory (default: the workspace's)")
+    parser.add_argument("--workspace", default="default", help="Workspace whose collection to use (default: default)")
+    parser.add_argument("--collection", default=None, help="Collection name (default: the app's collection)")
+    parser.add_argument("--space", choices=HNSW_SPACES)
+    parser.add_argument("--m", type=int, help="max_neighbors")
+    parser.add_argument("--ef-construction", type=int)
+    parser.add_argument("--ef-search", type=int)
+    args = parser.parse_args()
+
+    import chromadb
+
+    from utils.llama_index import COLLECTION_NAME, PERSIST_DIR
+    from utils.workspaces import workspace_dir
+
+    persist_dir = args.persist_dir or workspace_dir(args.workspace, os.path.basename(PERSIST_DIR))
+    client = chromadb.PersistentClient(path=persist_dir)
+    name = args.collection or COLLECTION_NAME
+    recover_rebuild(client, name)
+    collection = client.get_collection(name)
+    current = collection_hnsw(collection)
+    if args.command == "show":
+        print(json.dumps({"collection": name, "vectors": collection.count(), "hnsw": current}, indent=2))
+        return
+
+    config = dict(current)
+    for key, value in (("space", args.space), ("max_neighbors", args.m), ("ef_construction", args.ef_construction), ("ef_search", args.ef_search)):
+        if value is not None:
+            config[key] = value
+    rebuilt = rebuild_collection(
+        client, collection, config, on_batch=lambda done, total: print(f"\rCopied {done}/{total} vectors", end="", flush=True)
+    )
+    print(f"\nRebuilt {name}: {json.dumps(collection_hnsw(rebuilt))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional
+
+import utils.logs as logs
+from utils.bm25 import BM25Index
+from utils.embedding_pipeline import DEFAULT_CONCURRENCY, DEFAULT_MAX_BATCH_TOKENS, embed_nodes
+from utils.helpers import store_uploaded_file
+from utils.llama_index import apply_sync, diff_nodes, plan_sync, rollback_sync
+from utils.locks import workspace_lock
+from utils.parsing import DEFAULT_PARSE_WORKERS, get_parse_pool, submit_file
+from utils.registry import DocumentRegistry
+from utils.splitters import chunk_token_counts, summarize_chunk_sizes
+from utils.workspaces import current_workspace, data_dir
+
+# read file -> parse -> split -> embed (+ upsert into the vector store)
+STAGES = ["read", "parse", "split", "embed"]
+
+# Each queue holds at most this many items, which is what bounds memory:
+# a fast stage blocks instead of racing ahead of a slow one.
+QUEUE_SIZE = 4
+
+# Chunks are handed to the embedding pipeline in groups of about this many request batches
+EMBED_GROUP_BATCHES = 4
+
+_DONE = object()
+
+###################################
+#
+# Progress Tracking
+#
+###################################
+
+
+class IngestProgress:
+    """Thread-safe per-stage counters, read by the UI while the pipeline runs."""
+
+    def __init__(self, total_files: int):
+        self._lock = threading.Lock()
+        self.done = {stage: 0 for stage in STAGES}
+        # The number of chunks to embed is only known once splitting is finished
+        self.total = {"read": total_files, "parse": total_files, "split": total_files, "embed": 0}
+        self.errors: List[str] = []
+        self.parse_seconds: Dict[str, float] = {}
+        self.chunk_tokens: Dict[str, List[int]] = {}
+        self.started = time.perf_counter()
+
+    def advance(self, stage: str, count: int = 1):
+        with self._lock:
+            self.done[stage] += count
+
+    def add_total(self, stage: str, count: int):
+        with self._lock:
+            self.total[stage] += count
+
+    def record_parse(self, file_name: str, seconds: float):
+        with self._lock:
+            self.parse_seconds[file_name] = seconds
+
+    def record_chunks(self, counts: Dict[str, List[int]]):
+        with self._lock:
+            for splitter, sizes in counts.items():
+                self.chunk_tokens.setdefault(splitter, []).extend(sizes)
+
+    def fail(self, message: str):
+        with self._lock:
+            self.errors.append(message)
+
+    def snapshot(self) -> Dict[str, tuple]:
+        with self._lock:
+            return {stage: (self.done[stage], self.total[stage]) for stage in STAGES}
+
+
+###################################
+#
+# Pipeline Stages
+#
+###################################
+
+
+def _put(out_queue: queue.Queue, item, stop: threading.Event):
+    """Blocking put that gives up once the pipeline is being torn down."""
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(in_queue: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _read_stage(
+    files: List, file_hashes: Dict[str, str], source: str, upload_dir: str, out_queue, progress: IngestProgress, stop
+):
+    """Streams each upload into the content-addressed store, so the parser can work from a file path."""
+    for uploaded_file in files:
+        if stop.is_set():
+            break
+        file_path = store_uploaded_file(uploaded_file, file_hashes.get(f"{source}:{uploaded_file.name}"), upload_dir)
+        progress.advance("read")
+        _put(out_queue, (uploaded_file.name, file_path), stop)
+    _put(out_queue, _DONE, stop)
+
+
+def _parse_stage(in_queue, out_queue, workers: int, chunking: tuple, progress: IngestProgress, stop):
+    """
+    Parses and chunks files on a process pool, keeping up to two files per worker
+    in flight. A file that fails to parse is reported and skipped, not fatal.
+    """
+    pending = []
+    upstream_done = False
+    while not stop.is_set() and (pending or not upstream_done):
+        # Top up the pool without letting parsed documents pile up in memory
+        while not upstream_done and len(pending) < workers * 2:
+            try:
+                item = in_queue.get(timeout=0.05)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                upstream_done = True
+            else:
+                pending.append(submit_file(get_parse_pool(workers), *item, chunking))
+
+        for parse in [parse for parse in pending if parse.done()]:
+            pending.remove(parse)
+            nodes, seconds, error = parse.result()
+            if parse.crashed and parse.attempts == 1:
+                # A crash breaks the whole pool, so give bystanders one more try on a fresh one
+                retry = submit_file(get_parse_pool(workers), parse.file_name, parse.file_path, chunking)
+                retry.attempts = 2
+                pending.append(retry)
+                continue
+            progress.record_parse(parse.file_name, seconds)
+            if error:
+                logs.log.error("Error parsing %s: %s", parse.file_name, error)
+                progress.fail(f"{parse.file_name}: {error}")
+            else:
+                logs.log.info("Parsed and chunked %s into %d chunks in %.2fs", parse.file_name, len(nodes), seconds)
+                _put(out_queue, (parse.file_name, nodes), stop)
+            progress.advance("parse")
+
+        if pending:
+            wait([future for parse in pending for future in parse.futures], timeout=0.1, return_when=FIRST_COMPLETED)
+    _put(out_queue, _DONE, stop)
+
+
+def _split_stage(in_queue, out_queue, registry, plan, source: str, progress: IngestProgress, stop):
+    """
+    Forwards only the chunks of each file that are not yet in the vector store.
+    The chunks themselves are made by the parse tasks, on the process pool.
+    """
+    while (item := _get(in_queue, stop)) is not _DONE:
+        file_name, nodes = item
+        progress.record_chunks(chunk_token_counts(nodes))
+        new_nodes = diff_nodes(registry, nodes, plan, source)
+        progress.add_total("embed", len(new_nodes))
+        progress.advance("split")
+        if new_nodes:
+            _put(out_queue, new_nodes, stop)
+    _put(out_queue, _DONE, stop)
+
+
+def _embed_stage(in_queue, vector_store, lexical_index, embed_options: dict, progress: IngestProgress, stop) -> Dict:
+    """Groups incoming chunks and embeds each group concurrently, writing vectors as batches finish."""
+    from llama_index.core import Settings
+
+    # Roughly 4 characters per token; exact counts are computed by the embedding pipeline
+    group_chars = embed_options["max_batch_tokens"] * EMBED_GROUP_BATCHES * 4
+    stats = {"nodes": 0, "tokens": 0, "retries": 0, "seconds": 0.0}
+    group: List = []
+    group_size = 0
+    embed_model = Settings.embed_model
+
+    def flush():
+        reported = [0]
+
+        def on_batch(done, total):
+            progress.advance("embed", done - reported[0])
+            reported[0] = done
+
+        run = embed_nodes(group, embed_model, vector_store, on_batch=on_batch, **embed_options)
+        for key in stats:
+            stats[key] += run[key]
+        if lexical_index is not None:
+            lexical_index.add(group)
+        group.clear()
+
+    while (item := _get(in_queue, stop)) is not _DONE:
+        group.extend(item)
+        group_size += sum(len(node.get_content()) for node in item)
+        if group_size >= group_chars:
+            flush()
+            group_size = 0
+    if group and not stop.is_set():
+        flush()
+
+    stats["nodes_per_sec"] = stats["nodes"] / stats["seconds"] if stats["seconds"] else 0.0
+    stats["tokens_per_sec"] = stats["tokens"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+###################################
+#
+# Streaming Ingestion
+#
+###################################
+
+
+def run_pipeline(
+    plan: Dict,
+    vector_store,
+    registry: DocumentRegistry,
+    chunk_size: int,
+    chunk_overlap: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+    parse_workers: int = DEFAULT_PARSE_WORKERS,
+    source: str = "local",
+    lexical_index: BM25Index = None,
+    on_progress: Optional[Callable[[IngestProgress], None]] = None,
+) -> Dict:
+    """
+    Ingests ``plan["changed"]`` as a bounded streaming pipeline.
+
+    Reading, parsing (which also chunks, on the process pool), diffing chunks
+    against the registry and embedding (which also upserts) each run on
+    their own thread, connected by small queues. Only a few files' worth
+    of documents and chunks are alive at any time, so memory stays roughly flat
+    however large the upload is, and the first vectors are stored while later
+    files are still being parsed.
+
+    Embedded chunks are also added to ``lexical_index`` (if given); it is saved
+    by ``apply_sync`` together with the registry.
+
+    Streamlit elements can only be updated from the script thread, so any UI
+    updates should happen in ``on_progress``, which the calling thread invokes
+    periodically while it waits for the stages.
+
+    Returns:
+        Dict: embedding throughput stats, parse (and chunking) time per file,
+        the chunk-size distribution per splitter, and ``errors`` for files
+        that failed.
+    """
+    files = plan["changed"]
+    progress = IngestProgress(len(files))
+    stop = threading.Event()
+    read_queue, parse_queue, split_queue = (queue.Queue(maxsize=QUEUE_SIZE) for _ in range(3))
+    # Uploads and vectors go to the registry's workspace
+    workspace = registry.workspace or current_workspace()
+    embed_options = {
+        "concurrency": concurrency,
+        "max_batch_tokens": max_batch_tokens,
+        "lock": workspace_lock(workspace),
+    }
+
+    result: Dict = {}
+
+    def guarded(target, *args):
+        # A crashed stage would leave its neighbours waiting forever, so tear everything down
+        def run():
+            try:
+                output = target(*args)
+                if isinstance(output, dict):
+                    result.update(output)
+            except BaseException as e:
+                logs.log.error("Ingestion stage %s failed: %s", target.__name__, e)
+                result.setdefault("exception", e)
+                stop.set()
+        # Stage threads log with the request id of the job that started them
+        return threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+
+    workers = [
+        guarded(_read_stage, files, plan["file_hashes"], source, data_dir(workspace, "uploads"), read_queue, progress, stop),
+        guarded(_parse_stage, read_queue, parse_queue, parse_workers, (chunk_size, chunk_overlap), progress, stop),
+        guarded(_split_stage, parse_queue, split_queue, registry, plan, source, progress, stop),
+        guarded(_embed_stage, split_queue, vector_store, lexical_index, embed_options, progress, stop),
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        while any(worker.is_alive() for worker in workers):
+            if on_progress:
+                on_progress(progress)
+            workers[-1].join(timeout=0.2)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    if on_progress:
+        on_progress(progress)
+    if "exception" in result:
+        raise result.pop("exception")
+
+    seconds = time.perf_counter() - progress.started
+    result.update(
+        {
+            "errors": progress.errors,
+            "files": len(files),
+            "parse_seconds": progress.parse_seconds,
+            "chunk_sizes": summarize_chunk_sizes(progress.chunk_tokens),
+            "total_seconds": seconds,
+        }
+    )
+    logs.log.info(
+        "Streaming ingestion of %d files finished in %.2fs (%d chunks embedded, %d errors)",
+        len(files),
+        seconds,
+        result.get("nodes", 0),
+        len(progress.errors),
+    )
+    return result
+
+
+def ingest_files(
+    files: List,
+    vector_store,
+    registry: DocumentRegistry,
+    chunk_size: int,
+    chunk_overlap: int,
+    source: str = "local",
+    prune: bool = True,
+    lexical_index: BM25Index = None,
+    on_progress: Optional[Callable[[IngestProgress], None]] = None,
+    **options,
+) -> Dict:
+    """
+    Syncs uploaded files into the vector store: plans which files changed, runs
+    the streaming pipeline over them and commits the result to the registry.
+    ``options`` are passed on to ``run_pipeline`` (concurrency, batch tokens,
+    parse workers). If the run fails, or ``on_progress`` raises to cancel it,
+    the vectors written so far are rolled back.
+
+    Returns:
+        Dict: the ``run_pipeline`` stats plus ``changed``, ``unchanged`` and
+        ``removed`` document counts.
+    """
+    plan = plan_sync(registry, files, source, chunk_size, chunk_overlap, prune)
+    try:
+        stats = run_pipeline(
+            plan,
+            vector_store,
+            registry,
+            chunk_size,
+            chunk_overlap,
+            source=source,
+            lexical_index=lexical_index,
+            on_progress=on_progress,
+            **options,
+        )
+    except BaseException:
+        # Failed or cancelled (``on_progress`` may raise): drop the vectors already written
+        rollback_sync(vector_store, registry, plan, source)
+        raise
+    # Remove vectors of deleted chunks/files and record the new fingerprints
+    apply_sync(vector_store, registry, plan, source)
+    stats.update({"changed": len(plan["changed"]), "unchanged": plan["unchanged"], "removed": len(plan["removed"])})
+    return stats
@@ -0,0 +1,399 @@
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from typing import Callable, Dict, List, Optional, Set
+
+import streamlit as st
+
+import utils.logs as logs
+import utils.mistral as mistral
+from utils.helpers import UPLOAD_STORE_DIR, hash_upload, store_uploaded_file
+from utils.ingest import IngestProgress, ingest_files
+from utils.llama_index import assign_partition, get_lexical_index, get_registry, index_data
+from utils.workspaces import current_workspace, data_dir, get_workspace_pool
+
+# One queue for every workspace, next to the default workspace's upload store;
+# each job's files are in the upload store of its own workspace
+JOBS_PATH = os.path.join(os.path.dirname(UPLOAD_STORE_DIR), "jobs.sqlite3")
+
+JOB_STATES = ["queued", "parsing", "embedding", "done", "failed", "cancelled"]
+ACTIVE_STATES = ("queued", "parsing", "embedding")
+
+# How often a running job writes its progress back to the database
+PROGRESS_INTERVAL = 0.5
+# Runs a job may start; one that was interrupted this often (e.g. a file that crashes
+# the process) is failed on startup instead of being queued again
+MAX_ATTEMPTS = 3
+
+###################################
+#
+# Stored Uploads
+#
+###################################
+
+
+class StoredUpload:
+    """
+    A file in the upload store, with the ``name``/``getbuffer()`` interface of
+    Streamlit's UploadedFile, so the ingestion code can run long after the
+    browser session that uploaded it is gone. ``content_hash`` is the
+    fingerprint recorded when the job was submitted.
+    """
+
+    def __init__(self, name: str, path: str, content_hash: str = None):
+        self.name = name
+        self.path = path
+        self.content_hash = content_hash
+        self._mapping = None
+        self._lock = threading.Lock()
+
+    def getbuffer(self) -> memoryview:
+        # Memory-mapped, so hashing a large file doesn't read it into memory;
+        # mapped once and shared by every stage that reads the file
+        with self._lock:
+            if self._mapping is None:
+                with open(self.path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        return memoryview(b"")
+                    self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._mapping)
+
+    def close(self) -> None:
+        """Unmaps the file; called once the job that reads it has ended."""
+        with self._lock:
+            if self._mapping is None:
+                return
+            try:
+                self._mapping.close()
+            except BufferError:
+                # A view of it is still referenced; the mapping is released along with it
+                pass
+            self._mapping = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+###################################
+#
+# Ingestion Job Runner
+#
+###################################
+
+
+def run_ingest_job(job: Dict, on_progress: Callable[[IngestProgress], None]) -> Dict:
+    """Runs one queued ingestion job with the settings captured when it was submitted."""
+    for entry in job["files"]:
+        if not os.path.exists(entry["path"]):
+            raise FileNotFoundError(f"Upload of {entry['name']} is no longer in the upload store")
+    options = job["options"]
+    workspace = job["workspace"]
+    # The first job of the process builds the embedding client, off the UI thread
+    mistral.configure_global_settings()
+    uploads = [StoredUpload(entry["name"], entry["path"], entry["hash"]) for entry in job["files"]]
+    # The workspace stays attached while its job runs
+    with get_workspace_pool().use(workspace), ExitStack() as stack:
+        for upload in uploads:
+            stack.callback(upload.close)
+        registry = get_registry(workspace)
+        # Large sources may be written to a collection of their own
+        partition = assign_partition(registry, job["source"], len(job["files"]))
+        vector_store = index_data(partition, workspace)
+        return ingest_files(
+            uploads,
+            vector_store,
+            registry,
+            options["chunk_size"],
+            options["chunk_overlap"],
+            source=job["source"],
+            prune=job["prune"],
+            lexical_index=get_lexical_index(vector_store, partition, workspace),
+            on_progress=on_progress,
+            concurrency=options["concurrency"],
+            max_batch_tokens=options["max_batch_tokens"],
+            parse_workers=options["parse_workers"],
+        )
+
+
+###################################
+#
+# Persistent Job Queue
+#
+###################################
+
+
+class JobQueue:
+    """
+    Ingestion jobs persisted in SQLite and run by a background worker thread.
+
+    Submitting a job writes its files to the upload store and returns at once;
+    the browser session can be closed or refreshed while the job runs. Each job
+    records its state (``JOB_STATES``), per-stage progress counts, stats and
+    timings.
+
+    Jobs of every workspace share the queue and run one at a time, since each
+    ingestion already parses and embeds in parallel. A job that was
+    running when the process died is queued again on startup: chunk ids are
+    content-addressed and embeddings are cached, so re-running it only redoes
+    work that was lost. After ``MAX_ATTEMPTS`` interrupted runs it is marked
+    failed instead, so a file that takes the process down is not retried on
+    every restart. Cancelling a running job stops the pipeline and rolls
+    back the vectors it had written.
+
+    Args:
+        path (str): Location of the SQLite database file.
+        runner (Callable): Runs a job dict, reporting through the given progress callback.
+    """
+
+    def __init__(self, path: str = JOBS_PATH, runner: Callable = run_ingest_job):
+        self.path = path
+        self._runner = runner
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " prune INTEGER NOT NULL,"
+            " files TEXT NOT NULL,"
+            " options TEXT NOT NULL,"
+            " progress TEXT,"
+            " stats TEXT,"
+            " error TEXT,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " workspace TEXT NOT NULL DEFAULT 'default')"
+        )
+        # Queues created before workspaces existed hold only jobs of the default workspace
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "workspace" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN workspace TEXT NOT NULL DEFAULT 'default'")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_workspace ON jobs (workspace, created_at)")
+        # Anything still marked as running was interrupted by a crash or restart
+        abandoned = self._conn.execute(
+            "UPDATE jobs SET state = 'failed', finished_at = ?, error = ?"
+            " WHERE state IN ('parsing', 'embedding') AND attempts >= ?",
+            (time.time(), f"Interrupted {MAX_ATTEMPTS} times, e.g. by a crash while ingesting; not retried", MAX_ATTEMPTS),
+        ).rowcount
+        resumed = self._conn.execute(
+            "UPDATE jobs SET state = 'queued' WHERE state IN ('parsing', 'embedding')"
+        ).rowcount
+        self._conn.commit()
+        if abandoned:
+            logs.log.warning(f"Failed {abandoned} ingestion jobs that were interrupted {MAX_ATTEMPTS} times")
+        if resumed:
+            logs.log.info(f"Resuming {resumed} interrupted ingestion jobs")
+
+        self._worker = threading.Thread(target=self._work, name="ingestion-jobs", daemon=True)
+        self._worker.start()
+
+    def submit(
+        self, uploaded_files: List, options: Dict, source: str = "local", prune: bool = True, workspace: str = None
+    ) -> str:
+        """Stores the uploads and queues an ingestion job for them into the workspace. Returns the job id."""
+        workspace = workspace or current_workspace()
+        upload_dir = data_dir(workspace, "uploads")
+        files = []
+        for uploaded_file in uploaded_files:
+            file_hash = hash_upload(uploaded_file)
+            files.append(
+                {
+                    "name": uploaded_file.name,
+                    "hash": file_hash,
+                    "path": store_uploaded_file(uploaded_file, file_hash, upload_dir),
+                }
+            )
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, state, source, prune, files, options, created_at, workspace)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, source, int(prune), json.dumps(files), json.dumps(options), time.time(), workspace),
+            )
+            self._conn.commit()
+        logs.log.info("Queued ingestion job %s with %d files into workspace %s", job_id, len(files), workspace)
+        self._wake.set()
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a queued job immediately, or asks a running one to stop. False if already finished."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = 'cancelled', finished_at = ? WHERE id = ? AND state = 'queued'",
+                (time.time(), job_id),
+            )
+            if not cursor.rowcount:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state IN ('parsing', 'embedding')",
+                    (job_id,),
+                )
+            self._conn.commit()
+        return bool(cursor.rowcount)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _to_job(row) if row else None
+
+    def recent(self, limit: int = 10, workspace: str = None) -> List[Dict]:
+        """Most recent jobs first, of one workspace if given."""
+        with self._lock:
+            if workspace is None:
+                rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE workspace = ? ORDER BY created_at DESC LIMIT ?", (workspace, limit)
+                ).fetchall()
+        return [_to_job(row) for row in rows]
+
+    def has_active(self) -> bool:
+        with self._lock:
+            placeholders = ",".join("?" * len(ACTIVE_STATES))
+            row = self._conn.execute(
+                f"SELECT 1 FROM jobs WHERE state IN ({placeholders}) LIMIT 1", ACTIVE_STATES
+            ).fetchone()
+        return row is not None
+
+    def _update(self, job_id: str, **fields) -> None:
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def _claim_next(self) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET state = 'parsing', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+            self._conn.commit()
+        return _to_job(row)
+
+    def _work(self) -> None:
+        while True:
+            try:
+                job = self._claim_next()
+                if job is None:
+                    self._wake.wait(timeout=1.0)
+                    self._wake.clear()
+                    continue
+                self._run(job)
+            except Exception as e:
+                # Keep the worker alive; e.g. a locked database is retried on the next loop
+                logs.log.error("Ingestion job worker error: %s", e)
+                time.sleep(1.0)
+
+    def _run(self, job: Dict) -> None:
+        # Everything logged while the job runs carries its id
+        context_token = logs.request_id.set(job["id"])
+        try:
+            self._run_job(job)
+        finally:
+            logs.request_id.reset(context_token)
+
+    def _run_job(self, job: Dict) -> None:
+        job_id = job["id"]
+        logs.log.info("Starting ingestion job %s", job_id)
+        last_report = [0.0]
+        latest: Dict[str, IngestProgress] = {}
+
+        def on_progress(progress: IngestProgress):
+            latest["progress"] = progress
+            now = time.monotonic()
+            if now - last_report[0] < PROGRESS_INTERVAL:
+                return
+            last_report[0] = now
+            snapshot = progress.snapshot()
+            done, total = snapshot["parse"]
+            with self._lock:
+                cancel = self._conn.execute(
+                    "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()[0]
+            if cancel:
+                raise JobCancelled()
+            self._update(
+                job_id,
+                state="parsing" if done < total else "embedding",
+                progress=json.dumps(snapshot),
+            )
+
+        try:
+            stats = self._runner(job, on_progress)
+        except JobCancelled:
+            logs.log.info("Ingestion job %s cancelled", job_id)
+            self._update(job_id, state="cancelled", finished_at=time.time())
+        except Exception as e:
+            logs.log.error("Ingestion job %s failed: %s", job_id, e)
+            self._update(job_id, state="failed", error=str(e) or type(e).__name__, finished_at=time.time())
+        else:
+            progress = latest["progress"].snapshot() if latest else None
+            self._update(
+                job_id,
+                state="done",
+                progress=json.dumps(progress) if progress else None,
+                stats=json.dumps(stats, default=str),
+                finished_at=time.time(),
+            )
+            logs.log.info("Ingestion job %s finished", job_id)
+
+
+def pending_upload_hashes(workspace: str, path: str = JOBS_PATH) -> Set[str]:
+    """
+    Content hashes of the uploads of the workspace's queued and running jobs,
+    which must survive pruning of the upload store until those jobs have run.
+
+    Reads the queue's database directly, so callers outside the app (e.g. the
+    service) don't start a worker.
+    """
+    if not os.path.exists(path):
+        return set()
+    placeholders = ",".join("?" * len(ACTIVE_STATES))
+    conn = sqlite3.connect(path)
+    try:
+        try:
+            rows = conn.execute(
+                f"SELECT files FROM jobs WHERE state IN ({placeholders}) AND workspace = ?", (*ACTIVE_STATES, workspace)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # A queue not yet migrated to workspaces; keep the uploads of every pending job
+            rows = conn.execute(f"SELECT files FROM jobs WHERE state IN ({placeholders})", ACTIVE_STATES).fetchall()
+    finally:
+        conn.close()
+    return {entry["hash"] for (files,) in rows for entry in json.loads(files)}
+
+
+def _to_job(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job["prune"] = bool(job["prune"])
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    for key in ("files", "options", "progress", "stats"):
+        job[key] = json.loads(job[key]) if job[key] else None
+    return job
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue() -> JobQueue:
+    """Process-wide ingestion job queue; its worker thread starts with it."""
+    return JobQueue()
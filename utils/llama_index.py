@@ -1,31 +1,98 @@
+from __future__ import annotations
+
+import json
 import os
-import tempfile
-from typing import List
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import streamlit as st
 
+import utils.hnsw as hnsw
 import utils.logs as logs
+import utils.mistral as mistral
+from utils.answer_cache import AnswerCache
+from utils.bm25 import BM25Index
+from utils.embedding_pipeline import DEFAULT_CONCURRENCY, DEFAULT_MAX_BATCH_TOKENS, embed_nodes
+from utils.parsing import DEFAULT_PARSE_WORKERS, parse_files, split_in_parallel
+from utils.quantized_index import COMPRESSIONS, DEFAULT_RESCORE_FACTOR, QuantizedIndex
+from utils.helpers import hash_upload, prune_upload_store, store_uploaded_file
+from utils.locks import workspace_lock
+from utils.registry import DocumentRegistry, chunk_node_id, hash_text
+from utils.splitters import chunking_signature as file_chunking_signature
+from utils.workspaces import current_workspace, data_dir, workspace_dir, workspace_resource
 
 # This import might not be strictly necessary if OPENAI_API_KEY is set elsewhere
 # but keeping it for now based on original comment. Should be set via secrets ideally.
 # os.environ["OPENAI_API_KEY"] = "sk-abc123" 
 
-from llama_index.core import (
-    VectorStoreIndex,
-    SimpleDirectoryReader,
-    # ServiceContext, # ServiceContext is deprecated, use Settings
-    # set_global_service_context, # Use Settings instead
-    Settings, # Import Settings
-    StorageContext, # Needed for vector store persistence
-    load_index_from_storage, # To load existing index
-    Document # For type hinting
-)
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.vector_stores.chroma import ChromaVectorStore
-import chromadb # Required by ChromaVectorStore
+# LlamaIndex and Chroma take seconds to import, so they are imported inside the
+# functions that use them: the page renders before anything needs them, and the
+# first ingestion or query pays the cost instead (see utils/helpers.warm_up_imports)
+if TYPE_CHECKING:
+    from llama_index.core import Document, VectorStoreIndex
+    from llama_index.core.vector_stores.types import BasePydanticVectorStore, MetadataFilters
+    from llama_index.vector_stores.chroma import ChromaVectorStore
 
 # Placeholder for where ChromaDB data will be stored
+# These paths are the default workspace's; every workspace (utils/workspaces.py) has the
+# same layout in its own directory, see partition_paths
 PERSIST_DIR = "./chroma_db" 
+COLLECTION_NAME = "local_rag_collection"
+# Per-document fingerprints of what is currently stored in the vector store
+REGISTRY_PATH = os.path.join(PERSIST_DIR, "document_registry.json")
+
+# Local BM25 inverted index over the same nodes as the Chroma collection
+LEXICAL_INDEX_PATH = os.path.join(PERSIST_DIR, "bm25_index.json")
+
+# Vector store backend, set with LOCAL_RAG_VECTOR_STORE:
+#   "chroma" (default)  Chroma collection in PERSIST_DIR
+#   "numpy"             memory-mapped matrix and a node sidecar file, no database
+#                       (utils/vector_stores.NumpyVectorStore)
+VECTOR_STORES = ["chroma", "numpy"]
+VECTOR_STORE = os.environ.get("LOCAL_RAG_VECTOR_STORE", "chroma")
+NUMPY_STORE_DIR = os.path.join(PERSIST_DIR, "numpy_store")
+
+# Optional compressed copy of the vectors for dense search, re-scored at full
+# precision (see utils/quantized_index.py):
+#   LOCAL_RAG_VECTOR_COMPRESSION  "none" (default), "float16" or "int8"
+#   LOCAL_RAG_RESCORE_FACTOR      candidates re-scored per result (default 4)
+VECTOR_COMPRESSION = os.environ.get("LOCAL_RAG_VECTOR_COMPRESSION", "none")
+RESCORE_FACTOR = int(os.environ.get("LOCAL_RAG_RESCORE_FACTOR", DEFAULT_RESCORE_FACTOR))
+QUANTIZED_INDEX_DIR = os.path.join(PERSIST_DIR, "quantized_index")
+
+# Sources first ingested with at least LOCAL_RAG_PARTITION_MIN_FILES files get a
+# collection (and BM25 and quantized index) of their own under PARTITIONS_DIR, so
+# queries limited to other sources never search them. 0 (the default) keeps every
+# source in COLLECTION_NAME.
+PARTITION_MIN_FILES = int(os.environ.get("LOCAL_RAG_PARTITION_MIN_FILES", 0))
+PARTITIONS_DIR = os.path.join(PERSIST_DIR, "partitions")
+
+# LlamaIndex's default number of retrieved nodes
+DEFAULT_TOP_K = 2
+
+# Retrieval modes of utils.retrievers.HybridRetriever
+RETRIEVAL_MODES = ["hybrid", "vector", "lexical"]
+
+# Rerankers of utils.rerankers, applied to fetch_k retrieved candidates to keep the best top_k:
+#   "none"           the retriever's top k go straight to the LLM
+#   "cross-encoder"  local ONNX cross-encoder on the CPU (LOCAL_RAG_CROSS_ENCODER)
+#   "llm"            batched relevance scoring by a small Mistral model (LOCAL_RAG_RERANK_MODEL)
+RERANKERS = ["none", "cross-encoder", "llm"]
+DEFAULT_FETCH_K = 10
+
+# Registry bookkeeping that should neither be embedded nor sent to the LLM
+SYNC_METADATA_KEYS = ["doc_key", "file_hash", "chunk_hash"]
+
+# Metadata stored with every chunk so queries can be limited to it; kept out of the
+# embedded and LLM text, so tagging chunks doesn't change their embeddings
+FILTER_METADATA_KEYS = ["source", "file_type", "ingested_at"]
+
+# Metadata pre-filters accepted by create_query_engine, and the node metadata they match:
+#   sources         chunks of these sources (e.g. "local", "github:owner/repo")
+#   documents       chunks of these document keys (e.g. "local:report.pdf")
+#   file_types      chunks of files with these extensions (e.g. "pdf", "py")
+#   ingested_after  chunks stored at or after this Unix time
+QUERY_FILTERS = {"sources": "source", "documents": "doc_key", "file_types": "file_type", "ingested_after": "ingested_at"}
 
 ###################################
 #
@@ -33,25 +100,21 @@ PERSIST_DIR = "./chroma_db"
 #
 ###################################
 @st.cache_data(show_spinner="Loading files...")
-def load_data(uploaded_files: List[st.runtime.uploaded_file_manager.UploadedFile]) -> List[Document]:
-    """Loads data from Streamlit uploaded files into LlamaIndex Documents."""
-    documents = []
-    with tempfile.TemporaryDirectory() as temp_dir:
-        for uploaded_file in uploaded_files:
-            file_path = os.path.join(temp_dir, uploaded_file.name)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
-            logs.log.info(f"Loading document: {uploaded_file.name}")
-        
-        # Use SimpleDirectoryReader on the temporary directory
-        reader = SimpleDirectoryReader(input_dir=temp_dir)
-        try:
-            documents = reader.load_data()
-            logs.log.info(f"Loaded {len(documents)} documents successfully.")
-        except Exception as e:
-            logs.log.error(f"Error loading documents from temp directory: {e}")
-            st.error(f"Failed to load documents: {e}")
-            return [] # Return empty list on error
+def load_data(uploaded_files: List[st.runtime.uploaded_file_manager.UploadedFile], workers: int = None) -> List[Document]:
+    """Loads data from Streamlit uploaded files into LlamaIndex Documents, parsing files in parallel."""
+    workers = workers or st.session_state.get("parse_workers", DEFAULT_PARSE_WORKERS)
+    # Uploads go to the content-addressed store, so re-uploads of the same content are not rewritten
+    files = []
+    for uploaded_file in uploaded_files:
+        files.append((uploaded_file.name, store_uploaded_file(uploaded_file, store_dir=data_dir(current_workspace(), "uploads"))))
+        logs.log.info(f"Loading document: {uploaded_file.name}")
+
+    # Each file (or page range of a long PDF) is parsed on a process pool;
+    # a file that fails is reported and skipped instead of failing the batch
+    documents, timings, errors = parse_files(files, workers=workers)
+    for file_name, error in errors.items():
+        st.error(f"Failed to load {file_name}: {error}")
+    logs.log.info(f"Loaded {len(documents)} documents successfully.")
     return documents
 
 ###################################
@@ -59,20 +122,35 @@ def load_data(uploaded_files: List[st.runtime.uploaded_file_manager.UploadedFile
 # Chunk Data (Node Parsing)
 #
 ###################################
-@st.cache_data(show_spinner="Chunking documents...")
-# Prefix 'documents' with an underscore to prevent hashing
-def chunk_data(_documents: List[Document], chunk_size: int = None, chunk_overlap: int = None) -> List:
-    """Chunks LlamaIndex Documents into Nodes using SentenceSplitter."""
+def get_chunk_settings(chunk_size: int = None, chunk_overlap: int = None):
+    """Resolves chunk settings from arguments, session state, or Settings defaults."""
+    if chunk_size is None:
+        chunk_size = st.session_state.get("chunk_size")
+    if chunk_overlap is None:  # 0 is a valid overlap, so don't use `or` here
+        chunk_overlap = st.session_state.get("chunk_overlap")
+    if chunk_size is None or chunk_overlap is None:
+        from llama_index.core import Settings
+
+        chunk_size = Settings.chunk_size if chunk_size is None else chunk_size
+        chunk_overlap = Settings.chunk_overlap if chunk_overlap is None else chunk_overlap
+    return chunk_size, chunk_overlap
+
+# Not cached with st.cache_data: the documents argument is unhashable, so the cache
+# key would only be the chunk settings and different uploads would share one result.
+def chunk_data(_documents: List[Document], chunk_size: int = None, chunk_overlap: int = None, workers: int = None) -> List:
+    """
+    Chunks LlamaIndex Documents into Nodes with the splitter registered for each
+    file type (see utils/splitters.py), chunking files in parallel.
+    """
     # Use chunk settings from session state or fallback to Settings defaults
-    chunk_size = chunk_size or st.session_state.get("chunk_size", Settings.chunk_size)
-    chunk_overlap = chunk_overlap or st.session_state.get("chunk_overlap", Settings.chunk_overlap)
+    chunk_size, chunk_overlap = get_chunk_settings(chunk_size, chunk_overlap)
+    workers = workers or st.session_state.get("parse_workers", DEFAULT_PARSE_WORKERS)
     
     # Use the prefixed argument name here
     logs.log.info(f"Chunking {len(_documents)} documents with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
     try:
-        node_parser = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         # Use the prefixed argument name here
-        nodes = node_parser.get_nodes_from_documents(_documents)
+        nodes = split_in_parallel(_documents, chunk_size, chunk_overlap, workers)
         logs.log.info(f"Created {len(nodes)} nodes.")
         return nodes
     except Exception as e:
@@ -85,46 +163,163 @@ def chunk_data(_documents: List[Document], chunk_size: int = None, chunk_overlap
 # Initialize Vector Store (Chroma)
 #
 ###################################
-@st.cache_resource(show_spinner="Initializing vector store...")
-def index_data() -> ChromaVectorStore:
-    """Initializes a ChromaDB vector store."""
-    logs.log.info(f"Initializing ChromaDB vector store at: {PERSIST_DIR}")
+def partition_paths(partition: str = None, workspace: str = None) -> Dict[str, str]:
+    """
+    Where a workspace's registry, and a partition's collection and indexes, are
+    stored; ``None`` is the shared collection of the session's workspace.
+    """
+    persist_dir = workspace_dir(workspace or current_workspace(), os.path.basename(PERSIST_DIR))
+    root = persist_dir if partition is None else os.path.join(persist_dir, os.path.basename(PARTITIONS_DIR), partition)
+    return {
+        "persist_dir": persist_dir,
+        "registry": os.path.join(persist_dir, os.path.basename(REGISTRY_PATH)),
+        "collection": COLLECTION_NAME if partition is None else f"{COLLECTION_NAME}_{partition}",
+        "numpy_store": os.path.join(root, os.path.basename(NUMPY_STORE_DIR)),
+        "quantized_index": os.path.join(root, os.path.basename(QUANTIZED_INDEX_DIR)),
+        "lexical_index": os.path.join(root, os.path.basename(LEXICAL_INDEX_PATH)),
+    }
+
+@workspace_resource(show_spinner="Initializing vector store...")
+def index_data(partition: str = None, workspace: str = None) -> BasePydanticVectorStore:
+    """
+    Initializes the configured vector store (``LOCAL_RAG_VECTOR_STORE``), Chroma by default.
+
+    Without ``partition`` this is the shared collection; a partition is the
+    collection of a single large source (see ``assign_partition``). Each
+    workspace has its own, in its own Chroma database.
+    """
+    if VECTOR_STORE not in VECTOR_STORES:
+        raise ValueError(f"Unknown vector store '{VECTOR_STORE}', expected one of {VECTOR_STORES}")
+    paths = partition_paths(partition, workspace)
+    if VECTOR_STORE == "numpy":
+        from utils.vector_stores import NumpyVectorStore
+
+        logs.log.info("Initializing NumPy vector store at: %s", paths["numpy_store"])
+        return NumpyVectorStore(paths["numpy_store"], compression=VECTOR_COMPRESSION, rescore_factor=RESCORE_FACTOR)
+
+    logs.log.info(f"Initializing ChromaDB vector store at: {paths['persist_dir']} ({paths['collection']})")
     # Ensure the persistence directory exists
-    os.makedirs(PERSIST_DIR, exist_ok=True)
+    os.makedirs(paths["persist_dir"], exist_ok=True)
     try:
-        db = chromadb.PersistentClient(path=PERSIST_DIR)
-        chroma_collection = db.get_or_create_collection("local_rag_collection") # Use a consistent collection name
+        import chromadb # Required by ChromaVectorStore
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+
+        db = chromadb.PersistentClient(path=paths["persist_dir"])
+        hnsw.recover_rebuild(db, paths["collection"])
+        # The HNSW parameters only apply when the collection is created; see utils/hnsw.py
+        hnsw_overrides = hnsw.hnsw_overrides()
+        chroma_collection = db.get_or_create_collection(
+            paths["collection"], configuration={"hnsw": hnsw.get_hnsw_config()}
+        ) # Use a consistent collection name
+        if "ef_search" in hnsw_overrides:
+            hnsw.set_ef_search(chroma_collection, hnsw_overrides["ef_search"])
+        if hnsw.needs_rebuild(chroma_collection, hnsw_overrides):
+            logs.log.warning(
+                "Collection was built with HNSW %s; rebuild it to apply %s",
+                hnsw.collection_hnsw(chroma_collection), hnsw_overrides,
+            )
         vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
         logs.log.info("ChromaDB vector store initialized successfully.")
+        if VECTOR_COMPRESSION != "none":
+            vector_store = get_quantized_store(
+                vector_store, VECTOR_COMPRESSION, RESCORE_FACTOR, path=paths["quantized_index"]
+            )
         return vector_store
     except Exception as e:
         logs.log.error(f"Error initializing ChromaDB: {e}")
         st.error(f"Failed to initialize vector database: {e}")
         st.stop() # Stop if DB connection fails
 
+def get_quantized_store(
+    chroma_store: ChromaVectorStore, compression: str, rescore_factor: int = DEFAULT_RESCORE_FACTOR, path: str = QUANTIZED_INDEX_DIR
+):
+    """
+    Wraps the Chroma store so dense queries search compressed, memory-mapped vectors.
+
+    The quantized index is rebuilt from the embeddings stored in Chroma when it
+    is missing or out of step with the collection (e.g. compression was just
+    turned on), so nothing is re-embedded.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown vector compression '{compression}', expected one of {COMPRESSIONS}")
+    from utils.vector_stores import QuantizedVectorStore
+
+    quantized_index = QuantizedIndex(path, compression=compression, rescore_factor=rescore_factor)
+    collection = chroma_store.client
+    if len(quantized_index) != collection.count():
+        logs.log.info("Rebuilding quantized index from %d stored vectors", collection.count())
+        quantized_index.clear()
+        for ids, embeddings in _chroma_batches(collection, "embeddings"):
+            quantized_index.add(ids, embeddings)
+    return QuantizedVectorStore(chroma_store, quantized_index)
+
+def rebuild_vector_index(vector_store, hnsw_config: Dict = None, on_batch=None, workspace: str = None) -> Dict:
+    """
+    Rebuilds the vector index without re-embedding, and switches every session over to it.
+
+    With Chroma, the collection is re-indexed with ``hnsw_config`` (see
+    ``utils.hnsw.rebuild_collection``), which also drops deleted entries from
+    the graph. The NumPy store and the quantized index are compacted instead.
+    Writes wait for the rebuild; queries keep using the old collection until
+    the swap.
+    """
+    stats = {}
+    with workspace_lock(workspace or current_workspace()).write():
+        if hasattr(vector_store, "compact"):
+            stats["compacted"] = vector_store.compact()
+        chroma_store = getattr(vector_store, "inner", vector_store)
+        if VECTOR_STORE == "chroma":
+            import chromadb
+
+            db = chromadb.PersistentClient(path=partition_paths(workspace=workspace)["persist_dir"])
+            hnsw_config = hnsw_config or hnsw.collection_hnsw(chroma_store.client)
+            rebuilt = hnsw.rebuild_collection(db, chroma_store.client, hnsw_config, on_batch=on_batch)
+            # Every index, retriever and session holds this same store object
+            chroma_store._collection = rebuilt
+            stats["hnsw"] = hnsw.collection_hnsw(rebuilt)
+        stats["vectors"] = vector_store.client.count()
+    return stats
+
 ###################################
 #
 # Embed & Index Nodes
 #
 ###################################
-@st.cache_resource(show_spinner="Embedding and indexing data...")
-# Prefix 'nodes' with an underscore to prevent hashing
-def embed_data(_vector_store: ChromaVectorStore, _nodes: List) -> VectorStoreIndex:
-    """Embeds nodes and creates a new VectorStoreIndex."""
+# Not cached with st.cache_resource: both arguments are unhashed, so every call would
+# return the first index built and silently skip embedding the new nodes.
+def embed_data(_vector_store: ChromaVectorStore, _nodes: List, partition: str = None, workspace: str = None) -> VectorStoreIndex:
+    """Embeds nodes concurrently into a partition's vector store and returns an index over it."""
+    from llama_index.core import Settings
+
     # Use the prefixed argument name here
     logs.log.info(f"Embedding {len(_nodes)} nodes and creating new index.")
     try:
-        # Storage context to persist the index using the vector store
-        storage_context = StorageContext.from_defaults(vector_store=_vector_store)
-        
-        # Create the index. Embedding model is taken from global Settings.embed_model
-        index = VectorStoreIndex(
-            _nodes, # Use the prefixed argument name here
-            storage_context=storage_context,
-            # embed_model=Settings.embed_model is used by default
-            # service_context=Settings is used by default
-            show_progress=True 
-        )
+        if _nodes:
+            mistral.configure_global_settings()
+            # Batches are embedded concurrently and written to Chroma as each one completes.
+            # Embedding model is taken from global Settings.embed_model
+            progress = st.progress(0.0, text="Embedding chunks...")
+            try:
+                stats = embed_nodes(
+                    _nodes,
+                    Settings.embed_model,
+                    _vector_store,
+                    concurrency=st.session_state.get("embedding_concurrency", DEFAULT_CONCURRENCY),
+                    max_batch_tokens=st.session_state.get("embedding_batch_tokens", DEFAULT_MAX_BATCH_TOKENS),
+                    on_batch=lambda done, total: progress.progress(done / total, text=f"Embedded {done}/{total} chunks"),
+                    lock=workspace_lock(workspace or current_workspace()),
+                )
+            finally:
+                progress.empty()
+            st.session_state["embedding_stats"] = stats
+
+            # Keep the partition's BM25 index in step with its vector store
+            lexical_index = get_lexical_index(_vector_store, partition, workspace)
+            lexical_index.add(_nodes)
+            lexical_index.save()
+
+        # The vectors are already stored, so the index is just a view over the vector store
+        index = attach_index(_vector_store)
         logs.log.info("Index created successfully.")
         return index
     except Exception as e:
@@ -132,45 +327,287 @@ def embed_data(_vector_store: ChromaVectorStore, _nodes: List) -> VectorStoreInd
         st.error(f"Failed to create index: {e}")
         return None # Return None on failure
 
+def attach_index(vector_store: ChromaVectorStore) -> VectorStoreIndex:
+    """Returns an index over vectors that are already stored, without embedding anything."""
+    from llama_index.core import VectorStoreIndex
+
+    # The index resolves the embedding model from Settings when it is built
+    mistral.configure_global_settings()
+    return VectorStoreIndex.from_vector_store(vector_store)
+
+@workspace_resource()
+def get_index(partition: str = None, workspace: str = None) -> VectorStoreIndex:
+    """
+    Process-wide index over the persisted Chroma collection, shared by every session
+    of the workspace.
+
+    The index is only a view: ingestion writes to the same collection, so it never
+    needs rebuilding, and a new session is ready as soon as the collection has data.
+    Reads and writes are coordinated by the workspace's ``utils.locks.workspace_lock``.
+    """
+    return attach_index(index_data(partition, workspace))
+
+def has_stored_documents(workspace: str = None) -> bool:
+    """
+    True if the persisted collection already holds vectors (e.g. from an earlier run).
+
+    Answered from the document registry, so the first page render doesn't have to
+    start Chroma; only a collection that predates the registry is counted directly.
+    """
+    if get_registry(workspace).node_count():
+        return True
+    paths = partition_paths(workspace=workspace)
+    store_file = os.path.join(paths["numpy_store"], "nodes.jsonl") if VECTOR_STORE == "numpy" else os.path.join(paths["persist_dir"], "chroma.sqlite3")
+    if not os.path.exists(store_file):
+        return False
+    return index_data(workspace=workspace).client.count() > 0
+
 ###################################
 #
-# Upsert Data into Existing Index
+# Incremental Sync (Document Registry)
 #
 ###################################
-# Note: Direct upsert might depend on the specific vector store implementation.
-# For Chroma, we might need to load the index first or add nodes directly.
-# This implementation assumes we reload the index and let LlamaIndex handle insertion.
-# A more efficient approach might add nodes directly to the vector_store if supported well.
-@st.cache_resource(show_spinner="Updating index...")
-def upsert_data(nodes: List) -> VectorStoreIndex:
-    """'Upserts' data by loading the existing index and inserting new nodes."""
-    logs.log.info(f"Upserting {len(nodes)} new nodes into existing index.")
-    try:
-        # Load the vector store (assuming it was initialized and stored in session state)
-        vector_store = st.session_state.get("vector_store")
-        if not vector_store:
-             logs.log.error("Vector store not found in session state for upsert.")
-             st.error("Vector store not available. Please process initial documents first.")
-             return None
-
-        storage_context = StorageContext.from_defaults(vector_store=vector_store, persist_dir=PERSIST_DIR)
-        
-        # Load the index from storage. This ensures we use the existing embeddings.
-        # Service context (including embed_model) is implicitly loaded via Settings
-        index = load_index_from_storage(storage_context) 
-                                        # service_context=Settings is used by default
-        
-        # Insert new nodes
-        index.insert_nodes(nodes, show_progress=True)
-        
-        # Persist changes (optional depending on vector store auto-persistence)
-        index.storage_context.persist(persist_dir=PERSIST_DIR) 
-        logs.log.info("Index updated successfully.")
-        return index
-    except Exception as e:
-        logs.log.error(f"Error upserting data: {e}")
-        st.error(f"Failed to update index: {e}")
+@workspace_resource()
+def get_registry(workspace: str = None) -> DocumentRegistry:
+    """Loads the document registry that tracks what is stored in the workspace's vector store."""
+    return DocumentRegistry(partition_paths(workspace=workspace)["registry"], workspace=workspace)
+
+
+def chunking_signature(chunk_size: int = None, chunk_overlap: int = None, file_name: str = "") -> str:
+    """
+    Identifies how a file is chunked (its splitter and the chunk settings) in the
+    registry; documents chunked differently are re-ingested.
+    """
+    chunk_size, chunk_overlap = get_chunk_settings(chunk_size, chunk_overlap)
+    return file_chunking_signature(file_name, chunk_size, chunk_overlap)
+
+
+def file_type(file_name: str) -> str:
+    """The ``file_type`` metadata of a file's chunks: its lower-cased extension, e.g. ``pdf``."""
+    return os.path.splitext(file_name)[1].lstrip(".").lower()
+
+
+def assign_partition(registry: DocumentRegistry, source: str, file_count: int) -> Optional[str]:
+    """
+    Returns the partition that the source's vectors are stored in, or ``None`` for
+    the shared collection.
+
+    A source gets its own partition when it is first ingested with at least
+    ``PARTITION_MIN_FILES`` files. Sources that already have documents in the
+    shared collection stay there, so their vectors are never split over two
+    collections.
+    """
+    partition = registry.partition_of(source)
+    if partition is not None or not PARTITION_MIN_FILES or file_count < PARTITION_MIN_FILES:
+        return partition
+    if registry.keys_for_source(source):
         return None
+    partition = hash_text(source)[:16]
+    registry.set_partition(source, partition)
+    registry.save()
+    logs.log.info("Source %s gets its own partition %s (%d files)", source, partition, file_count)
+    return partition
+
+
+def plan_sync(
+    registry: DocumentRegistry,
+    uploaded_files: List,
+    source: str = "local",
+    chunk_size: int = None,
+    chunk_overlap: int = None,
+    prune: bool = True,
+) -> Dict:
+    """
+    Fingerprints the uploaded files and decides which need (re-)ingesting.
+
+    With ``prune`` the uploads are the complete set of documents for the source,
+    so registered documents that are missing from them get removed. Without it
+    (e.g. files added one by one through the service API) nothing is removed.
+
+    Returns:
+        Dict: ``changed`` files to load, ``removed`` document keys of this source
+        that are no longer uploaded, the ``file_hashes`` and ``chunking``
+        signatures per document key, the number of ``unchanged`` files skipped,
+        and the ``ingested_at`` time that new chunks are tagged with.
+    """
+    chunk_size, chunk_overlap = get_chunk_settings(chunk_size, chunk_overlap)
+    plan = {"changed": [], "removed": [], "file_hashes": {}, "chunking": {}, "unchanged": 0, "ingested_at": time.time()}
+
+    for uploaded_file in uploaded_files:
+        doc_key = f"{source}:{uploaded_file.name}"
+        file_hash = hash_upload(uploaded_file)
+        chunking = file_chunking_signature(uploaded_file.name, chunk_size, chunk_overlap)
+        plan["file_hashes"][doc_key] = file_hash
+        plan["chunking"][doc_key] = chunking
+        if registry.is_unchanged(doc_key, file_hash, chunking):
+            plan["unchanged"] += 1
+        else:
+            plan["changed"].append(uploaded_file)
+
+    if prune:
+        plan["removed"] = [key for key in registry.keys_for_source(source) if key not in plan["file_hashes"]]
+    logs.log.info(
+        "Sync plan: %d changed, %d unchanged, %d removed", len(plan["changed"]), plan["unchanged"], len(plan["removed"])
+    )
+    return plan
+
+
+def diff_nodes(registry: DocumentRegistry, nodes: List, plan: Dict, source: str = "local") -> List:
+    """
+    Assigns content-addressed ids to freshly chunked nodes and keeps only the new ones.
+
+    Every chunk is also tagged with the ``FILTER_METADATA_KEYS`` that queries can
+    be limited by. Chunks that are already stored for a document are dropped from the returned list;
+    chunks that disappeared from a document are recorded in ``plan["stale_ids"]`` and
+    the new chunk maps in ``plan["records"]`` so ``apply_sync`` can commit them.
+    May be called repeatedly with the same plan, e.g. once per file while streaming.
+    """
+    from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
+
+    nodes_by_doc: Dict[str, List] = {}
+    for node in nodes:
+        doc_key = f"{source}:{node.metadata.get('file_name')}"
+        nodes_by_doc.setdefault(doc_key, []).append(node)
+
+    new_nodes, stale_ids, records = [], [], {}
+    for doc_key, doc_nodes in nodes_by_doc.items():
+        chunks: Dict[str, str] = {}
+        id_map: Dict[str, str] = {}
+        unique_nodes = []
+        for node in doc_nodes:
+            chunk_hash = hash_text(node.get_content())
+            node_id = chunk_node_id(doc_key, chunk_hash)
+            id_map[node.id_] = node_id
+            if chunk_hash in chunks:
+                continue  # Identical chunk repeated within the same document
+            chunks[chunk_hash] = node_id
+            node.id_ = node_id
+            node.metadata.update(
+                {
+                    "doc_key": doc_key,
+                    "file_hash": plan["file_hashes"].get(doc_key),
+                    "chunk_hash": chunk_hash,
+                    "source": source,
+                    "file_type": file_type(node.metadata.get("file_name") or ""),
+                    "ingested_at": plan.get("ingested_at") or time.time(),
+                }
+            )
+            hidden_keys = set(SYNC_METADATA_KEYS) | set(FILTER_METADATA_KEYS)
+            node.excluded_embed_metadata_keys = list(set(node.excluded_embed_metadata_keys) | hidden_keys)
+            node.excluded_llm_metadata_keys = list(set(node.excluded_llm_metadata_keys) | hidden_keys)
+            unique_nodes.append(node)
+
+        # Keep prev/next links pointing at the renamed nodes
+        for node in unique_nodes:
+            for relation in (NodeRelationship.PREVIOUS, NodeRelationship.NEXT):
+                related = node.relationships.get(relation)
+                if isinstance(related, RelatedNodeInfo) and related.node_id in id_map:
+                    related.node_id = id_map[related.node_id]
+
+        new_hashes, removed_ids = registry.diff_chunks(doc_key, chunks)
+        new_hashes = set(new_hashes)
+        new_nodes.extend(node for node in unique_nodes if node.metadata["chunk_hash"] in new_hashes)
+        stale_ids.extend(removed_ids)
+        records[doc_key] = chunks
+
+    plan.setdefault("stale_ids", []).extend(stale_ids)
+    plan.setdefault("records", {}).update(records)
+    logs.log.info("%d of %d chunks are new, %d stale chunks to delete", len(new_nodes), len(nodes), len(stale_ids))
+    return new_nodes
+
+
+def apply_sync(vector_store: ChromaVectorStore, registry: DocumentRegistry, plan: Dict, source: str = "local"):
+    """Deletes stale vectors and records the new document fingerprints, after embedding succeeded."""
+    stale_ids = list(plan.get("stale_ids", []))
+    for doc_key in plan["removed"]:
+        stale_ids.extend(registry.remove(doc_key))
+    workspace = registry.workspace or current_workspace()
+    lexical_index = get_lexical_index(vector_store, registry.partition_of(source), workspace)
+    with workspace_lock(workspace).write():
+        if stale_ids:
+            vector_store.delete_nodes(node_ids=stale_ids)
+            lexical_index.remove(stale_ids)
+            logs.log.info("Deleted %d stale vectors", len(stale_ids))
+        # Anything cached against the old contents (e.g. answers) is now stale
+        if stale_ids or plan.get("records"):
+            registry.bump_version()
+    lexical_index.save()
+
+    for doc_key, chunks in plan.get("records", {}).items():
+        registry.record(
+            doc_key,
+            source=source,
+            file_name=doc_key.split(":", 1)[1],
+            file_hash=plan["file_hashes"][doc_key],
+            chunking=plan["chunking"][doc_key],
+            chunks=chunks,
+        )
+    registry.save()
+    # Imported here: utils.jobs runs ingestion through this module
+    from utils.jobs import pending_upload_hashes
+
+    # Uploads of jobs still waiting in the queue are not in the registry yet
+    live_hashes = {entry["file_hash"] for entry in registry.snapshot().values()} | pending_upload_hashes(workspace)
+    prune_upload_store(live_hashes, store_dir=data_dir(workspace, "uploads"))
+
+def rollback_sync(vector_store: ChromaVectorStore, registry: DocumentRegistry, plan: Dict, source: str = "local"):
+    """
+    Undoes an ingestion run that failed or was cancelled before ``apply_sync``:
+    vectors that were already written for chunks the registry doesn't know are
+    deleted, so nothing unrecorded stays retrievable.
+    """
+    orphan_ids = []
+    for doc_key, chunks in plan.get("records", {}).items():
+        known = registry.documents.get(doc_key, {}).get("chunks", {})
+        orphan_ids.extend(node_id for chunk_hash, node_id in chunks.items() if chunk_hash not in known)
+    if orphan_ids:
+        workspace = registry.workspace or current_workspace()
+        lexical_index = get_lexical_index(vector_store, registry.partition_of(source), workspace)
+        with workspace_lock(workspace).write():
+            vector_store.delete_nodes(node_ids=orphan_ids)
+            lexical_index.remove(orphan_ids)
+        lexical_index.save()
+        logs.log.info("Rolled back up to %d vectors of an unfinished ingestion run", len(orphan_ids))
+
+###################################
+#
+# Lexical (BM25) Index
+#
+###################################
+@workspace_resource(show_spinner="Loading keyword index...")
+def get_lexical_index(_vector_store: ChromaVectorStore, partition: str = None, workspace: str = None) -> BM25Index:
+    """Loads the BM25 index of a partition's vector store, rebuilding it from the store if it is missing."""
+    lexical_index = BM25Index(partition_paths(partition, workspace)["lexical_index"])
+    collection = _vector_store.client
+    if not len(lexical_index) and collection.count():
+        logs.log.info(f"Rebuilding BM25 index from {collection.count()} stored nodes")
+        # The NumPy store reads its own sidecar; Chroma is paged through
+        batches = collection.iter_stored() if hasattr(collection, "iter_stored") else _chroma_batches(collection, "documents")
+        for ids, texts in batches:
+            for node_id, text in zip(ids, texts):
+                lexical_index.add_text(node_id, text or "")
+        lexical_index.save()
+    return lexical_index
+
+def _chroma_batches(collection, include: str, batch_size: int = 1000):
+    """Yields the ids and one stored field (``documents`` or ``embeddings``) of a Chroma collection, page by page."""
+    offset = 0
+    while True:
+        batch = collection.get(limit=batch_size, offset=offset, include=[include])
+        if not len(batch["ids"]):
+            break
+        yield batch["ids"], batch[include]
+        offset += len(batch["ids"])
+
+###################################
+#
+# Answer Cache
+#
+###################################
+@workspace_resource()
+def get_answer_cache(workspace: str = None) -> AnswerCache:
+    """Cache of the workspace's chat answers, invalidated whenever its registry's index version changes."""
+    return AnswerCache()
 
 ###################################
 #
@@ -180,7 +617,7 @@ def upsert_data(nodes: List) -> VectorStoreIndex:
 # This function seems UI related, might belong in the tab itself or a UI helper
 def view_data():
     """Placeholder function to potentially display info about indexed data."""
-    if "index" in st.session_state and st.session_state["index"]:
+    if st.session_state.get("index") or has_stored_documents():
         st.success("Data is indexed and ready.")
         # You could add more details here, like number of documents/nodes indexed.
         # Accessing underlying vector store info might be complex/store-specific.
@@ -212,23 +649,180 @@ def view_data():
 # Create Query Engine (Still potentially useful, but uses global Settings now)
 #
 ###################################
-@st.cache_resource(show_spinner=False)
-def create_query_engine(_index: VectorStoreIndex): # Takes index as input
-    """ Creates a query engine from the given index, using global Settings. """
+def _filter_items(filters: Dict = None) -> Tuple:
+    """The set filters of a ``QUERY_FILTERS`` dict as sorted, hashable (name, value) pairs."""
+    items = []
+    for name, value in (filters or {}).items():
+        if name not in QUERY_FILTERS:
+            raise ValueError(f"Unknown query filter '{name}', expected one of {list(QUERY_FILTERS)}")
+        if value is None or (isinstance(value, (list, tuple, set)) and not value):
+            continue
+        items.append((name, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value))
+    return tuple(sorted(items))
+
+
+def answer_scope(
+    filters: Dict = None,
+    retrieval_mode: str = "hybrid",
+    top_k: int = DEFAULT_TOP_K,
+    fetch_k: int = DEFAULT_FETCH_K,
+    reranker: str = "none",
+    system_prompt: str = None,
+) -> str:
+    """
+    Identifies everything besides the prompt and the documents that an answer
+    depends on: the query filters, the retrieval and reranking settings, the
+    LLM and the system prompt. Cached answers are only reused within one scope,
+    so changing a setting takes effect on the next question.
+    """
+    from llama_index.core import Settings
+
+    # The LLM is read from Settings, which must not resolve a default one
+    mistral.configure_global_settings()
+    return json.dumps(
+        {
+            "filters": _filter_items(filters),
+            "retrieval_mode": retrieval_mode,
+            "top_k": top_k,
+            # Without a reranker, top_k candidates are retrieved directly
+            "fetch_k": fetch_k if reranker != "none" else None,
+            "reranker": reranker,
+            "model": getattr(Settings.llm, "model", None),
+            "system_prompt": system_prompt,
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+
+def metadata_filters(items: Tuple) -> Optional[MetadataFilters]:
+    """LlamaIndex metadata filters for ``_filter_items`` pairs, or ``None`` if there are none."""
+    from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters
+
+    clauses = []
+    for name, value in items:
+        if name == "ingested_after":
+            clauses.append(MetadataFilter(key=QUERY_FILTERS[name], value=float(value), operator=FilterOperator.GTE))
+        else:
+            clauses.append(MetadataFilter(key=QUERY_FILTERS[name], value=list(value), operator=FilterOperator.IN))
+    return MetadataFilters(filters=clauses) if clauses else None
+
+
+def query_partitions(registry: DocumentRegistry, filters: Dict = None) -> Tuple:
+    """
+    Decides which collections a query searches, and which filters are left to apply in each.
+
+    Without a ``sources`` (or ``documents``) filter, the shared collection and
+    every partition are searched. With one, only the collections holding those
+    sources are. A partition holds a single source, so its source filter is
+    dropped and an otherwise unfiltered query keeps the fast unfiltered path.
+
+    Returns:
+        Tuple: (partition, filter items) pairs, where ``None`` is the shared collection.
+    """
+    items = dict(_filter_items(filters))
+    if "sources" in items:
+        selected = set(items["sources"])
+    elif "documents" in items:
+        registered = registry.snapshot()
+        selected = {registered[key]["source"] for key in items["documents"] if key in registered}
+    else:
+        selected = None
+
+    if selected is None:
+        partitions = [None] + sorted(set(registry.partition_map().values()))
+    else:
+        partitions = sorted({registry.partition_of(source) for source in selected}, key=lambda partition: partition or "")
+    layout = []
+    for partition in partitions or [None]:
+        partition_items = dict(items)
+        if partition is not None:
+            partition_items.pop("sources", None)
+        elif "sources" in items:
+            partition_items["sources"] = tuple(source for source in items["sources"] if registry.partition_of(source) is None)
+        layout.append((partition, tuple(sorted(partition_items.items()))))
+    return tuple(layout)
+
+
+def create_query_engine(
+    _index: VectorStoreIndex,
+    retrieval_mode: str = "hybrid",
+    top_k: int = DEFAULT_TOP_K,
+    fetch_k: int = DEFAULT_FETCH_K,
+    reranker: str = "none",
+    filters: Dict = None,
+    workspace: str = None,
+): # Takes index as input
+    """
+    Creates a query engine from the given index, using global Settings.
+
+    With a reranker, ``fetch_k`` candidates are retrieved and only the best
+    ``top_k`` after reranking are sent to the LLM. Without one, the retriever
+    returns ``top_k`` directly.
+
+    ``filters`` (see ``QUERY_FILTERS``) limit retrieval to matching chunks, and
+    to the partitions that can hold them (see ``query_partitions``). The index
+    must be the ``workspace``'s, like its other partitions.
+    """
     if not _index:
         logs.log.error("Cannot create query engine from None index.")
         st.error("Index is not available. Cannot create query engine.")
         return None
-    logs.log.info("Creating query engine...")
     try:
-        # LLM and Embed Model are picked from global Settings automatically
-        query_engine = _index.as_query_engine(
-            # similarity_top_k=st.session_state.get("top_k", 3), # Example if top_k is needed
+        layout = query_partitions(get_registry(workspace), filters)
+    except ValueError as e:
+        logs.log.error(f"Error when creating Query Engine: {e}")
+        st.error(f"Failed to create query engine: {e}")
+        return None
+    query_engine = _create_query_engine(_index, retrieval_mode, top_k, fetch_k, reranker, layout, workspace)
+    if query_engine:
+        st.session_state["query_engine"] = query_engine # Store in session state
+    return query_engine
+
+
+# Cached per partition layout, so an engine is rebuilt when a new partition appears
+@workspace_resource()
+def _create_query_engine(
+    _index: VectorStoreIndex, retrieval_mode: str, top_k: int, fetch_k: int, reranker: str, layout: Tuple, workspace: str = None
+):
+    logs.log.info(
+        f"Creating query engine with {retrieval_mode} retrieval and reranker {reranker} over {len(layout)} partition(s)..."
+    )
+    try:
+        from llama_index.core.query_engine import RetrieverQueryEngine
+
+        from utils.rerankers import get_reranker
+        from utils.retrievers import HybridRetriever, RetrievalPartition
+
+        # The LLM and embedding clients are only built once something needs them
+        mistral.configure_global_settings()
+
+        postprocessor = get_reranker(reranker, top_k)
+        candidates = max(top_k, fetch_k) if postprocessor else top_k
+        partitions = []
+        for partition, items in layout:
+            index = _index if partition is None else get_index(partition, workspace)
+            filters = metadata_filters(items)
+            partitions.append(
+                RetrievalPartition(
+                    index.as_retriever(similarity_top_k=candidates, filters=filters),
+                    get_lexical_index(index.vector_store, partition, workspace),
+                    index.vector_store,
+                    filters,
+                )
+            )
+        # Dense retrieval, BM25, or both fused; see utils/retrievers.py
+        retriever = HybridRetriever(
+            partitions, mode=retrieval_mode, top_k=candidates, lock=workspace_lock(workspace)
+        )
+        # LLM is picked from global Settings automatically
+        query_engine = RetrieverQueryEngine.from_args(
+            retriever,
+            node_postprocessors=[postprocessor] if postprocessor else None,
             # service_context=Settings is used by default
             streaming=True, 
         )
         logs.log.info("Query engine created successfully.")
-        st.session_state["query_engine"] = query_engine # Store in session state
         return query_engine
     except Exception as e:
         logs.log.error(f"Error when creating Query Engine: {e}")
@@ -0,0 +1,73 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from utils.workspaces import DEFAULT_WORKSPACE
+
+###################################
+#
+# Readers-Writer Lock
+#
+###################################
+
+
+class ReadWriteLock:
+    """
+    Any number of concurrent readers, or a single writer.
+
+    Writers are preferred: once one is waiting, new readers queue behind it, so
+    a steady stream of queries cannot starve an upsert. Not reentrant — don't
+    take the read lock while holding the write lock or vice versa.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            self._condition.wait_for(lambda: not self._writer and not self._readers)
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+# Guards a workspace's vector stores: retrieval reads under it, and every write to
+# the collection holds it briefly, so each added batch and each deletion of stale
+# chunks is applied atomically for queries. A run as a whole is not: while a changed
+# document is re-ingested, a query may see some of its new chunks next to the old
+# ones. Writers hold it per batch, so queries keep being answered while documents load.
+# Each workspace has its own, so one workspace's rebuild never stalls another's queries.
+_workspace_locks: Dict[str, ReadWriteLock] = {}
+_workspace_locks_guard = threading.Lock()
+
+
+def workspace_lock(workspace: str) -> ReadWriteLock:
+    with _workspace_locks_guard:
+        return _workspace_locks.setdefault(workspace, ReadWriteLock())
+
+
+# The default workspace's
+index_lock = workspace_lock(DEFAULT_WORKSPACE)
@@ -1,27 +1,158 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import time
 
+# Logging is configured through the environment, so the app, the service and
+# the job worker all log the same way:
+#   LOCAL_RAG_LOG_LEVEL     DEBUG, INFO (default), WARNING, ...
+#   LOCAL_RAG_LOG_FORMAT    "text" (default) or "json" (one object per line)
+#   LOCAL_RAG_LOG_ROTATION  "size" (default), "time" (daily) or "none"
+#   LOCAL_RAG_LOG_QUEUE     "1" (default) writes from a background thread; "0" writes inline
+LOG_LEVEL = os.environ.get("LOCAL_RAG_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOCAL_RAG_LOG_FORMAT", "text")
+LOG_ROTATION = os.environ.get("LOCAL_RAG_LOG_ROTATION", "size")
+LOG_QUEUE = os.environ.get("LOCAL_RAG_LOG_QUEUE", "1") != "0"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
 
-def setup_logger(log_file="local-rag.log", level=logging.INFO):
+# Set at the entry points (script run, service request, ingestion job) and
+# attached to every record logged while handling it
+request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+session_id: contextvars.ContextVar = contextvars.ContextVar("session_id", default=None)
+
+_listeners = []
+
+###################################
+#
+# Record Context and Formatting
+#
+###################################
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the current request and session ids, on the thread that logged them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        record.session_id = session_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "module": record.module,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "session_id": getattr(record, "session_id", None),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _ThreadQueueHandler(logging.handlers.QueueHandler):
+    # The stdlib handler formats the message before queueing it, so that records
+    # can cross process boundaries. Ours stay in-process, so the %-style
+    # arguments are merged by the writer thread instead of the logging one.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+###################################
+#
+# Handlers
+#
+###################################
+
+
+def _file_handler(log_file: str, rotation: str) -> logging.Handler:
+    if rotation == "size":
+        return logging.handlers.RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    if rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(log_file, when="midnight", backupCount=LOG_BACKUPS)
+    return logging.FileHandler(log_file)
+
+
+def _attach(logger: logging.Logger, handlers, queued: bool) -> None:
+    """Adds the handlers to the logger, behind a queue and a writer thread when ``queued``."""
+    if not queued:
+        for handler in handlers:
+            handler.addFilter(ContextFilter())
+            logger.addHandler(handler)
+        return
+    queue_handler = _ThreadQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(ContextFilter())
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    logger.addHandler(queue_handler)
+
+
+@atexit.register
+def flush() -> None:
+    """Writes out everything still queued. Runs at interpreter exit."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+###################################
+#
+# Loggers
+#
+###################################
+
+
+def setup_logger(
+    log_file="local-rag.log",
+    level=LOG_LEVEL,
+    log_format=LOG_FORMAT,
+    rotation=LOG_ROTATION,
+    queued=LOG_QUEUE,
+):
     logger = logging.getLogger(__name__)
     logger.setLevel(level)
 
-    file_handler = logging.FileHandler(log_file)
+    file_handler = _file_handler(log_file, rotation)
     file_handler.setLevel(level)
 
     console_handler = logging.StreamHandler(stream=sys.stdout)
     console_handler.setLevel(level)
 
-    log_format = logging.Formatter(
-        "%(asctime)s - %(module)s - %(levelname)s - %(message)s"
-    )
-    file_handler.setFormatter(log_format)
-    console_handler.setFormatter(log_format)
+    if log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(module)s - %(levelname)s - %(message)s")
+    file_handler.setFormatter(formatter)
+    console_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    _attach(logger, [file_handler, console_handler], queued)
 
     return logger
 
 
 log = setup_logger()
+
+
+def setup_metrics_logger(log_file="local-rag-metrics.jsonl", rotation=LOG_ROTATION, queued=LOG_QUEUE):
+    """Structured records (one JSON object per line), kept out of the human-readable log."""
+    logger = logging.getLogger(f"{__name__}.metrics")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    file_handler = _file_handler(log_file, rotation)
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    _attach(logger, [file_handler], queued)
+
+    return logger
+
+
+metrics = setup_metrics_logger()
@@ -1,29 +1,54 @@
+from __future__ import annotations
+
 import os
+from typing import TYPE_CHECKING
+
 import streamlit as st
-from llama_index.llms.mistralai import MistralAI
-from llama_index.embeddings.mistralai import MistralAIEmbedding
-from llama_index.core import Settings
 import utils.logs as logs
+from utils.embedding_cache import EmbeddingCache
+
+# The Mistral SDK and LlamaIndex clients are imported when the models are first
+# built, not at startup; see configure_global_settings
+if TYPE_CHECKING:
+    from llama_index.embeddings.mistralai import MistralAIEmbedding
+    from llama_index.llms.mistralai import MistralAI
 
 # Define default models - check Mistral AI documentation for latest/recommended models
 DEFAULT_MISTRAL_MODEL = "mistral-small-latest"
 DEFAULT_MISTRAL_EMBEDDING = "mistral-embed"
 
+def get_secret(name: str):
+    """Reads a setting from Streamlit secrets, falling back to the environment variable of the same name."""
+    try:
+        return st.secrets.get(name, os.environ.get(name))
+    except FileNotFoundError:
+        # st.secrets raises instead of returning the default when there is no secrets.toml
+        return os.environ.get(name)
+
 def get_mistral_api_key():
     """Retrieves the Mistral API key from Streamlit secrets or environment variables."""
-    api_key = st.secrets.get("MISTRAL_API_KEY", os.environ.get("MISTRAL_API_KEY"))
+    api_key = get_secret("MISTRAL_API_KEY")
     if not api_key:
         logs.log.error("Mistral API key not found.")
         st.error("Mistral API key not found. Please set MISTRAL_API_KEY in your Streamlit secrets.")
         st.stop() # Stop execution if key is missing
     return api_key
 
+def get_mistral_endpoint():
+    """
+    Optional override of the Mistral API base URL (e.g. a local fake server for
+    load tests). Read from Streamlit secrets or the MISTRAL_ENDPOINT variable.
+    """
+    return get_secret("MISTRAL_ENDPOINT") or None
+
 @st.cache_resource(show_spinner=False)
 def get_mistral_llm(model_name: str = DEFAULT_MISTRAL_MODEL) -> MistralAI:
     """Get a cached instance of the MistralAI LLM."""
+    from llama_index.llms.mistralai import MistralAI
+
     api_key = get_mistral_api_key()
     try:
-        llm = MistralAI(model=model_name, api_key=api_key)
+        llm = MistralAI(model=model_name, api_key=api_key, endpoint=get_mistral_endpoint())
         logs.log.info(f"MistralAI LLM initialized with model: {model_name}")
         return llm
     except Exception as e:
@@ -31,12 +56,21 @@ def get_mistral_llm(model_name: str = DEFAULT_MISTRAL_MODEL) -> MistralAI:
         st.error(f"Failed to initialize Mistral LLM: {e}")
         st.stop()
 
+@st.cache_resource(show_spinner=False)
+def get_embedding_cache() -> EmbeddingCache:
+    """Get the process-wide on-disk embedding cache."""
+    return EmbeddingCache()
+
 @st.cache_resource(show_spinner=False)
 def get_mistral_embedding(model_name: str = DEFAULT_MISTRAL_EMBEDDING) -> MistralAIEmbedding:
-    """Get a cached instance of the MistralAIEmbedding model."""
+    """Get a cached instance of the MistralAIEmbedding model, backed by the embedding cache."""
+    from utils.mistral_embedding import CachedMistralAIEmbedding
+
     api_key = get_mistral_api_key()
     try:
-        embed_model = MistralAIEmbedding(model_name=model_name, api_key=api_key)
+        embed_model = CachedMistralAIEmbedding(
+            cache=get_embedding_cache(), model_name=model_name, api_key=api_key, endpoint=get_mistral_endpoint()
+        )
         logs.log.info(f"MistralAI Embedding model initialized with model: {model_name}")
         return embed_model
     except Exception as e:
@@ -44,8 +78,17 @@ def get_mistral_embedding(model_name: str = DEFAULT_MISTRAL_EMBEDDING) -> Mistra
         st.error(f"Failed to initialize Mistral Embedding model: {e}")
         st.stop()
 
+@st.cache_resource(show_spinner="Connecting to Mistral...")
 def configure_global_settings(llm_model: str = DEFAULT_MISTRAL_MODEL, embed_model: str = DEFAULT_MISTRAL_EMBEDDING):
-    """Configures LlamaIndex global settings with Mistral models."""
+    """
+    Configures LlamaIndex global settings with Mistral models.
+
+    Runs once per process. It is called when the first query engine or ingestion
+    job needs the models, not at startup, so the page renders without importing
+    the Mistral SDK.
+    """
+    from llama_index.core import Settings
+
     logs.log.info(f"Configuring global LlamaIndex settings with Mistral LLM: {llm_model} and Embedding: {embed_model}")
     try:
         Settings.llm = get_mistral_llm(model_name=llm_model)
@@ -58,6 +101,3 @@ def configure_global_settings(llm_model: str = DEFAULT_MISTRAL_MODEL, embed_mode
         # Errors during initialization are already logged and handled in get_mistral_llm/get_mistral_embedding
         logs.log.error(f"Failed to configure global LlamaIndex settings: {e}")
         # No need to st.stop() here as it's already handled in the getter functions
-
-# It's recommended to call configure_global_settings() early in your app initialization,
-# e.g., at the beginning of main.py, after imports but before other components are loaded. 
@@ -0,0 +1,79 @@
+from typing import List
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.mistralai import MistralAIEmbedding
+from mistralai import Mistral
+
+from utils.embedding_cache import EmbeddingCache, normalize_text
+
+# Imported by utils.mistral only when the embedding model is first built, since
+# the Mistral SDK and LlamaIndex take seconds to import
+
+
+class CachedMistralAIEmbedding(MistralAIEmbedding):
+    """MistralAIEmbedding that only sends chunks missing from the embedding cache to the API."""
+
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, cache: EmbeddingCache, endpoint: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = cache
+        if endpoint:
+            self._client = Mistral(api_key=kwargs.get("api_key"), server_url=endpoint)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedMistralAIEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _split_cached(self, texts: List[str]):
+        """
+        Looks texts up in the cache. Returns the partial results and a mapping of
+        each distinct missing chunk to the positions it fills, so repeated chunks
+        within one batch are only embedded once.
+        """
+        results = self._cache.get_many(self.model_name, texts)
+        missing = {}
+        for i, vector in enumerate(results):
+            if vector is None:
+                missing.setdefault(normalize_text(texts[i]), []).append(i)
+        return results, missing
+
+    def _merge_fresh(self, results: List, missing: dict, fresh: List[List[float]]):
+        if len(fresh) != len(missing) or any(vector is None for vector in fresh):
+            raise ValueError(f"Embedding API returned {len(fresh)} vectors for {len(missing)} inputs")
+        self._cache.put_many(self.model_name, list(missing), fresh)
+        for positions, vector in zip(missing.values(), fresh):
+            for i in positions:
+                results[i] = vector
+        return results
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        results, missing = self._split_cached(texts)
+        if missing:
+            fresh = super()._get_text_embeddings([texts[positions[0]] for positions in missing.values()])
+            results = self._merge_fresh(results, missing, fresh)
+        return results
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        results, missing = self._split_cached(texts)
+        if missing:
+            fresh = await super()._aget_text_embeddings([texts[positions[0]] for positions in missing.values()])
+            results = self._merge_fresh(results, missing, fresh)
+        return results
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    # mistral-embed uses the same vector space for queries and documents
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aget_text_embeddings([query]))[0]
@@ -0,0 +1,225 @@
+import ast
+import re
+from typing import Iterator, List, NamedTuple
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser import SentenceSplitter, TokenTextSplitter
+from llama_index.core.node_parser.interface import MetadataAwareTextSplitter, TextSplitter
+from llama_index.core.utils import get_tokenizer
+
+# A too-large unit is sentence-split into pieces of at least this share of chunk_size,
+# even when a long context prefix (e.g. deep headings) leaves less room
+MIN_FALLBACK_SHARE = 0.5
+
+HEADING = re.compile(r"^ {0,3}(#{1,6})(?:[ \t]+|$)")
+FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+
+class Unit(NamedTuple):
+    """
+    A piece of a document that should not be cut, e.g. a function or a section.
+
+    ``context`` is text a reader needs to make sense of it (the enclosing class
+    line, the parent headings); it is repeated at the top of a chunk that starts
+    with this unit. ``opens`` is the context this unit establishes (a class
+    header opens its class, a heading its section): units after it with that
+    context may share its chunk, and it is repeated above every piece of the
+    unit itself if the unit has to be split.
+    """
+
+    context: str
+    text: str
+    opens: str
+
+
+class StructuredSplitter(MetadataAwareTextSplitter):
+    """
+    Splits a document on its structure instead of on sentences.
+
+    Subclasses cut the text into units (``_units``). Consecutive units that
+    share a context are packed into chunks of up to ``chunk_size`` tokens, so a
+    chunk never ends in the middle of a unit. A unit larger than a chunk is
+    split with the sentence splitter, each piece prefixed with its context.
+    ``chunk_overlap`` only applies to those pieces: structural boundaries need
+    no overlap. Text that can't be parsed is split by sentences altogether.
+    """
+
+    chunk_size: int = Field(description="Maximum chunk size in tokens.", gt=0)
+    chunk_overlap: int = Field(description="Token overlap of the pieces of a unit too large for one chunk.", ge=0)
+
+    _tokenizer = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tokenizer = get_tokenizer()
+
+    def split_text(self, text: str) -> List[str]:
+        return self._split(text, self.chunk_size)
+
+    def split_text_metadata_aware(self, text: str, metadata_str: str) -> List[str]:
+        # Metadata is embedded with every chunk, so it takes part of the budget (as in SentenceSplitter)
+        return self._split(text, max(self.chunk_size - self._count(metadata_str), 1))
+
+    def _units(self, text: str, chunk_size: int) -> List[Unit]:
+        raise NotImplementedError
+
+    def _count(self, text: str) -> int:
+        return len(self._tokenizer(text))
+
+    def _split(self, text: str, chunk_size: int) -> List[str]:
+        if not text.strip():
+            return []
+        try:
+            units = self._units(text, chunk_size)
+        except (SyntaxError, ValueError, RecursionError):
+            return self._fallback(text, chunk_size)
+        return self._pack(units, chunk_size)
+
+    def _fallback(self, text: str, chunk_size: int) -> List[str]:
+        budget = max(chunk_size, int(self.chunk_size * MIN_FALLBACK_SHARE))
+        return self._piece_splitter(budget, min(self.chunk_overlap, budget // 2)).split_text(text)
+
+    def _piece_splitter(self, chunk_size: int, chunk_overlap: int) -> TextSplitter:
+        return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    def _pack(self, units: List[Unit], chunk_size: int) -> List[str]:
+        chunks: List[str] = []
+        current: List[str] = []
+        tokens = 0
+        contexts = set()
+
+        def flush():
+            chunk = "".join(current).lstrip("\n").rstrip()
+            if chunk.strip():
+                chunks.append(chunk)
+            current.clear()
+
+        for unit in units:
+            if not unit.text.strip():
+                continue
+            size = self._count(unit.text)
+            if current and unit.context in contexts and tokens + size <= chunk_size:
+                current.append(unit.text)
+                tokens += size
+                contexts.add(unit.opens)
+                continue
+
+            flush()
+            context_size = self._count(unit.context) if unit.context else 0
+            if context_size + size <= chunk_size:
+                current.extend([unit.context, unit.text])
+                tokens = context_size + size
+                contexts = {unit.context, unit.opens}
+            else:
+                # Too large for one chunk: later pieces repeat the unit's own header, so none is orphaned
+                budget = chunk_size - max(context_size, self._count(unit.opens))
+                for index, piece in enumerate(self._fallback(unit.text, budget)):
+                    chunks.append(f"{unit.context if index == 0 else unit.opens}{piece}".strip())
+        flush()
+        return chunks
+
+
+class PythonSplitter(StructuredSplitter):
+    """
+    Splits Python source on top-level function and class boundaries (``ast``).
+
+    Decorators and the comment block right above a definition stay with it;
+    module-level code between definitions forms its own units. A class larger
+    than a chunk is split into its methods, each chunk starting with the
+    ``class`` line. A definition larger than a chunk is split on line breaks,
+    each piece starting with its ``def`` or ``class`` line.
+    """
+
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PythonSplitter"
+
+    def _piece_splitter(self, chunk_size: int, chunk_overlap: int) -> TextSplitter:
+        # Sentence and comma boundaries mean nothing in code; whole lines do
+        return TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, separator="\n", backup_separators=[" "])
+
+    def _units(self, text: str, chunk_size: int) -> List[Unit]:
+        tree = ast.parse(text)
+        lines = text.splitlines(keepends=True)
+        return list(self._block_units(tree.body, lines, 0, len(lines), "", chunk_size))
+
+    def _block_units(self, nodes, lines: List[str], start: int, end: int, context: str, chunk_size: int) -> Iterator[Unit]:
+        position = start
+        for node in nodes:
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            first = self._definition_start(node, lines, position)
+            if first > position:
+                yield Unit(context, "".join(lines[position:first]), context)
+
+            text = "".join(lines[first : node.end_lineno])
+            nested = [child for child in node.body if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            if isinstance(node, ast.ClassDef) and nested and self._count(text) > chunk_size:
+                class_context = context + lines[node.lineno - 1]
+                header_end = self._definition_start(nested[0], lines, node.lineno)
+                yield Unit(context, "".join(lines[first:header_end]), class_context)
+                yield from self._block_units(node.body, lines, header_end, node.end_lineno, class_context, chunk_size)
+            else:
+                yield Unit(context, text, context + lines[node.lineno - 1])
+            position = node.end_lineno
+
+        if position < end:
+            yield Unit(context, "".join(lines[position:end]), context)
+
+    @staticmethod
+    def _definition_start(node, lines: List[str], floor: int) -> int:
+        """Index of the first line of a definition, including decorators and the comments above it."""
+        first = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list]) - 1
+        while first > floor and lines[first - 1].lstrip().startswith("#"):
+            first -= 1
+        return first
+
+
+class MarkdownSplitter(StructuredSplitter):
+    """
+    Splits Markdown by its heading hierarchy.
+
+    Each heading starts a section; sibling sections are packed together and a
+    chunk that starts inside a section repeats the headings above it. ``#``
+    lines inside fenced code blocks are not headings.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MarkdownSplitter"
+
+    def _units(self, text: str, chunk_size: int) -> List[Unit]:
+        units: List[Unit] = []
+        headings: List[tuple] = []  # (level, line) of the open sections
+        section: List[str] = []
+        context = opens = ""
+        fence = None
+
+        for line in text.splitlines(keepends=True):
+            if fence:
+                if line.lstrip().startswith(fence):
+                    fence = None
+                section.append(line)
+                continue
+            fence_match = FENCE.match(line)
+            if fence_match:
+                fence = fence_match.group(1)
+                section.append(line)
+                continue
+            heading = HEADING.match(line)
+            if not heading:
+                section.append(line)
+                continue
+
+            units.append(Unit(context, "".join(section), opens))
+            level = len(heading.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            context = "".join(heading_line for _, heading_line in headings)
+            headings.append((level, line if line.endswith("\n") else line + "\n"))
+            opens = context + headings[-1][1]
+            section = [line]
+
+        units.append(Unit(context, "".join(section), opens))
+        return units
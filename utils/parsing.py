@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import utils.logs as logs
+from utils.splitters import split_documents
+
+if TYPE_CHECKING:
+    from llama_index.core import Document
+
+# PDFs longer than this are split into page ranges so one large file can use several cores
+PAGES_PER_TASK = 25
+
+DEFAULT_PARSE_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+# Below this much text, chunking in-process beats sending documents to the pool
+PARALLEL_SPLIT_CHARS = 1_000_000
+
+# Same keys SimpleDirectoryReader hides from the embedding model and the LLM
+EXCLUDED_FILE_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+###################################
+#
+# Worker Functions (run in child processes)
+#
+###################################
+
+
+def _finalize(documents: List[Document], file_name: str, chunking: Optional[Tuple[int, int]]) -> List:
+    for document in documents:
+        # The file lives in a throwaway directory; a stable path keeps the embedded
+        # text (and therefore the embedding cache key) identical across uploads
+        document.metadata["file_name"] = file_name
+        document.metadata["file_path"] = file_name
+    if chunking:
+        # Chunking here spreads it over the pool too, and sends fewer objects back
+        return split_documents(documents, *chunking)
+    return documents
+
+
+def _parse_whole_file(file_path: str, file_name: str, chunking: Optional[Tuple[int, int]] = None) -> Tuple[List, float]:
+    from llama_index.core import SimpleDirectoryReader
+
+    start = time.perf_counter()
+    try:
+        documents = SimpleDirectoryReader(input_files=[file_path], raise_on_error=True).load_data()
+    except Exception as e:
+        # SimpleDirectoryReader and its retries wrap the parser error; report the root cause
+        while e.__cause__ is not None:
+            e = e.__cause__
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    return _finalize(documents, file_name, chunking), time.perf_counter() - start
+
+
+def _parse_pdf_pages(
+    file_path: str, file_name: str, first_page: int, last_page: int, chunking: Optional[Tuple[int, int]] = None
+) -> Tuple[List, float]:
+    """Extracts pages [first_page, last_page) the same way LlamaIndex's PDFReader does."""
+    import pypdf
+    from llama_index.core import Document
+    from llama_index.core.readers.file.base import default_file_metadata_func
+
+    start = time.perf_counter()
+    metadata = default_file_metadata_func(file_path)
+    documents = []
+    with open(file_path, "rb") as f:
+        pdf = pypdf.PdfReader(f)
+        for page in range(first_page, last_page):
+            document = Document(
+                text=pdf.pages[page].extract_text(),
+                metadata={"page_label": pdf.page_labels[page], **metadata},
+            )
+            document.excluded_embed_metadata_keys.extend(EXCLUDED_FILE_METADATA_KEYS)
+            document.excluded_llm_metadata_keys.extend(EXCLUDED_FILE_METADATA_KEYS)
+            documents.append(document)
+    return _finalize(documents, file_name, chunking), time.perf_counter() - start
+
+
+def _count_pdf_pages(file_path: str) -> int:
+    try:
+        import pypdf
+
+        with open(file_path, "rb") as f:
+            return len(pypdf.PdfReader(f).pages)
+    except Exception:
+        # Let the real parse attempt surface the error
+        return 0
+
+
+###################################
+#
+# Process Pool
+#
+###################################
+
+_pool_lock = threading.Lock()
+_pool: ProcessPoolExecutor = None
+_pool_workers = 0
+
+
+def get_parse_pool(workers: int = DEFAULT_PARSE_WORKERS) -> ProcessPoolExecutor:
+    """
+    Returns a shared process pool, recreating it if the worker count changed or a
+    worker crashed. Uses 'spawn' so children don't inherit Streamlit's threads.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers or getattr(_pool, "_broken", False):
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+            logs.log.info(f"Started document parsing pool with {workers} workers")
+        return _pool
+
+
+class FileParse:
+    """
+    Tracks the parse tasks of one file. PDFs may be split into several page ranges;
+    the file is done once every range has finished. With ``chunking`` the tasks
+    also chunk what they parsed and return nodes instead of documents.
+    """
+
+    def __init__(self, file_name: str, file_path: str, futures: List[Future], chunking: Optional[Tuple[int, int]] = None):
+        self.file_name = file_name
+        self.file_path = file_path
+        self.futures = futures
+        self.chunking = chunking
+        self.crashed = False
+        self.attempts = 1
+
+    def done(self) -> bool:
+        return all(future.done() for future in self.futures)
+
+    def result(self) -> Tuple[List, float, str]:
+        """Returns (documents or nodes in page order, seconds of work, error message or None)."""
+        documents, seconds = [], 0.0
+        for future in self.futures:
+            try:
+                part, part_seconds = future.result()
+            except BrokenProcessPool:
+                self.crashed = True
+                return [], seconds, "parser process crashed"
+            except Exception as e:
+                return [], seconds, str(e) or type(e).__name__
+            documents.extend(part)
+            seconds += part_seconds
+        return documents, seconds, None
+
+
+def submit_file(
+    pool: ProcessPoolExecutor, file_name: str, file_path: str, chunking: Optional[Tuple[int, int]] = None
+) -> FileParse:
+    """
+    Schedules a file for parsing, split into page-range tasks if it is a long PDF.
+    With ``chunking`` (chunk size and overlap) the file is chunked in the same task.
+    """
+    pages = _count_pdf_pages(file_path) if file_name.lower().endswith(".pdf") else 0
+    if pages > PAGES_PER_TASK:
+        futures = [
+            pool.submit(_parse_pdf_pages, file_path, file_name, first, min(first + PAGES_PER_TASK, pages), chunking)
+            for first in range(0, pages, PAGES_PER_TASK)
+        ]
+    else:
+        futures = [pool.submit(_parse_whole_file, file_path, file_name, chunking)]
+    return FileParse(file_name, file_path, futures, chunking)
+
+
+def parse_files(files: List[Tuple[str, str]], workers: int = DEFAULT_PARSE_WORKERS) -> Tuple[List[Document], Dict, Dict]:
+    """
+    Parses ``(file_name, file_path)`` pairs in parallel.
+
+    Returns:
+        Tuple[List[Document], Dict, Dict]: all documents, seconds spent per file,
+        and an error message per file that could not be parsed.
+    """
+    pool = get_parse_pool(workers)
+    parses = [submit_file(pool, file_name, file_path) for file_name, file_path in files]
+    documents, timings, errors = [], {}, {}
+    for parse in parses:
+        file_documents, seconds, error = parse.result()
+        if parse.crashed:
+            # A crash breaks the whole pool, so retry innocent bystanders once on a fresh one
+            retry = submit_file(get_parse_pool(workers), parse.file_name, parse.file_path)
+            file_documents, seconds, error = retry.result()
+        timings[parse.file_name] = seconds
+        if error:
+            logs.log.error("Error parsing %s: %s", parse.file_name, error)
+            errors[parse.file_name] = error
+        else:
+            documents.extend(file_documents)
+            logs.log.info("Parsed %s into %d documents in %.2fs", parse.file_name, len(file_documents), seconds)
+    return documents, timings, errors
+
+
+def split_in_parallel(
+    documents: List[Document], chunk_size: int, chunk_overlap: int, workers: int = DEFAULT_PARSE_WORKERS
+) -> List:
+    """Chunks already parsed documents on the process pool, one task per file."""
+    by_file: Dict[str, List[Document]] = {}
+    for document in documents:
+        by_file.setdefault(document.metadata.get("file_name"), []).append(document)
+    if len(by_file) < 2 or sum(len(document.text) for document in documents) < PARALLEL_SPLIT_CHARS:
+        # Too little to parallelize; don't pay for sending the documents to child processes
+        return split_documents(documents, chunk_size, chunk_overlap)
+    pool = get_parse_pool(workers)
+    futures = [pool.submit(split_documents, group, chunk_size, chunk_overlap) for group in by_file.values()]
+    return [node for future in futures for node in future.result()]
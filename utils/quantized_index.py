@@ -0,0 +1,417 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+import utils.logs as logs
+
+COMPRESSIONS = ["none", "float16", "int8"]
+
+# Candidates re-scored at full precision per requested result
+DEFAULT_RESCORE_FACTOR = 4
+
+# Rows converted to float32 at a time while scanning the compressed matrix; a
+# block of 1024-dimensional vectors then stays in the CPU cache for the product
+SEARCH_BLOCK_ROWS = 256
+
+# Rows re-quantized at a time when the compression changes
+REQUANTIZE_BLOCK_ROWS = 65536
+
+_DTYPES = {"none": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Written once every compacted file is staged as ``<name>.tmp``; see QuantizedIndex.compact
+_COMPACTION_MARKER = "compaction.json"
+
+###################################
+#
+# Quantization
+#
+###################################
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scales rows to unit length, so a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def quantize(vectors: np.ndarray, compression: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compresses float32 rows. Returns the compressed rows and a per-row scale.
+
+    ``int8`` is symmetric per-vector quantization: each row is divided by
+    ``max(|x|) / 127``, which keeps the error proportional to that row's own range.
+    ``float16`` and ``none`` are plain casts with a scale of 1.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSIONS}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if compression != "int8":
+        return vectors.astype(_DTYPES[compression]), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+###################################
+#
+# Memory-Mapped Quantized Index
+#
+###################################
+
+
+class QuantizedIndex:
+    """
+    Append-only dense vector index with compressed candidate search.
+
+    Vectors are normalized and kept twice on disk: at full precision
+    (``vectors.f32``) and compressed (``vectors.float16``/``vectors.int8`` with
+    per-row ``scales.f32``). Both are memory-mapped. A search scans only the
+    compressed matrix, which is 2x (float16) or 4x (int8) smaller than the
+    float32 one, then re-scores the best ``top_k * rescore_factor`` candidates
+    exactly with their full-precision rows. Only those rows are paged in, so
+    the resident set stays close to the size of the compressed matrix.
+
+    Rows are only ever appended. Deleting an id leaves a tombstone, which is
+    skipped by searches and dropped by ``compact()``. Ids are appended to
+    ``ids.txt`` and deletions to ``deleted.txt``, so every write is a small
+    append and a crash can lose at most the batch being written. ``compact()``
+    stages the rewritten files and swaps them in only once all are complete.
+
+    Opening an index with a different ``compression`` re-derives the compressed
+    matrix from the full-precision one; nothing has to be re-embedded.
+
+    Args:
+        path (str): Directory holding the index files.
+        compression (str): One of ``COMPRESSIONS``.
+        rescore_factor (int): Candidates re-scored per requested result.
+    """
+
+    def __init__(self, path: str, compression: str = "int8", rescore_factor: int = DEFAULT_RESCORE_FACTOR):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSIONS}")
+        self.path = path
+        self.compression = compression
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._recover_compaction()
+
+        meta = self._read_meta()
+        self.dim = meta.get("dim")
+        self._ids: List = []
+        self._rows: Dict[str, int] = {}
+        self._dead_rows: List[int] = []
+        # Bumped when rows are renumbered, so a search in progress knows its rows are stale
+        self._generation = 0
+        self._load_ids()
+        self._full = self._compressed = self._scales = None
+        if self._ids and meta.get("compression") != compression:
+            self._requantize()
+        self._write_meta()
+        logs.log.info("Quantized index (%s) loaded with %d vectors", compression, len(self))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._rows
+
+    def ids(self) -> List[str]:
+        """Ids of the stored (not deleted) vectors, in insertion order."""
+        with self._lock:
+            return [node_id for node_id in self._ids if node_id is not None]
+
+    def vectors(self, ids: Sequence[str]) -> np.ndarray:
+        """Full-precision (normalized) vectors of the given stored ids."""
+        with self._lock:
+            rows = [self._rows[node_id] for node_id in ids]
+            return np.array(self._matrices()[0][rows])
+
+    ###################################
+    # Files
+    ###################################
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _compressed_file(self, compression: str = None) -> str:
+        return self._file(f"vectors.{compression or self.compression}")
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_meta(self) -> None:
+        tmp_path = self._file("meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "compression": self.compression}, f)
+        os.replace(tmp_path, self._file("meta.json"))
+
+    def _load_ids(self) -> None:
+        ids = []
+        if os.path.exists(self._file("ids.txt")):
+            with open(self._file("ids.txt"), "r", encoding="utf-8") as f:
+                ids = f.read().splitlines()
+        # A crash between appending vectors and ids leaves the shorter file authoritative
+        if self.dim and ids:
+            stored_rows = os.path.getsize(self._file("vectors.f32")) // (4 * self.dim)
+            ids = ids[:stored_rows]
+        deleted = set()
+        if os.path.exists(self._file("deleted.txt")):
+            with open(self._file("deleted.txt"), "r", encoding="utf-8") as f:
+                deleted = set(f.read().splitlines())
+        self._ids = [None if node_id in deleted else node_id for node_id in ids]
+        # A re-added id lives in its last row
+        self._rows = {node_id: row for row, node_id in enumerate(self._ids) if node_id is not None}
+        for row, node_id in enumerate(self._ids):
+            if node_id is not None and self._rows[node_id] != row:
+                self._ids[row] = None
+        self._dead_rows = [row for row, node_id in enumerate(self._ids) if node_id is None]
+
+    def _recover_compaction(self) -> None:
+        """Finishes a compaction whose files were all staged, or discards one that was interrupted earlier."""
+        marker = self._file(_COMPACTION_MARKER)
+        if os.path.exists(marker):
+            with open(marker, "r", encoding="utf-8") as f:
+                names = json.load(f)
+            for name in names:
+                if os.path.exists(self._file(name + ".tmp")):
+                    os.replace(self._file(name + ".tmp"), self._file(name))
+            os.remove(marker)
+            logs.log.warning("Finished an interrupted compaction of the quantized index at %s", self.path)
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp") and name != "meta.json.tmp":
+                os.remove(self._file(name))
+
+    def _requantize(self) -> None:
+        """Rebuilds the compressed matrix for a new compression from the full-precision rows."""
+        logs.log.info("Re-quantizing %d vectors to %s", len(self._ids), self.compression)
+        full = self._open_full()
+        with open(self._compressed_file(), "wb") as vectors_file, open(self._file("scales.f32"), "wb") as scales_file:
+            for start in range(0, len(full), REQUANTIZE_BLOCK_ROWS):
+                compressed, scales = quantize(full[start : start + REQUANTIZE_BLOCK_ROWS], self.compression)
+                vectors_file.write(compressed.tobytes())
+                scales_file.write(scales.tobytes())
+        for compression in COMPRESSIONS:
+            if compression not in ("none", self.compression) and os.path.exists(self._compressed_file(compression)):
+                os.remove(self._compressed_file(compression))
+        self._full = self._compressed = self._scales = None
+
+    def _open_full(self) -> np.ndarray:
+        rows = len(self._ids)
+        if not rows:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def _matrices(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Memory maps of the full, compressed and scale arrays, re-opened after appends."""
+        rows = len(self._ids)
+        if self._full is None or len(self._full) != rows:
+            self._full = self._open_full()
+            if self.compression == "none" or not rows:
+                self._compressed, self._scales = self._full, np.ones(rows, dtype=np.float32)
+            else:
+                dtype = _DTYPES[self.compression]
+                self._compressed = np.memmap(self._compressed_file(), dtype=dtype, mode="r", shape=(rows, self.dim))
+                self._scales = np.memmap(self._file("scales.f32"), dtype=np.float32, mode="r", shape=(rows,))
+        return self._full, self._compressed, self._scales
+
+    ###################################
+    # Writes
+    ###################################
+
+    def add(self, ids: Sequence[str], embeddings: Iterable[Sequence[float]]) -> None:
+        vectors = normalize(np.asarray(list(embeddings), dtype=np.float32))
+        if not len(ids):
+            return
+        if len(vectors) != len(ids):
+            raise ValueError(f"Got {len(vectors)} embeddings for {len(ids)} ids")
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_meta()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self.dim})")
+
+            # Replacing an id tombstones its old row
+            replaced = [node_id for node_id in ids if node_id in self._rows]
+            if replaced:
+                self.remove(replaced)
+
+            with open(self._file("vectors.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+            if self.compression != "none":
+                compressed, scales = quantize(vectors, self.compression)
+                with open(self._compressed_file(), "ab") as f:
+                    f.write(compressed.tobytes())
+                with open(self._file("scales.f32"), "ab") as f:
+                    f.write(scales.tobytes())
+            with open(self._file("ids.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{node_id}\n" for node_id in ids))
+
+            for node_id in ids:
+                self._rows[node_id] = len(self._ids)
+                self._ids.append(node_id)
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            removed = [node_id for node_id in ids if node_id in self._rows]
+            if not removed:
+                return
+            with open(self._file("deleted.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{node_id}\n" for node_id in removed))
+            for node_id in removed:
+                row = self._rows.pop(node_id)
+                self._ids[row] = None
+                self._dead_rows.append(row)
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in os.listdir(self.path):
+                if name != "meta.json":
+                    os.remove(self._file(name))
+            self._ids, self._rows, self._dead_rows = [], {}, []
+            self._full = self._compressed = self._scales = None
+            self._generation += 1
+
+    def compact(self) -> int:
+        """
+        Rewrites the files without tombstoned rows. Returns the number of rows dropped.
+
+        The new files are written next to the old ones as ``<name>.tmp``; a
+        marker then commits them and they replace the old ones. A crash before
+        the marker leaves the old files in use, after it the next open
+        finishes the swap (``_recover_compaction``).
+        """
+        with self._lock:
+            live_rows = [row for row, node_id in enumerate(self._ids) if node_id is not None]
+            dropped = len(self._ids) - len(live_rows)
+            if not dropped:
+                return 0
+            ids = [self._ids[row] for row in live_rows]
+            full = np.array(self._matrices()[0][live_rows]) if live_rows else np.empty((0, self.dim or 0), np.float32)
+            staged = {"vectors.f32": full.tobytes(), "ids.txt": "".join(f"{node_id}\n" for node_id in ids).encode("utf-8")}
+            if self.compression != "none":
+                compressed, scales = quantize(full, self.compression)
+                staged[os.path.basename(self._compressed_file())] = compressed.tobytes()
+                staged["scales.f32"] = scales.tobytes()
+            staged["deleted.txt"] = b""
+            for name, data in staged.items():
+                with open(self._file(name + ".tmp"), "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            marker_tmp = self._file(_COMPACTION_MARKER + ".part")
+            with open(marker_tmp, "w", encoding="utf-8") as f:
+                json.dump(list(staged), f)
+            os.replace(marker_tmp, self._file(_COMPACTION_MARKER))
+            for name in staged:
+                os.replace(self._file(name + ".tmp"), self._file(name))
+            os.remove(self._file(_COMPACTION_MARKER))
+
+            self._ids = ids
+            self._rows = {node_id: row for row, node_id in enumerate(ids)}
+            self._dead_rows = []
+            self._full = self._compressed = self._scales = None
+            self._generation += 1
+            logs.log.info("Compacted quantized index, dropped %d deleted rows", dropped)
+            return dropped
+
+    ###################################
+    # Search
+    ###################################
+
+    def search(
+        self, query_embedding: Sequence[float], top_k: int = 2, only_ids: Iterable[str] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Top ``top_k`` ``(id, cosine similarity)`` pairs, best first.
+
+        With ``only_ids`` (e.g. the nodes that pass a metadata filter) only
+        those vectors are scored, instead of masking the results of a full scan.
+        """
+        with self._lock:
+            if not self._rows:
+                return []
+            generation = self._generation
+            full, compressed, scales = self._matrices()
+            if only_ids is None:
+                subset = None
+                dead_rows = np.array(self._dead_rows, dtype=np.int64)
+                live = len(self._rows)
+            else:
+                subset = np.array(sorted(self._rows[node_id] for node_id in only_ids if node_id in self._rows), dtype=np.int64)
+                live = len(subset)
+        if not live or top_k < 1:
+            return []
+
+        query = normalize(np.asarray(query_embedding, dtype=np.float32))
+        if subset is not None:
+            approximate = compressed[subset].astype(np.float32) @ query * scales[subset]
+        elif self.compression == "none":
+            approximate = compressed @ query
+        else:
+            approximate = np.empty(len(compressed), dtype=np.float32)
+            for start in range(0, len(compressed), SEARCH_BLOCK_ROWS):
+                block = compressed[start : start + SEARCH_BLOCK_ROWS]
+                approximate[start : start + len(block)] = block.astype(np.float32) @ query
+            approximate *= scales
+        if subset is None:
+            approximate[dead_rows] = -np.inf
+
+        candidates = min(live, top_k * (1 if self.compression == "none" else self.rescore_factor))
+        rows = np.argpartition(-approximate, candidates - 1)[:candidates]
+        approximate = approximate[rows]
+        if subset is not None:
+            rows = subset[rows]
+        if self.compression == "none":
+            scores = approximate
+        else:
+            # Exact scores for the candidates; only these full-precision rows are read
+            rows.sort()
+            scores = full[rows] @ query
+        order = np.argsort(-scores)
+
+        results = []
+        with self._lock:
+            # Compacted while scanning: the rows found no longer map to the same ids
+            renumbered = self._generation != generation
+            for i in order if not renumbered else []:
+                # Rows deleted while scanning are skipped
+                node_id = self._ids[rows[i]] if rows[i] < len(self._ids) else None
+                if node_id is not None:
+                    results.append((node_id, float(scores[i])))
+                if len(results) == top_k:
+                    break
+        if renumbered:
+            return self.search(query_embedding, top_k, only_ids)
+        return results
+
+    ###################################
+    # Stats
+    ###################################
+
+    def stats(self) -> Dict:
+        """Vector counts and bytes used by the search matrix and by the full-precision copy."""
+        rows = len(self._ids)
+        full_bytes = rows * (self.dim or 0) * 4
+        if self.compression == "none":
+            search_bytes = full_bytes
+        else:
+            search_bytes = rows * (self.dim or 0) * np.dtype(_DTYPES[self.compression]).itemsize + rows * 4
+        return {
+            "compression": self.compression,
+            "vectors": len(self),
+            "deleted": rows - len(self),
+            "dim": self.dim,
+            "search_mb": round(search_bytes / 1024**2, 2),
+            "full_precision_mb": round(full_bytes / 1024**2, 2),
+        }
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import utils.logs as logs
+
+###################################
+#
+# Fingerprints
+#
+###################################
+
+
+def hash_bytes(data) -> str:
+    """Content hash of a whole file (accepts bytes or any buffer)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """Content hash of a single chunk of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_node_id(doc_key: str, chunk_hash: str) -> str:
+    """Deterministic vector id for a chunk, so re-ingesting it never duplicates vectors."""
+    return hashlib.sha256(f"{doc_key}\x00{chunk_hash}".encode("utf-8")).hexdigest()
+
+
+###################################
+#
+# Document Registry
+#
+###################################
+
+
+class DocumentRegistry:
+    """
+    Tracks which documents are in the vector store and which chunks they consist of.
+
+    Each entry is keyed by a document key (e.g. ``local:report.pdf``) and records
+    the owning source, the file's content hash, the chunking settings used, and a
+    mapping of chunk hash -> node id. This is enough to skip unchanged files, embed
+    only new chunks, and delete the vectors of chunks or files that went away.
+
+    Sources that were given a collection of their own are recorded in
+    ``partitions`` (source -> partition name); all other sources share the
+    default collection.
+
+    The registry is a small JSON file stored alongside the Chroma data.
+
+    Args:
+        path (str): Location of the registry JSON file.
+        workspace (str): The workspace whose documents it tracks (see utils/workspaces.py).
+    """
+
+    def __init__(self, path: str, workspace: str = None):
+        self.path = path
+        self.workspace = workspace
+        self._lock = threading.RLock()
+        self.documents: Dict[str, dict] = {}
+        self.partitions: Dict[str, str] = {}
+        # Bumped whenever the stored vectors change; lets caches detect a stale index
+        self.version = 0
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.documents = data.get("documents", {})
+                self.partitions = data.get("partitions", {})
+                self.version = data.get("index_version", 0)
+            except (OSError, ValueError) as e:
+                logs.log.error(f"Could not read document registry at {path}, starting empty: {e}")
+        logs.log.info(f"Document registry loaded with {len(self.documents)} documents")
+
+    def is_unchanged(self, doc_key: str, file_hash: str, chunking: str) -> bool:
+        """True if the document was already ingested with the same content and chunk settings."""
+        entry = self.documents.get(doc_key)
+        return bool(entry) and entry["file_hash"] == file_hash and entry.get("chunking") == chunking
+
+    def diff_chunks(self, doc_key: str, chunk_hashes: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """
+        Compares a document's new chunks against the registered ones.
+
+        Returns:
+            Tuple[List[str], List[str]]: chunk hashes that need embedding, and node
+            ids of previously stored chunks that no longer exist.
+        """
+        old_chunks = self.documents.get(doc_key, {}).get("chunks", {})
+        chunk_hashes = set(chunk_hashes)
+        new_hashes = [h for h in chunk_hashes if h not in old_chunks]
+        removed_ids = [node_id for h, node_id in old_chunks.items() if h not in chunk_hashes]
+        return new_hashes, removed_ids
+
+    def record(self, doc_key: str, source: str, file_name: str, file_hash: str, chunking: str, chunks: Dict[str, str]):
+        """Registers (or replaces) a document's fingerprint and chunk -> node id map."""
+        with self._lock:
+            self.documents[doc_key] = {
+                "source": source,
+                "file_name": file_name,
+                "file_hash": file_hash,
+                "chunking": chunking,
+                "chunks": chunks,
+                "updated_at": time.time(),
+            }
+
+    def remove(self, doc_key: str) -> List[str]:
+        """Forgets a document and returns the node ids that belonged to it."""
+        with self._lock:
+            entry = self.documents.pop(doc_key, None)
+        return list(entry["chunks"].values()) if entry else []
+
+    def snapshot(self) -> Dict[str, dict]:
+        """A copy of the registered documents, safe to iterate while an ingestion job changes them."""
+        with self._lock:
+            return dict(self.documents)
+
+    def keys_for_source(self, source: str) -> List[str]:
+        """All registered document keys owned by the given source."""
+        with self._lock:
+            return [key for key, entry in self.documents.items() if entry["source"] == source]
+
+    def sources(self) -> List[str]:
+        """Every source with registered documents."""
+        with self._lock:
+            return sorted({entry["source"] for entry in self.documents.values()})
+
+    def partition_of(self, source: str) -> Optional[str]:
+        """The partition holding the source's vectors, or ``None`` for the shared collection."""
+        return self.partitions.get(source)
+
+    def partition_map(self) -> Dict[str, str]:
+        """A copy of the source -> partition assignments."""
+        with self._lock:
+            return dict(self.partitions)
+
+    def set_partition(self, source: str, partition: str):
+        with self._lock:
+            self.partitions[source] = partition
+
+    def bump_version(self) -> int:
+        """Marks the vector store contents as changed."""
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def node_count(self) -> int:
+        with self._lock:
+            return sum(len(entry["chunks"]) for entry in self.documents.values())
+
+    def save(self):
+        """Atomically writes the registry back to disk."""
+        with self._lock:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": 1,
+                        "index_version": self.version,
+                        "documents": self.documents,
+                        "partitions": self.partitions,
+                    },
+                    f,
+                )
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,194 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import streamlit as st
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+import utils.logs as logs
+import utils.mistral as mistral
+from utils.llama_index import RERANKERS
+from utils.tracing import span
+
+# Hugging Face repository with an ONNX export (onnx/model.onnx and tokenizer.json),
+# or a local directory holding the same files
+CROSS_ENCODER_MODEL = os.environ.get("LOCAL_RAG_CROSS_ENCODER", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+CROSS_ENCODER_MAX_TOKENS = 512
+CROSS_ENCODER_BATCH = 16
+
+RERANK_MODEL = os.environ.get("LOCAL_RAG_RERANK_MODEL", "ministral-3b-latest")
+# Candidates scored per LLM request, and characters of each candidate sent
+LLM_RERANK_BATCH = 5
+LLM_RERANK_PASSAGE_CHARS = 1500
+
+LLM_RERANK_PROMPT = (
+    "Rate how well each passage answers the question, from 0 (unrelated) to 10 (answers it fully).\n"
+    "Reply with one line per passage in the form `<passage number>: <score>` and nothing else.\n\n"
+    "Question: {query}\n\n{passages}"
+)
+
+_SCORE_LINE = re.compile(r"^\W*(?:passage\s*)?(\d+)\W*[:=\-]\s*(\d+(?:\.\d+)?)", re.MULTILINE | re.IGNORECASE)
+
+###################################
+#
+# Cross-Encoder (local, ONNX)
+#
+###################################
+
+
+@st.cache_resource(show_spinner="Loading reranker model...")
+def get_cross_encoder(model: str = CROSS_ENCODER_MODEL):
+    """
+    Loads an ONNX cross-encoder and its tokenizer, once per process.
+
+    Uses onnxruntime and tokenizers, which Chroma already depends on, so no
+    deep learning framework is needed. Models are downloaded from the Hugging
+    Face Hub on first use unless ``model`` is a local directory.
+    """
+    import onnxruntime
+    from tokenizers import Tokenizer
+
+    if os.path.isdir(model):
+        model_path = os.path.join(model, "onnx", "model.onnx")
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model, "model.onnx")
+        tokenizer_path = os.path.join(model, "tokenizer.json")
+    else:
+        from huggingface_hub import hf_hub_download
+
+        model_path = hf_hub_download(model, "onnx/model.onnx")
+        tokenizer_path = hf_hub_download(model, "tokenizer.json")
+
+    tokenizer = Tokenizer.from_file(tokenizer_path)
+    tokenizer.enable_truncation(max_length=CROSS_ENCODER_MAX_TOKENS)
+    tokenizer.enable_padding()
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = max(1, min(4, os.cpu_count() or 1))
+    session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+    logs.log.info("Loaded cross-encoder %s", model)
+    return session, tokenizer
+
+
+class CrossEncoderReranker(BaseNodePostprocessor):
+    """
+    Scores every (query, candidate) pair with a cross-encoder and keeps the best ``top_n``.
+
+    Args:
+        top_n (int): Number of nodes kept.
+        model (str): Hugging Face repository or local directory of the ONNX model.
+    """
+
+    top_n: int = Field(default=2)
+    model: str = Field(default=CROSS_ENCODER_MODEL)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CrossEncoderReranker"
+
+    def score(self, query: str, texts: List[str]) -> np.ndarray:
+        session, tokenizer = get_cross_encoder(self.model)
+        input_names = {item.name for item in session.get_inputs()}
+        scores = []
+        for start in range(0, len(texts), CROSS_ENCODER_BATCH):
+            encodings = tokenizer.encode_batch([(query, text) for text in texts[start : start + CROSS_ENCODER_BATCH]])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            logits = session.run(None, {name: value for name, value in inputs.items() if name in input_names})[0]
+            scores.append(np.asarray(logits, dtype=np.float32).reshape(len(encodings), -1)[:, 0])
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None or len(nodes) <= 1:
+            return nodes[: self.top_n]
+        with span("rerank"):
+            texts = [result.node.get_content(metadata_mode=MetadataMode.EMBED) for result in nodes]
+            scores = self.score(query_bundle.query_str, texts)
+            order = np.argsort(-scores, kind="stable")[: self.top_n]
+            return [NodeWithScore(node=nodes[i].node, score=float(scores[i])) for i in order]
+
+
+###################################
+#
+# LLM Scoring Pass
+#
+###################################
+
+
+def parse_scores(text: str, count: int) -> List[Optional[float]]:
+    """Scores from a ``<number>: <score>`` reply; passages the model skipped get ``None``."""
+    scores: List[Optional[float]] = [None] * count
+    for number, score in _SCORE_LINE.findall(text):
+        index = int(number) - 1
+        if 0 <= index < count and scores[index] is None:
+            scores[index] = float(score)
+    return scores
+
+
+class LLMReranker(BaseNodePostprocessor):
+    """
+    Scores candidates with a small Mistral model and keeps the best ``top_n``.
+
+    Candidates are sent in batches of ``batch_size``, one short prompt each,
+    and the batches are scored concurrently. A batch whose reply can't be
+    parsed (or whose request fails) keeps its retrieval order, ranked after
+    the scored candidates, so a bad reply never loses the retriever's results.
+
+    Args:
+        top_n (int): Number of nodes kept.
+        model (str): Mistral model used for scoring.
+        batch_size (int): Candidates per scoring request.
+    """
+
+    top_n: int = Field(default=2)
+    model: str = Field(default=RERANK_MODEL)
+    batch_size: int = Field(default=LLM_RERANK_BATCH)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMReranker"
+
+    def _score_batch(self, query: str, texts: List[str]) -> List[Optional[float]]:
+        passages = "\n\n".join(f"Passage {i}:\n{text[:LLM_RERANK_PASSAGE_CHARS]}" for i, text in enumerate(texts, start=1))
+        try:
+            reply = mistral.get_mistral_llm(model_name=self.model).complete(
+                LLM_RERANK_PROMPT.format(query=query, passages=passages)
+            )
+        except Exception as e:
+            logs.log.warning("LLM reranking request failed, keeping retrieval order: %s", e)
+            return [None] * len(texts)
+        return parse_scores(reply.text, len(texts))
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None or len(nodes) <= 1:
+            return nodes[: self.top_n]
+        with span("rerank"):
+            texts = [result.node.get_content(metadata_mode=MetadataMode.LLM) for result in nodes]
+            batches = [texts[start : start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+                replies = executor.map(lambda batch: self._score_batch(query_bundle.query_str, batch), batches)
+                scores = [score for batch_scores in replies for score in batch_scores]
+
+            unscored = sum(score is None for score in scores)
+            if unscored:
+                logs.log.debug("LLM reranker left %d of %d candidates unscored", unscored, len(scores))
+            # Scored candidates first, best first; ties and unscored ones keep retrieval order
+            order = sorted(range(len(nodes)), key=lambda i: (scores[i] is None, -(scores[i] or 0.0), i))[: self.top_n]
+            return [NodeWithScore(node=nodes[i].node, score=scores[i] if scores[i] is not None else nodes[i].score) for i in order]
+
+
+def get_reranker(reranker: str, top_n: int) -> Optional[BaseNodePostprocessor]:
+    """The node postprocessor for a ``RERANKERS`` name, or None for ``none``."""
+    if reranker not in RERANKERS:
+        raise ValueError(f"Unknown reranker '{reranker}', expected one of {RERANKERS}")
+    if reranker == "cross-encoder":
+        return CrossEncoderReranker(top_n=top_n)
+    if reranker == "llm":
+        return LLMReranker(top_n=top_n)
+    return None
@@ -0,0 +1,142 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import MetadataFilters
+
+import utils.logs as logs
+from utils.bm25 import BM25Index
+from utils.llama_index import RETRIEVAL_MODES
+from utils.locks import ReadWriteLock, index_lock
+from utils.tracing import span
+from utils.vector_stores import filtered_node_ids
+
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper
+RRF_K = 60
+
+###################################
+#
+# Hybrid (BM25 + Vector) Retriever
+#
+###################################
+
+
+class RetrievalPartition(NamedTuple):
+    """
+    One collection searched by ``HybridRetriever``.
+
+    Args:
+        vector_retriever (BaseRetriever): Dense retriever over the vector store, with ``filters`` applied.
+        lexical_index (BM25Index): BM25 index over the same nodes.
+        vector_store: Vector store used to load BM25 hits by node id.
+        filters (MetadataFilters): Metadata pre-filters for the BM25 hits, or ``None``.
+    """
+
+    vector_retriever: BaseRetriever
+    lexical_index: BM25Index
+    vector_store: Any
+    filters: Optional[MetadataFilters] = None
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves with the local BM25 index, the vector store, or both.
+
+    - ``vector``: dense retrieval only (needs a query embedding).
+    - ``lexical``: BM25 only. Nodes are fetched from the vector store by id, so no
+      embedding API call is made at query time.
+    - ``hybrid``: both, fused with reciprocal rank fusion. Exact identifiers and
+      error codes are found by BM25 even when their embedding is unremarkable.
+
+    Metadata filters apply to BM25 through the ids of the matching nodes. Those
+    are looked up once and reused until the partition's BM25 index changes,
+    since a filtered lookup scans the store's metadata.
+
+    With several partitions (the shared collection and per-source collections),
+    each is searched and their vector hits, and their BM25 hits, are merged by
+    score before fusion. BM25 scores of different partitions use their own term
+    statistics, so that merge is approximate.
+
+    Args:
+        partitions (List[RetrievalPartition]): Collections to search.
+        mode (str): One of ``RETRIEVAL_MODES``.
+        top_k (int): Number of nodes returned.
+        lock (ReadWriteLock): Lock of the partitions' workspace, held while retrieving.
+    """
+
+    def __init__(
+        self, partitions: List[RetrievalPartition], mode: str = "hybrid", top_k: int = 2, lock: ReadWriteLock = index_lock
+    ):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        self._partitions = partitions
+        self._mode = mode
+        self._top_k = top_k
+        self._lock = lock
+        # Partition position -> (BM25 index generation, ids of the nodes matching its filters)
+        self._filtered_ids: Dict[int, Tuple[int, Set[str]]] = {}
+        super().__init__()
+
+    def _allowed_ids(self, position: int, partition: RetrievalPartition) -> Optional[Set[str]]:
+        if partition.filters is None:
+            return None
+        generation = partition.lexical_index.generation
+        cached = self._filtered_ids.get(position)
+        if cached is None or cached[0] != generation:
+            cached = self._filtered_ids[position] = (
+                generation, set(filtered_node_ids(partition.vector_store, partition.filters))
+            )
+        return cached[1]
+
+    def _vector_retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        results = [result for partition in self._partitions for result in partition.vector_retriever.retrieve(query_bundle)]
+        if len(self._partitions) > 1:
+            results = sorted(results, key=lambda result: result.score or 0.0, reverse=True)[: self._top_k]
+        return results
+
+    def _lexical_retrieve(self, query: str) -> List[NodeWithScore]:
+        results = []
+        for position, partition in enumerate(self._partitions):
+            only_ids = self._allowed_ids(position, partition)
+            if only_ids is not None and not only_ids:
+                continue
+            hits = partition.lexical_index.search(query, top_k=self._top_k, only_ids=only_ids)
+            if not hits:
+                continue
+            nodes = {node.node_id: node for node in partition.vector_store.get_nodes(node_ids=[node_id for node_id, _ in hits])}
+            # The BM25 index may briefly reference a node that was just deleted; skip it
+            results.extend(NodeWithScore(node=nodes[node_id], score=score) for node_id, score in hits if node_id in nodes)
+        if len(self._partitions) > 1:
+            results = sorted(results, key=lambda result: result.score, reverse=True)[: self._top_k]
+        return results
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # Embed the query before taking the lock, so upserts aren't held up by the API call
+        if self._mode != "lexical" and query_bundle.embedding is None and query_bundle.embedding_strs:
+            with span("embed"):
+                query_bundle.embedding = Settings.embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+        with span("retrieve"), self._lock.read():
+            return self._retrieve_locked(query_bundle)
+
+    def _retrieve_locked(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if self._mode == "vector":
+            return self._vector_retrieve(query_bundle)
+        if self._mode == "lexical":
+            return self._lexical_retrieve(query_bundle.query_str)
+
+        vector_results = self._vector_retrieve(query_bundle)
+        lexical_results = self._lexical_retrieve(query_bundle.query_str)
+
+        fused: Dict[str, float] = {}
+        nodes: Dict[str, NodeWithScore] = {}
+        for results in (vector_results, lexical_results):
+            for rank, result in enumerate(results):
+                fused[result.node.node_id] = fused.get(result.node.node_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+                nodes.setdefault(result.node.node_id, result)
+
+        ranked = sorted(fused, key=fused.get, reverse=True)[: self._top_k]
+        logs.log.debug(
+            "Hybrid retrieval: %d vector + %d lexical hits fused into %d", len(vector_results), len(lexical_results), len(ranked)
+        )
+        return [NodeWithScore(node=nodes[node_id].node, score=fused[node_id]) for node_id in ranked]
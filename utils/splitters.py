@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import os
+import statistics
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List
+
+if TYPE_CHECKING:
+    from llama_index.core import Document
+    from llama_index.core.node_parser import NodeParser
+    from llama_index.core.schema import BaseNode
+
+# Splitter per file extension; every other file type uses the sentence splitter.
+# The splitter name is part of the chunking signature in the document registry,
+# so pointing an extension at another splitter re-ingests those files.
+SPLITTERS = {
+    ".py": "python",
+    ".pyi": "python",
+    ".md": "markdown",
+    ".markdown": "markdown",
+}
+DEFAULT_SPLITTER = "sentence"
+
+###################################
+#
+# Splitter Registry
+#
+###################################
+
+
+def _sentence_splitter(chunk_size: int, chunk_overlap: int) -> NodeParser:
+    from llama_index.core.node_parser import SentenceSplitter
+
+    return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _python_splitter(chunk_size: int, chunk_overlap: int) -> NodeParser:
+    from utils.node_parsers import PythonSplitter
+
+    return PythonSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _markdown_splitter(chunk_size: int, chunk_overlap: int) -> NodeParser:
+    from utils.node_parsers import MarkdownSplitter
+
+    return MarkdownSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+# Splitter name -> factory taking (chunk_size, chunk_overlap)
+SPLITTER_FACTORIES: Dict[str, Callable[[int, int], NodeParser]] = {
+    "sentence": _sentence_splitter,
+    "python": _python_splitter,
+    "markdown": _markdown_splitter,
+}
+
+
+def splitter_name(file_name: str) -> str:
+    """Name of the splitter for a file, by its extension."""
+    return SPLITTERS.get(os.path.splitext(file_name or "")[1].lower(), DEFAULT_SPLITTER)
+
+
+def chunking_signature(file_name: str, chunk_size: int, chunk_overlap: int) -> str:
+    """Identifies how a file is chunked; a file recorded with another signature is re-ingested."""
+    return f"{splitter_name(file_name)}:{chunk_size}:{chunk_overlap}"
+
+
+@lru_cache(maxsize=16)
+def get_splitter(name: str, chunk_size: int, chunk_overlap: int) -> NodeParser:
+    # Splitters are stateless once built, and building one loads tokenizers
+    return SPLITTER_FACTORIES[name](chunk_size, chunk_overlap)
+
+
+###################################
+#
+# Chunking
+#
+###################################
+
+
+def split_documents(documents: List[Document], chunk_size: int, chunk_overlap: int) -> List[BaseNode]:
+    """
+    Chunks documents with the splitter registered for each one's file type.
+    Runs in the parsing processes, so files are chunked in parallel.
+    """
+    by_splitter: Dict[str, List[Document]] = {}
+    for document in documents:
+        by_splitter.setdefault(splitter_name(document.metadata.get("file_name")), []).append(document)
+    nodes = []
+    for name, group in by_splitter.items():
+        nodes.extend(get_splitter(name, chunk_size, chunk_overlap).get_nodes_from_documents(group))
+    return nodes
+
+
+def chunk_token_counts(nodes: Iterable[BaseNode]) -> Dict[str, List[int]]:
+    """Token count of each chunk, grouped by the splitter that made it."""
+    from llama_index.core.utils import get_tokenizer
+
+    tokenizer = get_tokenizer()
+    counts: Dict[str, List[int]] = {}
+    for node in nodes:
+        counts.setdefault(splitter_name(node.metadata.get("file_name")), []).append(len(tokenizer(node.get_content())))
+    return counts
+
+
+def summarize_chunk_sizes(counts: Dict[str, List[int]]) -> Dict[str, Dict[str, int]]:
+    """Chunk-size distribution per splitter: count, mean, median, 90th percentile and max tokens."""
+    summary = {}
+    for name, sizes in sorted(counts.items()):
+        if not sizes:
+            continue
+        ordered = sorted(sizes)
+        summary[name] = {
+            "chunks": len(ordered),
+            "mean": round(statistics.fmean(ordered)),
+            "p50": ordered[len(ordered) // 2],
+            "p90": ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)],
+            "max": ordered[-1],
+        }
+    return summary
@@ -0,0 +1,241 @@
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+import utils.logs as logs
+
+# Stage timings recorded for every query, in milliseconds
+QUERY_STAGES = ["embed", "retrieve", "rerank", "synthesize", "ttft", "total"]
+QUANTILES = [0.5, 0.95, 0.99]
+
+# Traces kept in memory for the settings panel and the Prometheus quantiles
+RECENT_TRACES = 500
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("query_trace", default=None)
+
+###################################
+#
+# Query Trace
+#
+###################################
+
+
+class QueryTrace:
+    """
+    Per-stage timings of one chat query.
+
+    Entering the trace makes it current, so code deep in the query engine (the
+    retriever) can record spans with ``span()`` without the trace being passed
+    down. The answer is streamed through ``stream()``, which times the first
+    token and the token rate, and writes the finished record through
+    ``utils.logs.metrics`` when the stream ends.
+
+    Stages (milliseconds): ``embed`` (query embedding), ``retrieve`` (vector
+    and BM25 search), ``rerank`` (scoring the retrieved candidates, when a
+    reranker is configured), ``synthesize`` (prompt construction and the LLM
+    answer, from the end of retrieval or reranking to the last token), ``ttft``
+    (from the start of the query to the first token) and ``total``.
+
+    Args:
+        origin (str): Where the query came from, e.g. ``chat`` or ``service``.
+        **labels: Extra fields stored with the record (retrieval mode, top k...).
+    """
+
+    def __init__(self, origin: str = "chat", **labels):
+        # Shares the request id when there is one (service requests), so log lines and traces match up
+        self.id = logs.request_id.get() or uuid.uuid4().hex
+        self.origin = origin
+        self.labels = labels
+        self.session_id = logs.session_id.get()
+        self.spans: Dict[str, float] = {}
+        self.tokens = 0
+        self._started = time.perf_counter()
+        self._span_ends: Dict[str, float] = {}
+        self._first_token: Optional[float] = None
+        self._last_token: Optional[float] = None
+        self._context_tokens = None
+        self._record: Optional[Dict] = None
+
+    def __enter__(self) -> "QueryTrace":
+        self._context_tokens = (_current_trace.set(self), logs.request_id.set(self.id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        trace_token, request_token = self._context_tokens
+        logs.request_id.reset(request_token)
+        _current_trace.reset(trace_token)
+        if exc_type is not None:
+            self.finish(error=exc_type.__name__)
+        return False
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            self.spans[stage] = self.spans.get(stage, 0.0) + (ended - started) * 1000
+            self._span_ends[stage] = ended
+
+    def stream(self, tokens: Iterable[str]) -> Iterator[str]:
+        """Passes the answer tokens through, and finishes the trace once they are exhausted."""
+        try:
+            for token in tokens:
+                now = time.perf_counter()
+                if self._first_token is None:
+                    self._first_token = now
+                self._last_token = now
+                self.tokens += 1
+                yield token
+        finally:
+            self.finish()
+
+    def finish(self, **labels) -> Dict:
+        """Completes the record and writes it out. Later calls return the same record."""
+        if self._record is not None:
+            return self._record
+        ended = time.perf_counter()
+        spans = dict(self.spans)
+        # Synthesis starts once the context is final, i.e. after reranking when there is one
+        context_ends = [self._span_ends[stage] for stage in ("retrieve", "rerank") if stage in self._span_ends]
+        if self._last_token is not None and context_ends:
+            spans["synthesize"] = (self._last_token - max(context_ends)) * 1000
+        if self._first_token is not None:
+            spans["ttft"] = (self._first_token - self._started) * 1000
+        spans["total"] = (ended - self._started) * 1000
+
+        generation = (self._last_token - self._first_token) if self._first_token is not None else 0.0
+        self._record = {
+            "trace_id": self.id,
+            "timestamp": time.time(),
+            "origin": self.origin,
+            "session_id": self.session_id,
+            **self.labels,
+            **labels,
+            "spans_ms": {stage: round(value, 2) for stage, value in spans.items()},
+            "tokens": self.tokens,
+            # Token rate after the first token, i.e. the streaming speed the user sees
+            "tokens_per_second": round((self.tokens - 1) / generation, 1) if generation > 0 else None,
+        }
+        recorder.record(self._record)
+        return self._record
+
+
+def current_trace() -> Optional[QueryTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str):
+    """Times a stage of the current query; does nothing outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+
+###################################
+#
+# Trace Recorder and Exporters
+#
+###################################
+
+
+class TraceRecorder:
+    """
+    Keeps the most recent query traces and running totals per stage.
+
+    Every record is also written as one JSON line through ``utils.logs.metrics``.
+    Quantiles are computed over the recent window; sums and counts cover the
+    whole process lifetime, as Prometheus summaries expect.
+    """
+
+    def __init__(self, max_traces: int = RECENT_TRACES):
+        self._lock = threading.Lock()
+        self._traces: deque = deque(maxlen=max_traces)
+        self._sums: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._queries: Dict[str, int] = {}
+
+    def record(self, record: Dict) -> None:
+        with self._lock:
+            self._traces.append(record)
+            for stage, value in record["spans_ms"].items():
+                self._sums[stage] = self._sums.get(stage, 0.0) + value
+                self._counts[stage] = self._counts.get(stage, 0) + 1
+            outcome = "error" if record.get("error") else record.get("cache", "miss")
+            self._queries[outcome] = self._queries.get(outcome, 0) + 1
+        logs.metrics.info(json.dumps(record))
+
+    def recent(self, limit: int = None) -> List[Dict]:
+        """Most recent traces first."""
+        with self._lock:
+            traces = list(self._traces)
+        traces.reverse()
+        return traces[:limit] if limit else traces
+
+    def summary(self) -> Dict[str, Dict]:
+        """Count and p50/p95/p99 (milliseconds) per stage over the recent window."""
+        traces = self.recent()
+        summary = {}
+        for stage in QUERY_STAGES + ["tokens_per_second"]:
+            if stage == "tokens_per_second":
+                values = [t["tokens_per_second"] for t in traces if t.get("tokens_per_second")]
+            else:
+                values = [t["spans_ms"][stage] for t in traces if stage in t["spans_ms"]]
+            if not values:
+                continue
+            summary[stage] = {"count": len(values)}
+            for q in QUANTILES:
+                summary[stage][f"p{int(q * 100)}"] = round(float(np.quantile(values, q)), 2)
+        return summary
+
+    def to_jsonl(self) -> str:
+        return "".join(json.dumps(record) + "\n" for record in reversed(self.recent()))
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format: a summary per stage, plus query counts."""
+        traces = self.recent()
+        with self._lock:
+            sums, counts, queries = dict(self._sums), dict(self._counts), dict(self._queries)
+
+        lines = [
+            "# HELP local_rag_query_stage_seconds Latency of each query stage.",
+            "# TYPE local_rag_query_stage_seconds summary",
+        ]
+        for stage in QUERY_STAGES:
+            if stage not in counts:
+                continue
+            values = [t["spans_ms"][stage] / 1000 for t in traces if stage in t["spans_ms"]]
+            for q in QUANTILES if values else []:
+                lines.append(f'local_rag_query_stage_seconds{{stage="{stage}",quantile="{q}"}} {np.quantile(values, q):.6f}')
+            lines.append(f'local_rag_query_stage_seconds_sum{{stage="{stage}"}} {sums[stage] / 1000:.6f}')
+            lines.append(f'local_rag_query_stage_seconds_count{{stage="{stage}"}} {counts[stage]}')
+
+        rates = [t["tokens_per_second"] for t in traces if t.get("tokens_per_second")]
+        if rates:
+            lines += [
+                "# HELP local_rag_query_tokens_per_second Answer streaming rate over recent queries.",
+                "# TYPE local_rag_query_tokens_per_second summary",
+            ]
+            for q in QUANTILES:
+                lines.append(f'local_rag_query_tokens_per_second{{quantile="{q}"}} {np.quantile(rates, q):.1f}')
+
+        lines += ["# HELP local_rag_queries_total Queries answered.", "# TYPE local_rag_queries_total counter"]
+        for outcome, count in sorted(queries.items()):
+            lines.append(f'local_rag_queries_total{{outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide, shared by every session and the service
+recorder = TraceRecorder()
@@ -0,0 +1,431 @@
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from pydantic import PrivateAttr
+
+import utils.logs as logs
+from utils.quantized_index import QuantizedIndex
+
+# Sidecar keys holding the serialized node rather than filterable metadata
+_NODE_KEYS = ("_node_content", "_node_type")
+
+_decoder = json.JSONDecoder()
+
+###################################
+#
+# Quantized Vector Store
+#
+###################################
+
+
+class QuantizedVectorStore(BasePydanticVectorStore):
+    """
+    Serves dense queries from a ``QuantizedIndex`` in front of another vector store.
+
+    The inner store (Chroma) stays the store of record: it keeps the node text
+    and metadata, and handles metadata-filtered or non-default queries. Every
+    write goes to both. A plain top-k query is answered by the quantized
+    index, and only the winning nodes are loaded from the inner store.
+
+    Args:
+        inner (BasePydanticVectorStore): Store holding the nodes.
+        quantized_index (QuantizedIndex): Compressed vectors of the same nodes.
+    """
+
+    stores_text: bool = True
+    is_embedding_query: bool = True
+
+    _inner: BasePydanticVectorStore = PrivateAttr()
+    _index: QuantizedIndex = PrivateAttr()
+
+    def __init__(self, inner: BasePydanticVectorStore, quantized_index: QuantizedIndex, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._inner = inner
+        self._index = quantized_index
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "QuantizedVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._inner.client
+
+    @property
+    def inner(self) -> BasePydanticVectorStore:
+        return self._inner
+
+    @property
+    def quantized_index(self) -> QuantizedIndex:
+        return self._index
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        ids = self._inner.add(nodes, **add_kwargs)
+        self._index.add([node.node_id for node in nodes], [node.get_embedding() for node in nodes])
+        return ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        filters = MetadataFilters(filters=[MetadataFilter(key="ref_doc_id", value=ref_doc_id, operator=FilterOperator.EQ)])
+        self._index.remove(node.node_id for node in self._inner.get_nodes(filters=filters))
+        self._inner.delete(ref_doc_id, **delete_kwargs)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None, **delete_kwargs: Any) -> None:
+        if filters is not None:
+            node_ids = [node.node_id for node in self._inner.get_nodes(node_ids=node_ids, filters=filters)]
+        self._inner.delete_nodes(node_ids=node_ids, **delete_kwargs)
+        self._index.remove(node_ids or [])
+
+    def get_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None) -> List[BaseNode]:
+        return self._inner.get_nodes(node_ids=node_ids, filters=filters)
+
+    def clear(self) -> None:
+        self._inner.clear()
+        self._index.clear()
+
+    def compact(self) -> int:
+        return self._index.compact()
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if (
+            query.query_embedding is None
+            or query.filters is not None
+            or query.node_ids
+            or query.doc_ids
+            or query.mode != VectorStoreQueryMode.DEFAULT
+        ):
+            return self._inner.query(query, **kwargs)
+
+        hits = self._index.search(query.query_embedding, top_k=query.similarity_top_k)
+        if not hits:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        nodes = {node.node_id: node for node in self._inner.get_nodes(node_ids=[node_id for node_id, _ in hits])}
+        missing = [node_id for node_id, _ in hits if node_id not in nodes]
+        if missing:
+            # Deleted from the inner store behind the index's back; don't serve them again
+            logs.log.warning("Dropping %d quantized vectors without a stored node", len(missing))
+            self._index.remove(missing)
+        hits = [(node_id, score) for node_id, score in hits if node_id in nodes]
+        return VectorStoreQueryResult(
+            nodes=[nodes[node_id] for node_id, _ in hits],
+            similarities=[score for _, score in hits],
+            ids=[node_id for node_id, _ in hits],
+        )
+
+
+###################################
+#
+# NumPy Vector Store
+#
+###################################
+
+
+_MISSING = object()
+
+
+def _compile_filter(metadata_filter: MetadataFilter) -> Callable[[Dict], bool]:
+    key, operator, expected = metadata_filter.key, metadata_filter.operator, metadata_filter.value
+    if operator == FilterOperator.IS_EMPTY:
+        return lambda metadata: metadata.get(key) in (None, "", [])
+    if operator == FilterOperator.EQ:
+        return lambda metadata: metadata.get(key, _MISSING) == expected
+    if operator == FilterOperator.NE:
+        return lambda metadata: metadata.get(key, _MISSING) != expected
+    if operator in (FilterOperator.IN, FilterOperator.NIN):
+        try:
+            allowed = set(expected)
+        except TypeError:  # Unhashable values
+            allowed = list(expected)
+        if operator == FilterOperator.IN:
+            return lambda metadata: _safe(lambda: metadata.get(key, _MISSING) in allowed)
+        return lambda metadata: _safe(lambda: metadata.get(key, _MISSING) not in allowed, default=True)
+    if operator in _COMPARISONS:
+        compare = _COMPARISONS[operator]
+        return lambda metadata: key in metadata and _safe(lambda: compare(metadata[key], expected))
+    if operator == FilterOperator.CONTAINS:
+        return lambda metadata: isinstance(metadata.get(key), list) and expected in metadata[key]
+    if operator == FilterOperator.ANY:
+        return lambda metadata: isinstance(metadata.get(key), list) and any(item in metadata[key] for item in expected)
+    if operator == FilterOperator.ALL:
+        return lambda metadata: isinstance(metadata.get(key), list) and all(item in metadata[key] for item in expected)
+    if operator == FilterOperator.TEXT_MATCH:
+        return lambda metadata: key in metadata and str(expected) in str(metadata[key])
+    if operator == FilterOperator.TEXT_MATCH_INSENSITIVE:
+        lowered = str(expected).lower()
+        return lambda metadata: key in metadata and lowered in str(metadata[key]).lower()
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+_COMPARISONS = {
+    FilterOperator.GT: lambda value, expected: value > expected,
+    FilterOperator.GTE: lambda value, expected: value >= expected,
+    FilterOperator.LT: lambda value, expected: value < expected,
+    FilterOperator.LTE: lambda value, expected: value <= expected,
+}
+
+
+def _safe(check: Callable[[], bool], default: bool = False) -> bool:
+    try:
+        return check()
+    except TypeError:  # e.g. a string compared with a number
+        return default
+
+
+def compile_filters(filters: MetadataFilters) -> Callable[[Dict], bool]:
+    """
+    Turns (possibly nested) LlamaIndex metadata filters into a predicate over a node's metadata.
+
+    Compiled once per query, so evaluating it over every stored node doesn't
+    re-inspect the filter objects each time.
+    """
+    checks = [
+        compile_filters(item) if isinstance(item, MetadataFilters) else _compile_filter(item) for item in filters.filters
+    ]
+    if filters.condition == FilterCondition.OR:
+        return lambda metadata: any(check(metadata) for check in checks)
+    if filters.condition == FilterCondition.NOT:
+        return lambda metadata: not any(check(metadata) for check in checks)
+    if len(checks) == 1:
+        return checks[0]
+    return lambda metadata: all(check(metadata) for check in checks)
+
+
+def filtered_node_ids(vector_store: BasePydanticVectorStore, filters: MetadataFilters) -> List[str]:
+    """
+    Ids of the nodes in ``vector_store`` matching ``filters``, without loading the nodes.
+
+    Used to apply a query's metadata filters to the BM25 index, which only
+    knows node ids.
+    """
+    store = vector_store.inner if isinstance(vector_store, QuantizedVectorStore) else vector_store
+    if isinstance(store, NumpyVectorStore):
+        return store.filter_ids(filters)
+    from llama_index.vector_stores.chroma.base import _to_chroma_filter
+
+    return store.client.get(where=_to_chroma_filter(filters), include=[])["ids"]
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Single-node vector store on plain files, without a database.
+
+    Embeddings live in an append-only, memory-mapped float32 matrix (a
+    ``QuantizedIndex``, optionally with a compressed copy for search), and the
+    nodes in a sidecar ``nodes.jsonl``: one line per node, holding its
+    filterable metadata followed by the serialized node. Only the metadata and
+    each node's offset in the sidecar are held in memory; node text is read
+    from the file for the nodes a query returns.
+
+    Search is one matrix-vector product over the stored vectors followed by a
+    partial sort. Metadata filters are evaluated first, and only the matching
+    vectors are scored.
+
+    Deleted nodes are tombstoned; ``compact()`` rewrites both files without them.
+
+    Args:
+        path (str): Directory holding the store.
+        compression (str): Compression of the search copy, see ``utils.quantized_index``.
+        rescore_factor (int): Candidates re-scored at full precision per result.
+    """
+
+    stores_text: bool = True
+    is_embedding_query: bool = True
+
+    _path: str = PrivateAttr()
+    _index: QuantizedIndex = PrivateAttr()
+    _metadata: Dict[str, Dict] = PrivateAttr()
+    _offsets: Dict[str, int] = PrivateAttr()
+    _lock: Any = PrivateAttr()
+
+    def __init__(self, path: str, compression: str = "none", rescore_factor: int = 4, **kwargs: Any):
+        super().__init__(**kwargs)
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._lock = threading.RLock()
+        self._index = QuantizedIndex(os.path.join(path, "vectors"), compression=compression, rescore_factor=rescore_factor)
+        self._metadata, self._offsets = {}, {}
+        self._load_sidecar()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> "NumpyVectorStore":
+        return self
+
+    @property
+    def quantized_index(self) -> QuantizedIndex:
+        return self._index
+
+    @property
+    def _sidecar_path(self) -> str:
+        return os.path.join(self._path, "nodes.jsonl")
+
+    def _load_sidecar(self) -> None:
+        """Indexes the sidecar; the last line for an id wins, and ids without a vector are ignored."""
+        if not os.path.exists(self._sidecar_path):
+            return
+        # Locals: attribute access on a pydantic model is slow in a loop over every node
+        index, all_metadata, offsets = self._index, {}, {}
+        with open(self._sidecar_path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.endswith(b"\n"):
+                    # Only the leading metadata object is decoded, not the serialized node after it
+                    metadata, _ = _decoder.raw_decode(line.decode("utf-8"))
+                    node_id = metadata.pop("id")
+                    if node_id in index:
+                        all_metadata[node_id] = metadata
+                        offsets[node_id] = offset
+                offset += len(line)
+        self._metadata, self._offsets = all_metadata, offsets
+        logs.log.info("NumPy vector store loaded with %d nodes from %s", len(self._metadata), self._path)
+
+    def _read_entries(self, node_ids: List[str]) -> Dict[str, Dict]:
+        entries = {}
+        with open(self._sidecar_path, "rb") as f:
+            for node_id in sorted(node_ids, key=self._offsets.get):
+                f.seek(self._offsets[node_id])
+                line = f.readline().decode("utf-8")
+                metadata, end = _decoder.raw_decode(line)
+                entries[node_id] = {**metadata, **_decoder.raw_decode(line, end + 1)[0]}
+        return entries
+
+    def count(self) -> int:
+        return len(self._metadata)
+
+    def iter_stored(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        """Yields the stored ids and node texts in batches, e.g. to rebuild the BM25 index."""
+        node_ids = list(self._offsets)
+        for start in range(0, len(node_ids), batch_size):
+            batch = node_ids[start : start + batch_size]
+            entries = self._read_entries(batch)
+            yield batch, [metadata_dict_to_node(entries[node_id]).get_content() for node_id in batch]
+
+    ###################################
+    # Writes
+    ###################################
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        # One line per node: the filterable metadata, then the serialized node
+        lines, metadata = [], []
+        for node in nodes:
+            entry = node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+            serialized = {key: entry.pop(key) for key in _NODE_KEYS}
+            metadata.append(entry)
+            lines.append(f"{json.dumps({'id': node.node_id, **entry})} {json.dumps(serialized)}\n".encode("utf-8"))
+        with self._lock:
+            # Nodes are written before their vectors, so a vector never points at a missing node
+            with open(self._sidecar_path, "ab") as f:
+                offset = f.tell()
+                f.write(b"".join(lines))
+            self._index.add([node.node_id for node in nodes], [node.get_embedding() for node in nodes])
+            for node, line, entry in zip(nodes, lines, metadata):
+                self._metadata[node.node_id] = entry
+                self._offsets[node.node_id] = offset
+                offset += len(line)
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            node_ids = [node_id for node_id, metadata in self._metadata.items() if metadata.get("ref_doc_id") == ref_doc_id]
+            self._remove(node_ids)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None, **delete_kwargs: Any) -> None:
+        with self._lock:
+            self._remove(self._select(node_ids, filters))
+
+    def _remove(self, node_ids: List[str]) -> None:
+        self._index.remove(node_ids)
+        for node_id in node_ids:
+            self._metadata.pop(node_id, None)
+            self._offsets.pop(node_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._index.clear()
+            if os.path.exists(self._sidecar_path):
+                os.remove(self._sidecar_path)
+            self._metadata, self._offsets = {}, {}
+
+    def compact(self) -> int:
+        """Rewrites the vectors and the sidecar without deleted nodes. Returns the number of vectors dropped."""
+        with self._lock:
+            dropped = self._index.compact()
+            if not os.path.exists(self._sidecar_path):
+                return dropped
+            tmp_path = self._sidecar_path + ".tmp"
+            old_offsets, offsets = self._offsets, {}
+            with open(self._sidecar_path, "rb") as source, open(tmp_path, "wb") as target:
+                for node_id in self._index.ids():
+                    source.seek(old_offsets[node_id])
+                    offsets[node_id] = target.tell()
+                    target.write(source.readline())
+            os.replace(tmp_path, self._sidecar_path)
+            self._offsets = offsets
+            return dropped
+
+    ###################################
+    # Reads
+    ###################################
+
+    def _select(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None) -> List[str]:
+        metadata = self._metadata
+        candidates = metadata if node_ids is None else [node_id for node_id in node_ids if node_id in metadata]
+        if filters is None:
+            return list(candidates)
+        matches = compile_filters(filters)
+        return [node_id for node_id in candidates if matches(metadata[node_id])]
+
+    def filter_ids(self, filters: MetadataFilters) -> List[str]:
+        """Ids of the stored nodes matching ``filters``, from the in-memory metadata."""
+        with self._lock:
+            return self._select(None, filters)
+
+    def get_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None) -> List[BaseNode]:
+        with self._lock:
+            selected = self._select(node_ids, filters)
+            entries = self._read_entries(selected)
+        return [metadata_dict_to_node(entries[node_id]) for node_id in selected]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"NumpyVectorStore only supports dense queries, not '{query.mode}'")
+        if query.query_embedding is None:
+            raise ValueError("NumpyVectorStore needs a query embedding")
+
+        only_ids = None
+        if query.filters is not None or query.node_ids or query.doc_ids:
+            with self._lock:
+                only_ids = self._select(query.node_ids or None, query.filters)
+            if query.doc_ids:
+                doc_ids = set(query.doc_ids)
+                metadata = self._metadata
+                only_ids = [node_id for node_id in only_ids if metadata[node_id].get("ref_doc_id") in doc_ids]
+        hits = self._index.search(query.query_embedding, top_k=query.similarity_top_k, only_ids=only_ids)
+
+        with self._lock:
+            # A node deleted during the search is dropped from the results
+            hits = [(node_id, score) for node_id, score in hits if node_id in self._offsets]
+            entries = self._read_entries([node_id for node_id, _ in hits])
+        return VectorStoreQueryResult(
+            nodes=[metadata_dict_to_node(entries[node_id]) for node_id, _ in hits],
+            similarities=[score for _, score in hits],
+            ids=[node_id for node_id, _ in hits],
+        )
@@ -0,0 +1,336 @@
+import functools
+import inspect
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import utils.hnsw as hnsw
+import utils.logs as logs
+
+# The default workspace keeps the single-tenant layout (./chroma_db and ./data), so an
+# existing install needs no migration; named workspaces live under WORKSPACES_DIR/<name>/
+DEFAULT_WORKSPACE = "default"
+WORKSPACES_DIR = "./workspaces"
+WORKSPACE_NAME_PATTERN = re.compile(r"[a-z0-9][a-z0-9_-]{0,47}")
+
+# Attached workspaces are detached, least recently used first, once their estimated memory
+# exceeds LOCAL_RAG_WORKSPACE_MEMORY_MB; 0 never detaches any
+MEMORY_BUDGET_MB = int(os.environ.get("LOCAL_RAG_WORKSPACE_MEMORY_MB", 2048))
+
+# Files a workspace doesn't hold in memory: Chroma's SQLite database is read on demand
+_ON_DISK_ONLY = re.compile(r"chroma\.sqlite3(-wal|-shm|-journal)?$|\.tmp$")
+
+# Memory of an open vector store beyond its index files (Chroma's collection and segment
+# objects, vectors not yet in the HNSW graph), measured with benchmarks/workspaces.py
+OPEN_STORE_BYTES = 9 * 2**20
+
+###################################
+#
+# Workspace Names and Paths
+#
+###################################
+
+
+def validate_workspace(name: str) -> str:
+    """Returns the workspace name if it is valid: lower-case letters, digits, ``-`` and ``_``."""
+    if not isinstance(name, str) or not WORKSPACE_NAME_PATTERN.fullmatch(name):
+        raise ValueError(
+            f"Invalid workspace name '{name}': use up to 48 lower-case letters, digits, '-' or '_', "
+            "starting with a letter or digit"
+        )
+    return name
+
+
+def workspace_dir(name: str, *parts: str) -> str:
+    """A path inside the workspace's directory; the default workspace's is the working directory."""
+    root = "." if name == DEFAULT_WORKSPACE else os.path.join(WORKSPACES_DIR, name)
+    return os.path.join(root, *parts)
+
+
+def data_dir(name: str, kind: str) -> str:
+    """Absolute path of a workspace's ``data/<kind>`` directory, e.g. its ``uploads``."""
+    return os.path.abspath(workspace_dir(name, "data", kind))
+
+
+def list_workspaces() -> List[str]:
+    """The default workspace and every named one, by name."""
+    names = []
+    if os.path.isdir(WORKSPACES_DIR):
+        names = [
+            name for name in os.listdir(WORKSPACES_DIR)
+            if WORKSPACE_NAME_PATTERN.fullmatch(name) and os.path.isdir(os.path.join(WORKSPACES_DIR, name))
+        ]
+    return [DEFAULT_WORKSPACE] + sorted(set(names) - {DEFAULT_WORKSPACE})
+
+
+def workspace_exists(name: str) -> bool:
+    return name == DEFAULT_WORKSPACE or os.path.isdir(workspace_dir(name))
+
+
+def create_workspace(name: str) -> str:
+    """Creates a named workspace's directory; its collection and registry are created on first use."""
+    validate_workspace(name)
+    if not workspace_exists(name):
+        os.makedirs(workspace_dir(name), exist_ok=True)
+        logs.log.info("Created workspace %s", name)
+    return name
+
+
+def current_workspace() -> str:
+    """The workspace this browser session works in; threads without a session use the default one."""
+    return st.session_state.get("workspace") or DEFAULT_WORKSPACE
+
+
+###################################
+#
+# Attached Workspaces
+#
+###################################
+
+
+class Workspace:
+    """
+    Everything a process holds in memory for one workspace: its vector stores,
+    indexes, document registry, answer cache and query engines.
+
+    They are created on first use by the ``workspace_resource`` functions and
+    kept in ``resources``, keyed like ``st.cache_resource`` entries. Closing
+    the workspace drops them and stops its Chroma client, which frees the HNSW
+    graphs it had loaded. Nothing is lost: the next use reloads them from disk.
+
+    ``users`` counts the queries and ingestion runs in progress; a workspace in
+    use is never detached.
+
+    Args:
+        name (str): The workspace name.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.persist_dir = workspace_dir(name, "chroma_db")
+        self.resources: Dict[Tuple, Any] = {}
+        self.users = 0
+        self.attached_at = self.last_used = time.time()
+        self._lock = threading.RLock()
+        # (registry file mtime, bytes) of the last estimate, so unchanged workspaces aren't re-measured
+        self._footprint: Tuple[Optional[int], int] = (None, 0)
+
+    def resource(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+        """Returns the resource stored under ``key``, creating it with ``factory`` first if needed."""
+        with self._lock:
+            if key not in self.resources:
+                value = factory()
+                if value is None:
+                    # A failed load (e.g. a query engine that could not be built) is retried next time
+                    return None
+                self.resources[key] = value
+            return self.resources[key]
+
+    def memory_bytes(self) -> int:
+        """
+        Estimated memory held for the workspace: the size of the index files it
+        loads (HNSW graphs, BM25 index, vector matrices, registry) plus
+        ``OPEN_STORE_BYTES``, or 0 while no vector store is open (see
+        ``utils.hnsw.segment_memory_bytes`` for the HNSW graphs).
+        """
+        # Until a vector store is open (utils.llama_index.index_data), only the registry is loaded
+        if not any(key[0] == "index_data" for key in list(self.resources)):
+            return 0
+        try:
+            stamp = os.stat(os.path.join(self.persist_dir, "document_registry.json")).st_mtime_ns
+        except OSError:
+            stamp = None
+        if stamp is None or stamp != self._footprint[0]:
+            total = 0
+            for root, _, files in os.walk(self.persist_dir):
+                if "header.bin" in files:
+                    # A Chroma HNSW segment, which isn't loaded while it is empty
+                    total += hnsw.segment_memory_bytes(root)
+                    continue
+                for name in files:
+                    if not _ON_DISK_ONLY.search(name):
+                        try:
+                            total += os.path.getsize(os.path.join(root, name))
+                        except OSError:
+                            pass  # Replaced while walking, e.g. by a registry save
+            self._footprint = (stamp, OPEN_STORE_BYTES + total)
+        return self._footprint[1]
+
+    def close(self):
+        """Drops every loaded resource and stops the workspace's Chroma client."""
+        with self._lock:
+            self.resources.clear()
+            # Chroma shares one client system per persist directory; only this workspace's is stopped
+            chroma_client = sys.modules.get("chromadb.api.client")
+            if chroma_client is not None:
+                system = chroma_client.SharedSystemClient._identifier_to_system.pop(self.persist_dir, None)
+                if system is not None:
+                    system.stop()
+            self._footprint = (None, 0)
+
+
+class WorkspacePool:
+    """
+    Workspaces attached to this process, in least recently used order.
+
+    ``get`` attaches a workspace on first use, which is cheap: its stores and
+    indexes are only loaded when something needs them. Whenever one is loaded,
+    and whenever a query or ingestion run ends, the least recently used
+    workspaces are detached while the estimated memory of all of them exceeds
+    ``budget_bytes``. The workspace that grew, and workspaces in use (see
+    ``use``), are never detached.
+
+    Args:
+        budget_bytes (int): Memory budget of the attached workspaces; 0 means no limit.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.evictions = 0
+        self._attached: "OrderedDict[str, Workspace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Workspace:
+        """The attached workspace of that name, attaching it first if needed."""
+        with self._lock:
+            return self._attach(name)
+
+    def trim(self, keep: str = None):
+        """Detaches least recently used workspaces until the attached ones fit the budget."""
+        with self._lock:
+            detached = self._over_budget(keep)
+        # Closed outside the pool lock: closing waits for loads in progress, which may need the pool
+        for workspace in detached:
+            workspace.close()
+
+    @contextmanager
+    def use(self, name: str):
+        """Keeps a workspace attached while a query or ingestion run uses it."""
+        with self._lock:
+            workspace = self._attach(name)
+            workspace.users += 1
+        try:
+            yield workspace
+        finally:
+            with self._lock:
+                workspace.users -= 1
+                workspace.last_used = time.time()
+            # An ingestion run grows the workspace
+            self.trim(keep=name)
+
+    def detach(self, name: str) -> bool:
+        """Detaches a workspace now, unless it is in use. False if it wasn't attached or is busy."""
+        with self._lock:
+            workspace = self._attached.get(name)
+            if workspace is None or workspace.users:
+                return False
+            del self._attached[name]
+        workspace.close()
+        logs.log.info("Detached workspace %s", name)
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            workspaces = list(self._attached.values())
+        now = time.time()
+        return {
+            "budget_mb": round(self.budget_bytes / 2**20, 1),
+            "memory_mb": round(sum(workspace.memory_bytes() for workspace in workspaces) / 2**20, 1),
+            "evictions": self.evictions,
+            "attached": {
+                workspace.name: {
+                    "memory_mb": round(workspace.memory_bytes() / 2**20, 1),
+                    "in_use": workspace.users,
+                    "idle_seconds": round(now - workspace.last_used, 1),
+                }
+                for workspace in reversed(workspaces)
+            },
+        }
+
+    def _attach(self, name: str) -> Workspace:
+        workspace = self._attached.get(name)
+        if workspace is None:
+            workspace = self._attached[name] = Workspace(name)
+            logs.log.info("Attached workspace %s", name)
+        self._attached.move_to_end(name)
+        workspace.last_used = time.time()
+        return workspace
+
+    def _over_budget(self, keep: Optional[str]) -> List[Workspace]:
+        """Takes least recently used workspaces out of the pool until the rest fit the budget."""
+        if not self.budget_bytes:
+            return []
+        footprints = {name: workspace.memory_bytes() for name, workspace in self._attached.items()}
+        total = sum(footprints.values())
+        detached = []
+        for name, workspace in list(self._attached.items()):
+            if total <= self.budget_bytes:
+                break
+            if name == keep or workspace.users or not footprints[name]:
+                continue
+            del self._attached[name]
+            detached.append(workspace)
+            total -= footprints[name]
+            self.evictions += 1
+            logs.log.info(
+                "Detaching workspace %s (%.1f MB, idle %.0fs) to stay within %.0f MB",
+                name, footprints[name] / 2**20, time.time() - workspace.last_used, self.budget_bytes / 2**20,
+            )
+        return detached
+
+
+@st.cache_resource(show_spinner=False)
+def get_workspace_pool() -> WorkspacePool:
+    """Process-wide pool of attached workspaces, shared by every session, job and service request."""
+    return WorkspacePool(MEMORY_BUDGET_MB * 2**20)
+
+
+def workspace_resource(show_spinner=False):
+    """
+    Like ``st.cache_resource``, but cached in the attached workspace, so a
+    detached workspace's resources are freed with it.
+
+    The decorated function takes a ``workspace`` argument; ``None`` is the
+    session's workspace (``current_workspace``). The other arguments form the
+    cache key, except those starting with an underscore, as with
+    ``st.cache_resource``. Results are shared by every session of the process.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            arguments["workspace"] = arguments["workspace"] or current_workspace()
+            key = (func.__name__,) + tuple(
+                value for name, value in arguments.items() if not name.startswith("_") and name != "workspace"
+            )
+
+            def load():
+                if show_spinner and get_script_run_ctx() is not None:
+                    with st.spinner(show_spinner):
+                        return func(**arguments)
+                return func(**arguments)
+
+            pool = get_workspace_pool()
+            workspace = pool.get(arguments["workspace"])
+            if key in workspace.resources:
+                return workspace.resources[key]
+            value = workspace.resource(key, load)
+            pool.trim(keep=workspace.name)
+            return value
+
+        return wrapper
+
+    return decorator